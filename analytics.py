@@ -0,0 +1,368 @@
+"""
+Course and semester grade/attendance statistics, computed with NumPy.
+
+Per student and course, the inputs are present/absent counts (from
+enrollment_rollups, compacted attendance included) and the numeric grade
+of every category. Reading those as rows costs far more than the maths
+(sqlite3 builds a Python tuple per row), so each course's numbers are kept
+as packed arrays in course_grade_vectors: load() fetches a course's or a
+whole semester's arrays with one query and np.frombuffer()s them. Writes
+(rollups.refresh_courses) drop a course's vectors and queue a
+"grade_vectors" job; the job worker stores fresh ones (rebuild_stale).
+Until it has, load() builds a stale course's arrays in memory from one
+pivot query, so reading never writes. summarize() then derives
+everything without a Python loop per student:
+
+    weighted total   sum(weight * grade) / sum(weight) over the graded
+                     categories, so a missing category does not count as 0
+    percentile rank  of each total within the cohort
+    attendance rate  present / (present + absent), NaN without roll calls
+    at risk          attendance rate below the threshold
+
+plus percentiles, a histogram of the totals, per-category statistics and,
+for a semester, per-course averages.
+"""
+import os
+
+import numpy as np
+
+import jobs
+from db import fetch_in
+from gradebook import GRADE_CATEGORIES
+from rollups import NUMERIC_GRADE, VECTORS_JOB
+
+DEFAULT_WEIGHTS = {"Assignment": 20.0, "Quiz": 10.0, "Project": 20.0, "Midterm": 20.0,
+                   "Final": 30.0}
+AT_RISK_ATTENDANCE = float(os.getenv("AT_RISK_ATTENDANCE", "0.8"))
+AT_RISK_LIMIT = 100  # rows listed for a whole semester
+PERCENTILES = (10, 25, 50, 75, 90)
+HISTOGRAM_BINS = 10
+
+REBUILD_BATCH = 50  # courses stored per write transaction by rebuild_stale()
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS course_grade_vectors (
+        course_id INTEGER PRIMARY KEY,
+        row_count INTEGER NOT NULL,      -- enrollments when built
+        max_enrollment_id INTEGER,       -- with row_count, detects enrollment changes
+        categories TEXT NOT NULL,        -- column order of `grades`
+        enrollment_ids BLOB NOT NULL,    -- little-endian int64, one per enrollment
+        user_ids BLOB NOT NULL,
+        present BLOB NOT NULL,           -- little-endian float64, one per enrollment
+        absent BLOB NOT NULL,
+        grades BLOB NOT NULL,            -- float64 rows x categories, NaN = no numeric grade
+        FOREIGN KEY (course_id) REFERENCES courses(id)
+    )"""
+
+_CATEGORY_COLUMN = f"MAX(CASE WHEN g.category = ? AND {NUMERIC_GRADE} THEN CAST(g.grade_value AS REAL) END)"
+
+CATEGORIES_KEY = ",".join(GRADE_CATEGORIES)
+
+# One row per enrollment of the courses being rebuilt
+_PIVOT = f"""
+    SELECT e.course_id, e.id, e.user_id,
+           COALESCE(r.present_count, 0), COALESCE(r.absent_count, 0),
+           {", ".join([_CATEGORY_COLUMN] * len(GRADE_CATEGORIES))}
+      FROM enrollments e
+      LEFT JOIN enrollment_rollups r ON r.enrollment_id = e.id
+      LEFT JOIN grades g ON g.enrollment_id = e.id
+     WHERE e.course_id IN ({{marks}})
+  GROUP BY e.id
+"""
+
+# Stored vectors of every course in scope, with the enrollment count and
+# newest enrollment id they must still match to be current
+_VECTORS = """
+    SELECT c.id,
+           (SELECT COUNT(*) FROM enrollments e WHERE e.course_id = c.id),
+           (SELECT MAX(e.id) FROM enrollments e WHERE e.course_id = c.id),
+           v.row_count, v.max_enrollment_id, v.categories,
+           v.enrollment_ids, v.user_ids, v.present, v.absent, v.grades
+      FROM courses c
+      LEFT JOIN course_grade_vectors v ON v.course_id = c.id
+     WHERE {scope}
+"""
+
+# Courses whose stored vectors are missing or out of date
+_STALE = """
+    SELECT c.id
+      FROM courses c
+      LEFT JOIN course_grade_vectors v ON v.course_id = c.id
+     WHERE v.course_id IS NULL OR v.categories <> ?
+        OR v.row_count <> (SELECT COUNT(*) FROM enrollments e WHERE e.course_id = c.id)
+        OR v.max_enrollment_id IS NOT (SELECT MAX(e.id) FROM enrollments e WHERE e.course_id = c.id)
+"""
+
+_FIELDS = ("enrollment_ids", "user_ids", "present", "absent", "grades")
+_DTYPES = {"enrollment_ids": "<i8", "user_ids": "<i8", "present": "<f8", "absent": "<f8",
+           "grades": "<f8"}
+
+
+class AnalyticsError(ValueError):
+    """The requested weights or threshold cannot be used."""
+
+
+def create_table(conn):
+    conn.execute(CREATE_TABLE)
+
+
+def parse_weights(args):
+    """Category weights from "weight_<Category>" args; unspecified ones keep their default."""
+    weights = dict(DEFAULT_WEIGHTS)
+    for category in GRADE_CATEGORIES:
+        raw = args.get(f"weight_{category}", "").strip()
+        if not raw:
+            continue
+        try:
+            weights[category] = float(raw)
+        except ValueError:
+            raise AnalyticsError(f"Weight for {category} must be a number.")
+        if not 0 <= weights[category] <= 1000:
+            raise AnalyticsError(f"Weight for {category} must be between 0 and 1000.")
+    if not any(weights.values()):
+        raise AnalyticsError("At least one category needs a weight above 0.")
+    return weights
+
+
+def parse_threshold(args):
+    """At-risk attendance threshold, given as a percentage (e.g. "80")."""
+    raw = args.get("threshold", "").strip()
+    if not raw:
+        return AT_RISK_ATTENDANCE
+    try:
+        threshold = float(raw) / 100
+    except ValueError:
+        raise AnalyticsError("Attendance threshold must be a number.")
+    if not 0 <= threshold <= 1:
+        raise AnalyticsError("Attendance threshold must be between 0 and 100.")
+    return threshold
+
+
+def _build(db, course_ids):
+    """Vectors rows (course_id, row_count, max_enrollment_id, categories, *blobs) per course."""
+    rows = fetch_in(db, _PIVOT, course_ids, params=GRADE_CATEGORIES)
+    data = np.array([tuple(row) for row in rows], dtype=np.float64).reshape(
+        len(rows), 5 + len(GRADE_CATEGORIES))
+    data = data[np.lexsort((data[:, 1], data[:, 0]))]  # by course, then enrollment
+    built = []
+    for course_id in course_ids:
+        part = data[data[:, 0] == course_id]
+        ids = part[:, 1:3].astype("<i8")
+        built.append((course_id, len(part), int(ids[-1, 0]) if len(part) else None,
+                      CATEGORIES_KEY, ids[:, 0].tobytes(), ids[:, 1].tobytes(),
+                      part[:, 3].astype("<f8").tobytes(), part[:, 4].astype("<f8").tobytes(),
+                      np.ascontiguousarray(part[:, 5:], dtype="<f8").tobytes()))
+    return built
+
+
+def _store(db, course_ids):
+    # Built and stored under the write lock, so no grade or roll call can
+    # commit in between and be missing from what is stored
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        db.executemany("""
+            INSERT OR REPLACE INTO course_grade_vectors
+                (course_id, row_count, max_enrollment_id, categories,
+                 enrollment_ids, user_ids, present, absent, grades)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, _build(db, course_ids))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def rebuild_stale(db, report=None):
+    """Store fresh vectors for every course whose vectors are missing or out of date."""
+    stale = [row[0] for row in db.execute(_STALE, (CATEGORIES_KEY,))]
+    for start in range(0, len(stale), REBUILD_BATCH):
+        _store(db, stale[start:start + REBUILD_BATCH])
+        if report:
+            done = min(start + REBUILD_BATCH, len(stale))
+            report(done * 100 // len(stale), f"{done} of {len(stale)} courses")
+    return len(stale)
+
+
+@jobs.handler(VECTORS_JOB)
+def rebuild_vectors(db, payload, report):
+    return f"rebuilt vectors of {rebuild_stale(db, report)} courses"
+
+
+def load(db, course_id=None, semester=None):
+    """
+    One course's or one semester's enrollments as arrays: a dict with
+    enrollment_ids, user_ids, course_ids (int64), present, absent (float64)
+    and grades (float64, enrollments x GRADE_CATEGORIES, NaN = no grade).
+    Read-only: a course without current vectors is built in memory here
+    and stored later by the "grade_vectors" job.
+    """
+    if course_id is not None:
+        scope, params = "c.id = ?", (course_id,)
+    else:
+        scope, params = "c.semester = ?", (semester,)
+    cursor = db.cursor()
+    cursor.row_factory = None
+    current, stale = [], []
+    for row in cursor.execute(_VECTORS.format(scope=scope), params):
+        if row[1:3] == row[3:5] and row[5] == CATEGORIES_KEY:
+            current.append((row[0], row[3], *row[6:]))
+        else:
+            stale.append(row[0])
+    if stale:
+        current.extend((row[0], row[1], *row[4:]) for row in _build(db, stale))
+
+    parts = {field: [] for field in _FIELDS}
+    course_ids = []
+    for course, count, *blobs in current:
+        for field, blob in zip(_FIELDS, blobs):
+            parts[field].append(np.frombuffer(blob, dtype=_DTYPES[field]))
+        course_ids.append(np.full(count, course, dtype=np.int64))
+    cohort = {field: np.concatenate(arrays) if arrays else np.empty(0, _DTYPES[field])
+              for field, arrays in parts.items()}
+    cohort["grades"] = cohort["grades"].reshape(-1, len(GRADE_CATEGORIES))
+    cohort["course_ids"] = np.concatenate(course_ids) if course_ids else np.empty(0, np.int64)
+    return cohort
+
+
+def _stats(values):
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {"count": 0, "mean": None, "std": None, "min": None, "max": None,
+                "percentiles": {p: None for p in PERCENTILES}}
+    points = np.percentile(values, PERCENTILES)
+    return {
+        "count": int(len(values)),
+        "mean": float(values.mean()),
+        "std": float(values.std()),
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "percentiles": {p: float(v) for p, v in zip(PERCENTILES, points)},
+    }
+
+
+def weighted_totals(grades, weights):
+    """Per-row weighted average over the graded categories (NaN if none is graded)."""
+    w = np.array([weights.get(category, 0.0) for category in GRADE_CATEGORIES])
+    graded = ~np.isnan(grades)
+    weight_sum = graded @ w
+    totals = np.where(graded, grades, 0.0) @ w
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(weight_sum > 0, totals / weight_sum, np.nan)
+
+
+def percentile_ranks(values):
+    """Share of the cohort (0-100) scoring at or below each value; NaN stays NaN."""
+    valid = ~np.isnan(values)
+    ranks = np.full(values.shape, np.nan)
+    if valid.any():
+        # Totals repeat a lot, so rank the distinct values once
+        _, inverse, counts = np.unique(values[valid], return_inverse=True, return_counts=True)
+        ranks[valid] = np.cumsum(counts)[inverse] * 100.0 / valid.sum()
+    return ranks
+
+
+def summarize(cohort, weights=None, threshold=AT_RISK_ATTENDANCE):
+    """
+    Statistics of a load()ed cohort. Per-enrollment arrays (totals, ranks,
+    rates, at_risk) are returned alongside the aggregates, in the cohort's
+    row order.
+    """
+    weights = weights or DEFAULT_WEIGHTS
+    grades = cohort["grades"]
+    present, absent = cohort["present"], cohort["absent"]
+
+    totals = weighted_totals(grades, weights)
+    recorded = present + absent
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rates = np.where(recorded > 0, present / recorded, np.nan)
+    at_risk = rates < threshold  # NaN compares False: no roll calls, not at risk
+
+    scored = totals[~np.isnan(totals)]
+    counts, edges = np.histogram(scored, bins=HISTOGRAM_BINS, range=(0, 100))
+    # Totals above 100 (extra credit) go to the last bin rather than vanish
+    counts[-1] += int((scored > 100).sum())
+
+    courses = []
+    course_ids, index = np.unique(cohort["course_ids"], return_inverse=True)
+    if len(course_ids) > 1:
+        has_total = ~np.isnan(totals)
+        enrolled = np.bincount(index, minlength=len(course_ids))
+        graded = np.bincount(index, weights=has_total, minlength=len(course_ids))
+        total_sum = np.bincount(index, weights=np.where(has_total, totals, 0.0),
+                                minlength=len(course_ids))
+        risky = np.bincount(index, weights=at_risk, minlength=len(course_ids))
+        rate_sum = np.bincount(index, weights=present, minlength=len(course_ids))
+        rate_den = np.bincount(index, weights=recorded, minlength=len(course_ids))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = total_sum / graded
+            course_rates = rate_sum / rate_den
+        courses = [{
+            "course_id": int(course_ids[i]),
+            "enrolled": int(enrolled[i]),
+            "average": None if np.isnan(means[i]) else float(means[i]),
+            "attendance_rate": None if np.isnan(course_rates[i]) else float(course_rates[i]),
+            "at_risk": int(risky[i]),
+        } for i in range(len(course_ids))]
+
+    return {
+        "enrollments": len(totals),
+        "weights": dict(weights),
+        "threshold": threshold,
+        "totals": totals,
+        "ranks": percentile_ranks(totals),
+        "rates": rates,
+        "at_risk": at_risk,
+        "total_stats": _stats(totals),
+        "rate_stats": _stats(rates),
+        "at_risk_count": int(at_risk.sum()),
+        "histogram": [(float(edges[i]), float(edges[i + 1]), int(counts[i]))
+                      for i in range(len(counts))],
+        "categories": [dict(_stats(grades[:, i]), category=category)
+                       for i, category in enumerate(GRADE_CATEGORIES)],
+        "courses": courses,
+    }
+
+
+def describe_students(db, enrollment_ids):
+    """{enrollment_id: row with username, actual_name, course_name} for the rows a page shows."""
+    return {row["enrollment_id"]: row for row in fetch_in(db, """
+        SELECT e.id AS enrollment_id, u.username, u.actual_name, c.name AS course_name
+          FROM enrollments e
+          JOIN users u   ON u.id = e.user_id
+          JOIN courses c ON c.id = e.course_id
+         WHERE e.id IN ({marks})
+    """, [int(i) for i in enrollment_ids])}
+
+
+def student_rows(db, cohort, stats, only_at_risk=False, limit=None):
+    """
+    Per-student rows for a page: everyone by weighted total (highest first),
+    or only the at-risk students by attendance rate (lowest first).
+    Names are looked up for just the rows returned.
+    """
+    totals, rates = stats["totals"], stats["rates"]
+    if only_at_risk:
+        rows = np.flatnonzero(stats["at_risk"])
+        rows = rows[np.argsort(rates[rows], kind="stable")]
+    else:
+        rows = np.argsort(np.where(np.isnan(totals), np.inf, -totals), kind="stable")
+    rows = rows[:limit]
+    names = describe_students(db, cohort["enrollment_ids"][rows])
+
+    def number(value):
+        return None if np.isnan(value) else float(value)
+
+    result = []
+    for i in rows:
+        name = names[int(cohort["enrollment_ids"][i])]
+        result.append({
+            "enrollment_id": name["enrollment_id"],
+            "username": name["username"],
+            "actual_name": name["actual_name"],
+            "course_name": name["course_name"],
+            "total": number(totals[i]),
+            "rank": number(stats["ranks"][i]),
+            "attendance_rate": number(rates[i]),
+            "at_risk": bool(stats["at_risk"][i]),
+        })
+    return result
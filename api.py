@@ -0,0 +1,313 @@
+"""
+Read-only JSON API under /api/v1 for dashboards and other clients.
+
+Views are Flask async views (Flask's "async" extra, i.e. asgiref). The
+queries behind one response are independent, so fan_out() runs them at the
+same time on a small thread pool, each thread on its own connection from a
+read-only ConnectionPool: sqlite3 releases the GIL while a statement runs,
+so a page built from four queries costs about as long as its slowest one.
+/api/v1/student/overview returns everything the student dashboard, grades
+and recent attendance show in one round trip.
+
+Sessions and roles are the same as for the HTML pages; errors are JSON
+({"error": ...}) with a 4xx status.
+"""
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from heapq import merge
+from itertools import islice
+
+from flask import Blueprint, jsonify, request, session
+
+from attendance_archive import has_archive_since, iter_archived
+from auth import denied_message
+from catalog import get_courses
+from gradebook import group_grades
+from reports import (ATTENDANCE_PAGE_SIZE, MAX_PAGE_SIZE, attendance_filters, attendance_page,
+                     decode_cursor, encode_cursor)
+from roll_call import AttendanceError
+
+OVERVIEW_ATTENDANCE_LIMIT = 20
+
+bp = Blueprint("api", __name__, url_prefix="/api/v1")
+
+_read_pool = None
+_executor = None
+_executor_pid = None
+
+
+def init_app(app, read_pool):
+    """Register the API, reading through `read_pool` (a read-only ConnectionPool)."""
+    global _read_pool
+    _read_pool = read_pool
+    app.register_blueprint(bp)
+
+
+def _threads():
+    # Worker threads do not survive a fork, so each process builds its own
+    global _executor, _executor_pid
+    if _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(max_workers=_read_pool.size,
+                                       thread_name_prefix="api-read")
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def _run(query):
+    db = _read_pool.acquire()
+    try:
+        return query(db)
+    finally:
+        _read_pool.release(db)
+
+
+async def fan_out(**queries):
+    """
+    Run independent `query(db)` callables concurrently, each on its own
+    pooled read-only connection; returns {name: result}. The request's
+    context (for per-request query metrics) is copied into every thread.
+    """
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(_threads(), contextvars.copy_context().run, _run, query)
+        for query in queries.values()
+    ))
+    return dict(zip(queries, results))
+
+
+def api_role_required(*roles):
+    """Like auth.role_required, for async views and with a JSON 401/403."""
+    def decorator(view):
+        denied = denied_message(roles)
+
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            if "user_id" not in session:
+                return jsonify(error="Login required."), 401
+            if session.get("role") not in roles:
+                return jsonify(error=denied), 403
+            return await view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _page_size():
+    size = request.args.get("page_size", ATTENDANCE_PAGE_SIZE, type=int)
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+# -----------------------------
+# QUERIES (each takes its own connection)
+# -----------------------------
+def student_courses(db, user_id):
+    return [dict(row) for row in db.execute("""
+        SELECT e.id AS enrollment_id, e.course_id, c.name AS course_name, c.semester,
+               COALESCE(r.present_count, 0) AS present_count,
+               COALESCE(r.absent_count, 0) AS absent_count, r.last_seen,
+               CASE WHEN r.numeric_grade_count > 0
+                    THEN r.numeric_grade_sum / r.numeric_grade_count END AS grade_average
+          FROM enrollments e
+          JOIN courses c ON e.course_id = c.id
+          LEFT JOIN enrollment_rollups r ON r.enrollment_id = e.id
+         WHERE e.user_id = ?
+      ORDER BY c.name
+    """, (user_id,))]
+
+
+def student_grades(db, user_id):
+    return list(group_grades(db.execute("""
+        SELECT e.id AS enrollment_id, e.course_id, c.name AS course_name, c.semester,
+               g.category, g.grade_value
+          FROM enrollments e
+          JOIN courses c ON e.course_id = c.id
+          LEFT JOIN grades g ON g.enrollment_id = e.id
+         WHERE e.user_id = ?
+      ORDER BY e.id
+    """, (user_id,))))
+
+
+def student_attendance(db, user_id, page_size, after=None):
+    """
+    One keyset page of the student's attendance, newest first, compacted
+    semesters included: (rows, next_cursor).
+    """
+    params = [user_id]
+    keyset = ""
+    if after:
+        keyset = "AND (a.date, a.id) < (?, ?)"
+        params.extend(decode_cursor(after))
+    rows = db.execute(f"""
+        SELECT a.id AS attendance_id, a.date, a.status, e.course_id, c.name AS course_name
+          FROM enrollments e
+          JOIN attendance a ON a.enrollment_id = e.id
+          JOIN courses c    ON e.course_id = c.id
+         WHERE e.user_id = ? {keyset}
+      ORDER BY a.date DESC, a.id DESC
+         LIMIT ?
+    """, (*params, page_size + 1)).fetchall()
+    if len(rows) <= page_size or has_archive_since(db, rows[page_size]["date"]):
+        archived = iter_archived(db, ["e.user_id = ?"], [user_id],
+                                 before=decode_cursor(after) if after else None)
+        rows = list(islice(merge(rows, archived, key=lambda row: (row["date"], row["attendance_id"]),
+                                 reverse=True), page_size + 1))
+    next_cursor = encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    keys = ("attendance_id", "date", "status", "course_id", "course_name")
+    return [{key: row[key] for key in keys} for row in rows[:page_size]], next_cursor
+
+
+def user_profile(db, user_id):
+    row = db.execute("SELECT id, username, actual_name, role FROM users WHERE id = ?",
+                     (user_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def course_info(db, course_id):
+    row = db.execute("""
+        SELECT c.id, c.name, c.semester, c.teacher_id, u.actual_name AS teacher_name
+          FROM courses c
+          LEFT JOIN users u ON u.id = c.teacher_id
+         WHERE c.id = ?
+    """, (course_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def course_roster(db, course_id):
+    return [dict(row) for row in db.execute("""
+        SELECT e.id AS enrollment_id, u.id AS user_id, u.username, u.actual_name,
+               COALESCE(r.present_count, 0) AS present_count,
+               COALESCE(r.absent_count, 0) AS absent_count, r.last_seen,
+               CASE WHEN r.numeric_grade_count > 0
+                    THEN r.numeric_grade_sum / r.numeric_grade_count END AS grade_average
+          FROM enrollments e
+          JOIN users u ON u.id = e.user_id
+          LEFT JOIN enrollment_rollups r ON r.enrollment_id = e.id
+         WHERE e.course_id = ?
+      ORDER BY u.username
+    """, (course_id,))]
+
+
+def course_category_stats(db, course_id):
+    return [dict(row) for row in db.execute("""
+        SELECT category, grade_count, grade_sum / grade_count AS average, grade_min, grade_max
+          FROM course_category_rollups
+         WHERE course_id = ?
+      ORDER BY category
+    """, (course_id,))]
+
+
+def course_recent_days(db, course_id, days=10):
+    """Present/absent totals for the course's latest `days` roll-call dates."""
+    return [dict(row) for row in db.execute("""
+        SELECT a.date,
+               SUM(a.status = 'present') AS present,
+               SUM(a.status = 'absent') AS absent
+          FROM enrollments e
+          JOIN attendance a ON a.enrollment_id = e.id
+         WHERE e.course_id = ?
+           AND a.date IN (SELECT DISTINCT a2.date
+                            FROM enrollments e2
+                            JOIN attendance a2 ON a2.enrollment_id = e2.id
+                           WHERE e2.course_id = ?
+                        ORDER BY a2.date DESC LIMIT ?)
+      GROUP BY a.date
+      ORDER BY a.date DESC
+    """, (course_id, course_id, days))]
+
+
+def enrollment_counts(db):
+    return {row[0]: row[1] for row in
+            db.execute("SELECT course_id, COUNT(*) FROM enrollments GROUP BY course_id")}
+
+
+# -----------------------------
+# STUDENT
+# -----------------------------
+@bp.route("/student/overview")
+@api_role_required("student")
+async def student_overview():
+    """Profile, courses with attendance summary, grades and recent attendance."""
+    user_id = session["user_id"]
+    data = await fan_out(
+        profile=partial(user_profile, user_id=user_id),
+        courses=partial(student_courses, user_id=user_id),
+        grades=partial(student_grades, user_id=user_id),
+        attendance=partial(student_attendance, user_id=user_id,
+                           page_size=OVERVIEW_ATTENDANCE_LIMIT),
+    )
+    recent, next_cursor = data.pop("attendance")
+    return jsonify(**data, recent_attendance=recent, attendance_cursor=next_cursor)
+
+
+@bp.route("/student/courses")
+@api_role_required("student")
+async def student_courses_view():
+    data = await fan_out(courses=partial(student_courses, user_id=session["user_id"]))
+    return jsonify(data)
+
+
+@bp.route("/student/grades")
+@api_role_required("student")
+async def student_grades_view():
+    data = await fan_out(enrollments=partial(student_grades, user_id=session["user_id"]))
+    return jsonify(data)
+
+
+@bp.route("/student/attendance")
+@api_role_required("student")
+async def student_attendance_view():
+    """Attendance newest first; pass the returned next_cursor as ?after= for the next page."""
+    try:
+        if request.args.get("after"):
+            decode_cursor(request.args["after"])
+    except AttendanceError as e:
+        return jsonify(error=str(e)), 400
+    data = await fan_out(page=partial(student_attendance, user_id=session["user_id"],
+                                      page_size=_page_size(), after=request.args.get("after")))
+    records, next_cursor = data["page"]
+    return jsonify(records=records, next_cursor=next_cursor)
+
+
+# -----------------------------
+# TEACHER
+# -----------------------------
+@bp.route("/teacher/courses")
+@api_role_required("teacher")
+async def teacher_courses():
+    """All courses (as on the teacher dashboard) with their enrollment counts."""
+    data = await fan_out(courses=get_courses, counts=enrollment_counts)
+    return jsonify(courses=[dict(course, enrolled=data["counts"].get(course["id"], 0))
+                            for course in data["courses"]])
+
+
+@bp.route("/teacher/courses/<int:course_id>")
+@api_role_required("teacher")
+async def teacher_course(course_id):
+    """Course, roster with attendance/grade summary, category stats and recent roll calls."""
+    data = await fan_out(
+        course=partial(course_info, course_id=course_id),
+        roster=partial(course_roster, course_id=course_id),
+        category_stats=partial(course_category_stats, course_id=course_id),
+        recent_days=partial(course_recent_days, course_id=course_id),
+    )
+    if data["course"] is None:
+        return jsonify(error="Course not found."), 404
+    return jsonify(data)
+
+
+@bp.route("/teacher/attendance")
+@api_role_required("teacher")
+async def teacher_attendance():
+    """JSON version of /teacher/all_attendance (same filters and ?after= cursor)."""
+    try:
+        filters = attendance_filters(request.args)
+        if request.args.get("after"):
+            decode_cursor(request.args["after"])
+    except AttendanceError as e:
+        return jsonify(error=str(e)), 400
+    data = await fan_out(page=partial(attendance_page, filters=filters,
+                                      after=request.args.get("after"), page_size=_page_size()))
+    rows, next_cursor = data["page"]
+    return jsonify(records=[dict(row) for row in rows], next_cursor=next_cursor)
@@ -1,104 +1,217 @@
+import json
 import sqlite3
-from flask import Flask, render_template, request, redirect, url_for, session, g
+from heapq import merge
+from flask import Flask, render_template, request, redirect, url_for, session, g, jsonify, flash
+from flask import Response, get_flashed_messages, send_file, send_from_directory, stream_with_context
 import os
-from flask import send_file
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 
+from db import ConnectionPool, PoolTimeout, iter_rows
+from migrations import migrate
+from gradebook import (COURSE_GRADES_SQL, GRADE_CATEGORIES, STUDENT_GRADES_SQL, GradeFormError,
+                       apply_grades, group_grades, parse_grade_form)
+from roll_call import (ATTENDANCE_STATUSES, AttendanceError, parse_date, parse_roll_call_form,
+                       record_roll_calls)
+from catalog import catalog_cache, get_courses, get_teachers, invalidate_courses, invalidate_teachers
+from rollups import refresh_enrollments
+from passwords import HashingBusy, hash_on_pool, hash_password, verify_password
+from auth import auth_timings, authenticate, login_required, role_required, token_matches
+from reports import (ATTENDANCE_PAGE_SIZE, STUDENT_ATTENDANCE_SQL, attendance_filters, attendance_page,
+                     iter_attendance_csv)
+from roster import (DEFAULT_BATCH_SIZE, ROSTER_INLINE_ROWS, ROSTER_JOB, RosterError,
+                    enqueue_import, error_report_path, import_roster, save_roster)
+from enrollment import (ENROLLMENT_SQL, STUDENT_COURSES_SQL, EnrollmentError, bulk_enroll, enroll_student,
+                        parse_usernames)
+from file_delivery import DELIVERY_MODES, serve_file
+from resource_store import (RESOURCE_STATUS_SQL, STUDENT_RESOURCE_SQL, STUDENT_RESOURCES_SQL, ResourceRequest,
+                            release_resource, store_upload)
+from resource_processing import READY, enqueue_processing
+from search import SEARCH_PAGE_SIZE, search_course_ids, search_enrolled
+from attendance_archive import iter_archived
+from semester_archive import ArchiveError, archived_semesters, attached
+import metrics as instrumentation
+from metrics import InstrumentedConnection
+import profiler
+import api
+import analytics
+
 # Load environment variables from .env file
 load_dotenv()
 
 app = Flask(__name__)
+# Resource uploads are streamed to disk and hashed as they arrive
+app.request_class = ResourceRequest
 
 # Use environment variables for sensitive configurations
 app.secret_key = os.getenv("SECRET_KEY", "fallback_secret_key")  # Fallback in case .env is missing
 DATABASE = os.getenv("DATABASE_URL", "academy.db")
 
+# One pool per worker process; size it to the number of threads per worker.
+db_pool = ConnectionPool(
+    DATABASE,
+    size=int(os.getenv("DB_POOL_SIZE", "5")),
+    timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+    busy_timeout_ms=int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000")),
+    factory=InstrumentedConnection,  # counts and times statements per request
+)
+# Read-only connections for the /api/v1 fan-out queries (api.py)
+read_pool = ConnectionPool(
+    DATABASE,
+    size=int(os.getenv("DB_READ_POOL_SIZE", "4")),
+    timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+    busy_timeout_ms=int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000")),
+    factory=InstrumentedConnection,
+    read_only=True,
+)
+api.init_app(app, read_pool)
+# Per-endpoint latency / query-count histograms, served at /metrics
+instrumentation.init_app(app)
+# Flagged or sampled requests are profiled; see /admin/profiles
+profiler.init_app(app)
+
 # Add or update this in app.py:
 UPLOAD_FOLDER = 'uploads'  # or any directory name you prefer
 ALLOWED_EXTENSIONS = {'pdf'}  # only PDF files
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Requests above this size are rejected with 413 before the body is read
+app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024
+
+# Report pages stream their HTML in chunks instead of building it in memory
+app.config["STREAM_REPORTS"] = os.getenv("STREAM_REPORTS", "1") == "1"
+app.config["STREAM_BUFFER_SIZE"] = int(os.getenv("STREAM_BUFFER_SIZE", "64"))
+
+# How course files are delivered: "direct", "x-accel" (nginx) or "x-sendfile"
+app.config["FILE_DELIVERY"] = os.getenv("FILE_DELIVERY", "direct").lower()
+app.config["FILE_DELIVERY_PREFIX"] = os.getenv("FILE_DELIVERY_PREFIX", "/protected-uploads/")
+app.config["RESOURCE_MAX_AGE"] = int(os.getenv("RESOURCE_MAX_AGE", "300"))
+if app.config["FILE_DELIVERY"] not in DELIVERY_MODES:
+    raise RuntimeError(f"FILE_DELIVERY must be one of {', '.join(DELIVERY_MODES)}")
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 @app.route("/student/download/<int:resource_id>")
+@role_required("student")
 def download_pdf(resource_id):
-    if "user_id" not in session or session.get("role") != "student":
-        return "Access Denied. Student Only."
-
     db = get_db()
-    resource = db.execute("""
-        SELECT file_path 
-        FROM course_resources 
-        WHERE id = ?
-    """, (resource_id,)).fetchone()
+    resource = db.execute(STUDENT_RESOURCE_SQL,
+                          (session["user_id"], resource_id, READY)).fetchone()
 
     if not resource:
         return "Resource not found."
 
-    # Serve the file for download
-    return send_file(resource["file_path"], as_attachment=True)
+    # Conditional (304) and Range (206) aware; may hand off to the front proxy
+    download_name = resource["file_name"]
+    if not download_name.lower().endswith(".pdf"):
+        download_name += ".pdf"
+    return serve_file(resource["file_path"], download_name=download_name)
+
+@app.errorhandler(413)
+def upload_too_large(error):
+    limit = app.config["MAX_CONTENT_LENGTH"] // (1024 * 1024)
+    return f"Error: File too large (max {limit} MB).", 413
+
+@app.errorhandler(HashingBusy)
+def hashing_busy(error):
+    """Too many concurrent logins; ask the client to retry."""
+    return "Server busy, please try again in a moment.", 503
+
+def login_view(role):
+    """Shared login handler for the admin, teacher and student login pages."""
+    if request.method == "POST":
+        user = authenticate(get_db(), request.form["username"], request.form["password"], role)
+        if user:
+            session["user_id"] = user["id"]
+            session["role"] = user["role"]
+            return redirect(url_for(f"{role}_dashboard"))
+        return f"Invalid {role.capitalize()} Credentials."
+
+    return render_template(f"{role}_login.html")
+
+def render_report(template_name, **context):
+    """
+    Render a potentially large report page.
+
+    With STREAM_REPORTS on, the template is generated piece by piece
+    (buffered every STREAM_BUFFER_SIZE template events) while row iterables
+    in the context are consumed lazily, so neither the full result set nor
+    the full HTML string is held in memory.
+    """
+    if not app.config["STREAM_REPORTS"]:
+        return render_template(template_name, **context)
+
+    # Pop the flashes now: the session cookie is sent with the headers, before
+    # the template asks for them (later calls return this request's copy)
+    get_flashed_messages()
+    app.update_template_context(context)
+    stream = app.jinja_env.get_or_select_template(template_name).stream(context)
+    stream.enable_buffering(app.config["STREAM_BUFFER_SIZE"])
+    return stream_response(stream, mimetype="text/html")
+
+def stream_response(body, **kwargs):
+    """
+    Response whose body is generated inside the request context.
+
+    stream_with_context runs the teardown handlers both when the view
+    returns and when the body is done; g._stream_pending makes them skip
+    the first run, so the pooled connection, request metrics and profile
+    are only closed once the last chunk has been produced.
+    """
+    g._stream_pending = True
+    started = []
+
+    def generate():
+        started.append(True)
+        try:
+            yield from body
+        finally:
+            g._stream_pending = False
+
+    def release():
+        g._stream_pending = False
+        yield from ()
+
+    # stream_with_context() captures this request's contexts right away, so
+    # this runs the deferred teardowns if the body is closed unstarted
+    release_unstarted = stream_with_context(release())
+
+    def abandoned():
+        if not started:
+            for _ in release_unstarted:
+                pass
+
+    response = Response(stream_with_context(generate()), **kwargs)
+    response.call_on_close(abandoned)
+    return response
 
 def get_db():
-    """Get or create a DB connection for the current context."""
+    """Check out a pooled DB connection for the current context."""
     db = getattr(g, "_database", None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row
+        db = g._database = db_pool.acquire()
     return db
 
 @app.teardown_appcontext
 def close_connection(exception):
-    """Close the DB connection after each request."""
-    db = getattr(g, "_database", None)
+    """Return the DB connection to the pool after each request."""
+    if g.get("_stream_pending"):
+        return  # still in use by a streamed body
+    db = g.pop("_database", None)
     if db is not None:
-        db.close()
+        db_pool.release(db)
+
+@app.errorhandler(PoolTimeout)
+def pool_exhausted(error):
+    """All pooled connections are busy; ask the client to retry."""
+    return "Server busy, please try again in a moment.", 503
 
 def init_db():
-    """Create tables if not exist, and ensure at least one admin account."""
+    """Apply pending schema migrations, and ensure at least one admin account."""
     with app.app_context():
         db = get_db()
-        db.executescript("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL UNIQUE,
-            password TEXT NOT NULL,
-            role TEXT NOT NULL
-            -- possible roles: 'admin', 'teacher', 'student'
-        );
-
-        CREATE TABLE IF NOT EXISTS courses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            semester TEXT NOT NULL
-        );
-
-        CREATE TABLE IF NOT EXISTS enrollments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            course_id INTEGER NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (course_id) REFERENCES courses(id)
-        );
-
-        CREATE TABLE IF NOT EXISTS attendance (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            enrollment_id INTEGER NOT NULL,
-            date TEXT NOT NULL,
-            status TEXT NOT NULL,
-            FOREIGN KEY (enrollment_id) REFERENCES enrollments(id)
-        );
-
-        CREATE TABLE IF NOT EXISTS grades (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            enrollment_id INTEGER NOT NULL,
-            grade_value TEXT NOT NULL,
-            FOREIGN KEY (enrollment_id) REFERENCES enrollments(id)
-        );
-        """)
-        db.commit()
+        migrate(db)
 
         # Ensure at least one default admin if none exists
         cursor = db.execute("SELECT * FROM users WHERE role = 'admin'")
@@ -108,15 +221,13 @@ def init_db():
             # In production, you might want to set environment variables instead of hardcoding
             db.execute(
                 "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
-                ("admin", "admin123", "admin")
+                ("admin", hash_password("admin123"), "admin")
             )
             db.commit()
 
 @app.route("/update_profile", methods=["GET", "POST"])
+@login_required
 def update_profile():
-    if "user_id" not in session:
-        return redirect(url_for("index"))
-
     user_id = session["user_id"]
     db = get_db()
 
@@ -134,7 +245,7 @@ def update_profile():
         new_password = request.form["new_password"]
 
         # Verify current (old) password
-        if current_password_input != user["password"]:
+        if not verify_password(user["password"], current_password_input):
             return "Error: The current password you entered is incorrect."
 
         # If the old password matches, apply updates
@@ -144,8 +255,10 @@ def update_profile():
                    actual_name = ?,
                    password = ?
              WHERE id = ?
-        """, (new_username, new_actual_name, new_password, user_id))
+        """, (new_username, new_actual_name, hash_on_pool(new_password), user_id))
         db.commit()
+        if session.get("role") == "teacher":
+            invalidate_teachers()
 
         # (Optional) update session if username changed
         session["username"] = new_username
@@ -178,43 +291,100 @@ def logout():
 # -----------------------------
 @app.route("/login/admin", methods=["GET", "POST"])
 def admin_login():
-    if request.method == "POST":
-        username = request.form["username"]
-        password = request.form["password"]
-
-        db = get_db()
-        user = db.execute(
-            "SELECT * FROM users WHERE username = ? AND password = ? AND role = 'admin'",
-            (username, password)
-        ).fetchone()
-
-        if user:
-            session["user_id"] = user["id"]
-            session["role"] = user["role"]
-            return redirect(url_for("admin_dashboard"))
-        else:
-            return "Invalid Admin Credentials."
-
-    return render_template("admin_login.html")
+    return login_view("admin")
 
 @app.route("/admin/dashboard")
+@role_required("admin")
 def admin_dashboard():
     """
     Admin dashboard. Access: role='admin'.
     """
-    if "user_id" not in session or session.get("role") != "admin":
-        return "Access Denied. Admin Only."
     return render_template("admin_dashboard.html")
 
+@app.route("/admin/pool_stats")
+@role_required("admin")
+def pool_stats():
+    """
+    Connection pool counters for this worker process (JSON).
+    """
+    return jsonify(db_pool.stats())
+
+@app.route("/admin/cache_stats")
+@role_required("admin")
+def cache_stats():
+    """
+    Catalog cache hit/miss counters for this worker process (JSON).
+    """
+    return jsonify(catalog_cache.stats())
+
+@app.route("/admin/auth_stats")
+@role_required("admin")
+def auth_stats():
+    """
+    Per-route access-check counts and timings for this worker process (JSON).
+    """
+    return jsonify(auth_timings.stats())
+
+@app.route("/metrics")
+def metrics():
+    """
+    Prometheus text-format metrics for this worker process. Open to admins,
+    or to scrapers sending "Authorization: Bearer <METRICS_TOKEN>".
+    """
+    token = os.getenv("METRICS_TOKEN")
+    token_ok = token_matches(request.headers.get("Authorization"), f"Bearer {token}" if token else None)
+    if not token_ok and session.get("role") != "admin":
+        return "Access Denied. Admin Only.", 403
+    return Response(instrumentation.metrics.render(),
+                    mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route("/admin/slow_queries")
+@role_required("admin")
+def slow_queries():
+    """
+    Most recent statements slower than SLOW_QUERY_MS in this worker process (JSON).
+    """
+    return jsonify(list(instrumentation.metrics.slow_queries)[::-1])
+
+@app.route("/admin/profiles", methods=["GET", "POST"])
+@role_required("admin")
+def profiles():
+    """
+    Lists captured request profiles and sets this worker's sampling rate.
+    """
+    if request.method == "POST":
+        try:
+            rate = float(request.form.get("rate") or 0)
+        except ValueError:
+            return "Error: Sample rate must be a number."
+        if not 0 <= rate <= 1:
+            return "Error: Sample rate must be between 0 and 1."
+        profiler.sampling.rate = rate
+        profiler.sampling.endpoint = request.form.get("endpoint", "").strip() or None
+        return redirect(url_for("profiles"))
+
+    endpoints = sorted(rule.endpoint for rule in app.url_map.iter_rules()
+                       if rule.endpoint != "static")
+    return render_template("admin_profiles.html", profiles=profiler.list_profiles(),
+                           sampling=profiler.sampling, endpoints=endpoints,
+                           mode=profiler.PROFILE_MODE)
+
+@app.route("/admin/profiles/<name>")
+@role_required("admin")
+def download_profile(name):
+    if not profiler.is_profile_file(name):
+        return "Profile not found.", 404
+    return send_from_directory(os.path.abspath(profiler.PROFILE_DIR), name, as_attachment=True,
+                               mimetype="text/plain" if name.endswith(".collapsed")
+                               else "application/octet-stream")
+
 # CREATE TEACHER / STUDENT BY ADMIN
 @app.route("/admin/create_user", methods=["GET", "POST"])
+@role_required("admin")
 def create_user():
     """
     Admin can create new teacher or student accounts.
     """
-    if "user_id" not in session or session.get("role") != "admin":
-        return "Access Denied. Admin Only."
-
     if request.method == "POST":
         username = request.form["username"]
         password = request.form["password"]
@@ -224,21 +394,94 @@ def create_user():
         try:
             db.execute(
                 "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
-                (username, password, role)
+                (username, hash_on_pool(password), role)
             )
             db.commit()
         except sqlite3.IntegrityError:
             return "Error: Username already exists."
+        invalidate_teachers()
 
         return redirect(url_for("admin_dashboard"))
 
     return render_template("create_user.html")
 
+# BULK IMPORT TEACHERS / STUDENTS FROM A CSV ROSTER
+@app.route("/admin/import_users", methods=["GET", "POST"])
+@role_required("admin")
+def import_users():
+    """
+    Admin uploads a CSV roster (username, password, role, actual_name).
+    Valid rows are inserted in batches; invalid or duplicate rows are listed.
+    """
+    if request.method == "POST":
+        roster = request.files.get("roster")
+        if not roster or not roster.filename:
+            return "Error: No roster file uploaded."
+        try:
+            batch_size = int(request.form.get("batch_size") or DEFAULT_BATCH_SIZE)
+            start_row = int(request.form.get("start_row") or 1)
+        except ValueError:
+            return "Error: Batch size and start row must be numbers."
+        if batch_size < 1 or start_row < 1:
+            return "Error: Batch size and start row must be positive."
+
+        try:
+            path, rows = save_roster(roster.stream)
+        except UnicodeDecodeError as e:
+            return f"Error: Could not read roster: {e}"
+        # Hashing thousands of passwords outlasts a request: hand big files to the worker
+        if rows - start_row + 1 > ROSTER_INLINE_ROWS:
+            job_id = enqueue_import(get_db(), path, rows, batch_size, start_row)
+            return redirect(url_for("import_users_job", job_id=job_id))
+
+        result = {}
+        try:
+            with open(path, newline="", encoding="utf-8-sig") as stream:
+                import_roster(get_db(), stream, batch_size=batch_size, start_row=start_row,
+                              result=result)
+        except RosterError as e:
+            return f"Error: {e}"
+        except sqlite3.Error as e:
+            flash(f"Import stopped: {e}")
+            result["stopped"] = True
+        finally:
+            os.remove(path)
+            if "teacher" in result.get("roles", ()):
+                invalidate_teachers()
+        return render_template("import_users.html", result=result, batch_size=batch_size)
+
+    return render_template("import_users.html", result=None, batch_size=DEFAULT_BATCH_SIZE)
+
+@app.route("/admin/import_users/jobs/<int:job_id>")
+@role_required("admin")
+def import_users_job(job_id):
+    """Progress of a roster import running in the job worker."""
+    job = get_db().execute(
+        "SELECT id, status, progress, message, payload FROM jobs WHERE id = ? AND kind = ?",
+        (job_id, ROSTER_JOB)).fetchone()
+    if not job:
+        return "Import not found."
+    has_report = os.path.exists(error_report_path(json.loads(job["payload"])["path"]))
+    return render_template("import_users.html", result=None, job=job, has_report=has_report,
+                           batch_size=DEFAULT_BATCH_SIZE)
+
+@app.route("/admin/import_users/jobs/<int:job_id>/errors.csv")
+@role_required("admin")
+def import_users_errors(job_id):
+    """The skipped rows of a background roster import."""
+    job = get_db().execute("SELECT payload FROM jobs WHERE id = ? AND kind = ?",
+                           (job_id, ROSTER_JOB)).fetchone()
+    if not job:
+        return "Import not found."
+    report = error_report_path(json.loads(job["payload"])["path"])
+    if not os.path.exists(report):
+        return "Error report not available yet."
+    return send_file(report, mimetype="text/csv", as_attachment=True,
+                     download_name=f"roster-import-{job_id}-errors.csv")
+
 @app.route("/admin/assign_course", methods=["GET", "POST"])
+@role_required("admin")
 def assign_course():
-    if "user_id" not in session or session.get("role") != "admin":
-        return "Access Denied. Admin Only."
-
     db = get_db()
     if request.method == "POST":
         course_id = request.form["course_id"]
@@ -246,20 +489,47 @@ def assign_course():
         # Update the teacher assignment for the course
         db.execute("UPDATE courses SET teacher_id = ? WHERE id = ?", (teacher_id, course_id))
         db.commit()
+        invalidate_courses()
         return redirect(url_for("assign_course"))
 
     # GET request: show form to assign courses
-    courses = db.execute("SELECT * FROM courses").fetchall()
-    teachers = db.execute("SELECT * FROM users WHERE role = 'teacher'").fetchall()
+    courses = get_courses(db)
+    teachers = get_teachers(db)
     return render_template("assign_course.html", courses=courses, teachers=teachers)
 
 
+# BULK ENROLL A COHORT INTO COURSES
+@app.route("/admin/bulk_enroll", methods=["GET", "POST"])
+@role_required("admin")
+def bulk_enroll_students():
+    """
+    Admin enrolls a list of students, or every student matching a filter,
+    into one or more courses at once.
+    """
+    db = get_db()
+    result = None
+    if request.method == "POST":
+        course_ids = request.form.getlist("course_ids")
+        usernames = parse_usernames(request.form.get("usernames", ""))
+        from_course_id = request.form.get("from_course_id") or None
+        try:
+            result = bulk_enroll(
+                db, course_ids,
+                usernames=usernames or None,
+                username_prefix=request.form.get("username_prefix", "").strip() or None,
+                from_course_id=int(from_course_id) if from_course_id else None,
+            )
+        except (EnrollmentError, ValueError) as e:
+            return f"Error: {e}"
+
+    courses = get_courses(db)
+    return render_template("bulk_enroll.html", courses=courses, result=result)
+
+
 # MANAGE COURSES
 @app.route("/admin/manage_courses", methods=["GET", "POST"])
+@role_required("admin")
 def manage_courses():
-    if "user_id" not in session or session.get("role") != "admin":
-        return "Access Denied. Admin Only."
-
     db = get_db()
 
     if request.method == "POST":
@@ -270,26 +540,24 @@ def manage_courses():
             (name, semester)
         )
         db.commit()
+        invalidate_courses()
         return redirect(url_for("manage_courses"))
 
-    courses = db.execute("SELECT * FROM courses").fetchall()
+    courses = get_courses(db)
     return render_template("manage_courses.html", courses=courses)
 
 @app.route("/admin/delete_course/<int:course_id>", methods=["POST"])
+@role_required("admin")
 def delete_course(course_id):
-    if "user_id" not in session or session.get("role") != "admin":
-        return "Access Denied. Admin Only."
-
     db = get_db()
     db.execute("DELETE FROM courses WHERE id = ?", (course_id,))
     db.commit()
+    invalidate_courses()
     return redirect(url_for("manage_courses"))
 
 @app.route("/admin/edit_course/<int:course_id>", methods=["GET", "POST"])
+@role_required("admin")
 def edit_course(course_id):
-    if "user_id" not in session or session.get("role") != "admin":
-        return "Access Denied. Admin Only."
-
     db = get_db()
     if request.method == "POST":
         course_name = request.form["course_name"]
@@ -299,6 +567,7 @@ def edit_course(course_id):
             (course_name, semester, course_id)
         )
         db.commit()
+        invalidate_courses()
         return redirect(url_for("manage_courses"))
     else:
         course = db.execute("SELECT * FROM courses WHERE id = ?", (course_id,)).fetchone()
@@ -310,45 +579,24 @@ def edit_course(course_id):
 # -----------------------------
 @app.route("/login/teacher", methods=["GET", "POST"])
 def teacher_login():
-    if request.method == "POST":
-        username = request.form["username"]
-        password = request.form["password"]
-
-        db = get_db()
-        user = db.execute(
-            "SELECT * FROM users WHERE username = ? AND password = ? AND role = 'teacher'",
-            (username, password)
-        ).fetchone()
-
-        if user:
-            session["user_id"] = user["id"]
-            session["role"] = user["role"]
-            return redirect(url_for("teacher_dashboard"))
-        else:
-            return "Invalid Teacher Credentials."
-
-    return render_template("teacher_login.html")
+    return login_view("teacher")
 
 @app.route("/teacher/dashboard")
+@role_required("teacher")
 def teacher_dashboard():
-    if "user_id" not in session or session.get("role") != "teacher":
-        return "Access Denied. Teacher Only."
-
     db = get_db()
     # Fetch courses the teacher is associated with; for now, all courses
-    your_courses = db.execute("SELECT * FROM courses").fetchall()
+    your_courses = get_courses(db)
 
     return render_template("teacher_dashboard.html", your_courses=your_courses)
 
 @app.route("/teacher/course_grades/<int:course_id>", methods=["GET"])
+@role_required("teacher")
 def course_grades(course_id):
     """
     Displays all enrolled students in a course and their grades.
     Teacher can add or update a grade for each category.
     """
-    if "user_id" not in session or session.get("role") != "teacher":
-        return "Access Denied. Teacher Only."
-
     db = get_db()
     # Check if the teacher is assigned to this course (optional if you track teacher_id)
     # For now, skip or do a check if courses.teacher_id == session["user_id"]
@@ -358,103 +606,93 @@ def course_grades(course_id):
     if not course:
         return "Course not found."
 
-    # Get all enrollments for this course with student user info
-    enrollments = db.execute("""
-        SELECT e.id AS enrollment_id, u.username, u.actual_name
-          FROM enrollments e
-          JOIN users u ON e.user_id = u.id
-         WHERE e.course_id = ?
-    """, (course_id,)).fetchall()
-
-    # We'll also want to fetch existing grades for each enrollment
-    # so teacher can see or update them
-    # Instead of a complicated join, you can fetch them inside the template or do a dictionary approach
-    grades = db.execute("""
-        SELECT g.id, g.enrollment_id, g.grade_value, g.category
-          FROM grades g
-          JOIN enrollments e ON g.enrollment_id = e.id
-         WHERE e.course_id = ?
-    """, (course_id,)).fetchall()
-
-    # For convenience, convert grades into a dict keyed by (enrollment_id, category)
-    grade_dict = {}
-    for g in grades:
-        grade_dict[(g["enrollment_id"], g["category"])] = g["grade_value"]
-
-    return render_template("teacher_course_grades.html",
+    # All enrollments with student info and their grades in one statement,
+    # grouped into one entry per enrollment as the page streams
+    rows = iter_rows(db.execute(COURSE_GRADES_SQL, (course_id,)))
+    enrollments = group_grades(rows)
+
+    category_stats = {
+        row["category"]: row for row in db.execute("""
+            SELECT category, grade_count, grade_sum / grade_count AS average, grade_min, grade_max
+              FROM course_category_rollups
+             WHERE course_id = ?
+        """, (course_id,))
+    }
+
+    return render_report("teacher_course_grades.html",
+                           category_stats=category_stats,
                            course=course,
-                           enrollments=enrollments,
-                           grade_dict=grade_dict)
+                           enrollments=enrollments)
 
 @app.route("/teacher/submit_grades/<int:course_id>", methods=["POST"])
+@role_required("teacher")
 def submit_grades(course_id):
     """
     Processes the teacher's submission for multiple (enrollment_id, category, grade) entries.
     """
-    if "user_id" not in session or session.get("role") != "teacher":
-        return "Access Denied. Teacher Only."
-
+    # Fields look like "grade_{enrollment_id}_{category}", e.g. "grade_5_Assignment" => "85"
     db = get_db()
-    # Suppose we get multiple fields in the form: "grade_{enrollment_id}_{category}"
-    # Example key: "grade_5_Assignment" => value "85"
-    for key, value in request.form.items():
-        if key.startswith("grade_"):
-            # parse out enrollment_id and category
-            # e.g. key: "grade_5_Assignment"
-            parts = key.split("_", 2)  # ["grade", "5", "Assignment"]
-            if len(parts) < 3:
-                continue
-            enrollment_id = parts[1]
-            category = parts[2]      # e.g. "Assignment", "Quiz", "Midterm"
-            grade_value = value
-
-            # Check if row exists
-            existing = db.execute("""
-                SELECT id
-                  FROM grades
-                 WHERE enrollment_id = ?
-                   AND category = ?
-            """, (enrollment_id, category)).fetchone()
-
-            if existing:
-                # update
-                db.execute("""
-                    UPDATE grades
-                       SET grade_value = ?
-                     WHERE id = ?
-                """, (grade_value, existing["id"]))
-            else:
-                # insert
-                db.execute("""
-                    INSERT INTO grades (enrollment_id, grade_value, category)
-                    VALUES (?, ?, ?)
-                """, (enrollment_id, grade_value, category))
-    db.commit()
-
+    try:
+        grades = parse_grade_form(request.form)
+        summary = apply_grades(db, course_id, grades)
+    except GradeFormError as e:
+        return f"Error: {e}"
+
+    flash(f"Grades saved: {summary['inserted']} added, {summary['updated']} updated, "
+          f"{summary['cleared']} cleared, {summary['unchanged']} unchanged.")
     return redirect(url_for("course_grades", course_id=course_id))
 
 @app.route("/teacher/manage_attendance")
+@role_required("teacher")
 def teacher_manage_attendance():
     """
     Lists all courses for the teacher to pick from and mark attendance.
     For simplicity, we assume teacher can mark attendance for any course.
     In a real system, courses might be assigned to specific teacher_ids.
     """
-    if "user_id" not in session or session.get("role") != "teacher":
-        return "Access Denied. Teacher Only."
-
     db = get_db()
-    courses = db.execute("SELECT * FROM courses").fetchall()
+    courses = get_courses(db)
     return render_template("courses.html", courses=courses, is_teacher=True)
 
+@app.route("/teacher/analytics")
+@role_required("teacher")
+def teacher_analytics():
+    """
+    Grade and attendance statistics for one course (?course_id=) or a whole
+    semester (?semester=): weighted totals, percentiles, histogram, at-risk
+    students. Category weights and the attendance threshold can be changed.
+    """
+    db = get_db()
+    courses = get_courses(db)
+    course_id = request.args.get("course_id", type=int)
+    semester = request.args.get("semester", "").strip() or None
+    try:
+        weights = analytics.parse_weights(request.args)
+        threshold = analytics.parse_threshold(request.args)
+    except analytics.AnalyticsError as e:
+        return f"Error: {e}"
+
+    stats = students = None
+    if course_id or semester:
+        cohort = analytics.load(db, course_id=course_id, semester=None if course_id else semester)
+        stats = analytics.summarize(cohort, weights, threshold)
+        # A course lists everyone; a semester only its at-risk students
+        students = analytics.student_rows(db, cohort, stats, only_at_risk=not course_id,
+                                          limit=None if course_id else analytics.AT_RISK_LIMIT)
+    return render_template("teacher_analytics.html", courses=courses,
+                           course_names={c["id"]: c["name"] for c in courses},
+                           semesters=sorted({c["semester"] for c in courses}, reverse=True),
+                           course_id=course_id, semester=semester, weights=weights,
+                           threshold=threshold, categories=GRADE_CATEGORIES,
+                           weight_args={f"weight_{c}": w for c, w in weights.items()},
+                           stats=stats, students=students)
+
 @app.route("/teacher/course_attendance/<int:course_id>", methods=["GET"])
+@role_required("teacher")
 def course_attendance(course_id):
     """
     Page for teacher to mark attendance for all students in a given course.
     """
-    if "user_id" not in session or session.get("role") != "teacher":
-        return "Access Denied. Teacher Only."
-
     db = get_db()
     course = db.execute("SELECT * FROM courses WHERE id = ?", (course_id,)).fetchone()
     enrollments = db.execute("""
@@ -467,71 +705,111 @@ def course_attendance(course_id):
     return render_template("course_attendance.html", course=course, enrollments=enrollments)
 
 @app.route("/teacher/process_attendance/<int:course_id>", methods=["POST"])
+@role_required("teacher")
 def process_attendance(course_id):
-    if "user_id" not in session or session.get("role") != "teacher":
-        return "Access Denied. Teacher Only."
-
-    date = request.form["attendance_date"]
     db = get_db()
-
-    for key in request.form:
-        if key.startswith("status_"):
-            enrollment_id_str = key.split("_")[1]
-            status = request.form[key]  # 'present' or 'absent'
-            db.execute(
-                "INSERT INTO attendance (enrollment_id, date, status) VALUES (?, ?, ?)",
-                (enrollment_id_str, date, status)
-            )
-    db.commit()
+    try:
+        record_roll_calls(db, [{
+            "course_id": course_id,
+            "date": parse_date(request.form["attendance_date"]),
+            "statuses": parse_roll_call_form(request.form),
+        }])
+    except AttendanceError as e:
+        return f"Error: {e}"
     return redirect(url_for("teacher_dashboard"))
 
+@app.route("/teacher/attendance/import", methods=["POST"])
+def import_attendance():
+    """
+    JSON batch import of roll calls (e.g. nightly door-scanner export).
+    Body: {"roll_calls": [{"course_id": 1, "date": "2025-01-21",
+                           "statuses": {"<enrollment_id>": "present"}}, ...]}
+    Accepts a logged-in teacher, or the ATTENDANCE_IMPORT_TOKEN header for scripts.
+    """
+    import_token = os.getenv("ATTENDANCE_IMPORT_TOKEN")
+    token_ok = token_matches(request.headers.get("X-Import-Token"), import_token)
+    if not token_ok and ("user_id" not in session or session.get("role") != "teacher"):
+        return jsonify(error="Access Denied. Teacher Only."), 403
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get("roll_calls"), list):
+        return jsonify(error="Expected a JSON object with a 'roll_calls' list."), 400
+
+    try:
+        summary = record_roll_calls(get_db(), payload["roll_calls"])
+    except AttendanceError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(summary)
+
 # -----------------------------
 # TEACHER: View & Update Existing Attendance
 # -----------------------------
 
 @app.route("/teacher/all_attendance")
+@role_required("teacher")
 def teacher_all_attendance():
     """
-    Lists all existing attendance records so the teacher can update any record.
-    In a real system, you might filter by courses the teacher actually teaches.
+    Lists attendance records, newest first, one keyset page at a time.
+    Optional filters: course_id, student (name prefix), date_from, date_to, status.
     """
-    if "user_id" not in session or session.get("role") != "teacher":
-        return "Access Denied. Teacher Only."
-
     db = get_db()
-    attendance_records = db.execute("""
-        SELECT a.id AS attendance_id,
-               a.date,
-               a.status,
-               c.name AS course_name,
-               u.username AS student_name
-          FROM attendance a
-          JOIN enrollments e ON a.enrollment_id = e.id
-          JOIN courses c     ON e.course_id = c.id
-          JOIN users u      ON e.user_id = u.id
-      ORDER BY a.date DESC
-    """).fetchall()
-
-    # Render a template (e.g., "teacher_all_attendance.html") showing these records
-    # Each record could have a link to /teacher/update_attendance/<attendance_id>
-    return render_template("teacher_all_attendance.html", attendance_records=attendance_records)
+    try:
+        filters = attendance_filters(request.args)
+        attendance_records, next_cursor = attendance_page(
+            db, filters,
+            after=request.args.get("after"),
+            page_size=request.args.get("page_size", ATTENDANCE_PAGE_SIZE, type=int),
+        )
+    except AttendanceError as e:
+        return f"Error: {e}"
+
+    courses = get_courses(db)
+    # Each record links to /teacher/update_attendance/<attendance_id>
+    return render_report("teacher_all_attendance.html",
+                           attendance_records=attendance_records,
+                           next_cursor=next_cursor,
+                           filters=filters,
+                           courses=courses,
+                           statuses=ATTENDANCE_STATUSES)
+
+@app.route("/teacher/all_attendance.csv")
+@role_required("teacher")
+def teacher_all_attendance_csv():
+    """
+    Streams the same filtered attendance report as a CSV download.
+    """
+    try:
+        filters = attendance_filters(request.args)
+    except AttendanceError as e:
+        return f"Error: {e}"
+
+    return stream_response(
+        iter_attendance_csv(get_db(), filters),
+        mimetype="text/csv",
+        headers={"Content-Disposition": "attachment; filename=attendance.csv"},
+    )
 
 
 @app.route("/teacher/update_attendance/<int:attendance_id>", methods=["GET", "POST"])
+@role_required("teacher")
 def update_attendance(attendance_id):
     """
     Allows the teacher to change a specific attendance record’s status (present/absent).
     """
-    if "user_id" not in session or session.get("role") != "teacher":
-        return "Access Denied. Teacher Only."
-
     db = get_db()
 
     if request.method == "POST":
         # Update the attendance status
         new_status = request.form["status"]  # e.g., 'present' or 'absent'
-        db.execute("UPDATE attendance SET status = ? WHERE id = ?", (new_status, attendance_id))
-        db.commit()
+        if new_status not in ATTENDANCE_STATUSES:
+            return "Error: Invalid status."
+        with db:
+            updated = db.execute(
+                "UPDATE attendance SET status = ? WHERE id = ? RETURNING enrollment_id",
+                (new_status, attendance_id)
+            ).fetchone()
+            if updated:
+                refresh_enrollments(db, [updated["enrollment_id"]])
         return redirect(url_for("teacher_all_attendance"))
     else:
         # Retrieve the existing attendance record to pre-fill in a form
@@ -556,40 +834,66 @@ def update_attendance(attendance_id):
 # -----------------------------
 
 @app.route("/teacher/course_resources/<int:course_id>")
+@role_required("teacher")
 def teacher_course_resources(course_id):
     """
     Lists all PDFs uploaded for the specified course.
     Teacher can see, upload, delete, or update (rename).
     """
-    if "user_id" not in session or session.get("role") != "teacher":
-        return "Access Denied. Teacher Only."
-
     db = get_db()
     # Get the course info
     course = db.execute("SELECT * FROM courses WHERE id=?", (course_id,)).fetchone()
     if not course:
         return "Course not found."
 
-    # Get all resources for this course
-    resources = db.execute("""
-        SELECT id, file_name, file_path
-          FROM course_resources
-         WHERE course_id = ?
-    """, (course_id,)).fetchall()
+    # Get all resources for this course, with their processing state
+    resources = db.execute(RESOURCE_STATUS_SQL, (course_id,)).fetchall()
 
     # Render a template like teacher_course_resources.html
     return render_template("teacher_course_resources.html",
                            course=course, resources=resources)
 
 
+@app.route("/teacher/course_resources/<int:course_id>/status")
+@role_required("teacher")
+def resource_status(course_id):
+    """
+    JSON processing state of a course's resources; polled by the resources page
+    while uploads are still being processed.
+    """
+    rows = get_db().execute(RESOURCE_STATUS_SQL, (course_id,)).fetchall()
+    return jsonify([
+        {"id": r["id"], "status": r["processing_status"], "message": r["processing_message"],
+         "page_count": r["page_count"], "has_thumbnail": r["thumbnail_path"] is not None,
+         "job_status": r["job_status"], "progress": r["job_progress"],
+         "job_message": r["job_message"], "attempts": r["job_attempts"]}
+        for r in rows
+    ])
+
+
+@app.route("/resource/thumbnail/<int:resource_id>")
+@role_required("teacher", "student")
+def resource_thumbnail(resource_id):
+    db = get_db()
+    if session["role"] == "student":
+        # Same checks as the file itself
+        resource = db.execute(STUDENT_RESOURCE_SQL,
+                              (session["user_id"], resource_id, READY)).fetchone()
+    else:
+        resource = db.execute(
+            "SELECT thumbnail_path FROM course_resources WHERE id = ?", (resource_id,)
+        ).fetchone()
+    if not resource or not resource["thumbnail_path"]:
+        return "Thumbnail not found.", 404
+    return serve_file(resource["thumbnail_path"], mimetype="image/png", as_attachment=False)
+
+
 @app.route("/teacher/upload_resource/<int:course_id>", methods=["POST"])
+@role_required("teacher")
 def upload_resource(course_id):
     """
     Handles the PDF upload for a specific course.
     """
-    if "user_id" not in session or session.get("role") != "teacher":
-        return "Access Denied. Teacher Only."
-
     # Check if the course exists
     db = get_db()
     course = db.execute("SELECT * FROM courses WHERE id=?", (course_id,)).fetchone()
@@ -605,20 +909,10 @@ def upload_resource(course_id):
 
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        # Create a subfolder for each course if desired
-        course_folder = os.path.join(app.config['UPLOAD_FOLDER'], f"course_{course_id}")
-        os.makedirs(course_folder, exist_ok=True)
-        
-        # Full path where the file will be saved
-        file_path = os.path.join(course_folder, filename)
-        file.save(file_path)
-
-        # Insert metadata into DB
-        db.execute("""
-            INSERT INTO course_resources (course_id, file_name, file_path)
-            VALUES (?, ?, ?)
-        """, (course_id, filename, file_path))
-        db.commit()
+        # Already on disk (hashed while streaming); identical files share one copy
+        resource_id, _ = store_upload(db, course_id, file, filename)
+        # Validation, thumbnail and text extraction run in the job worker
+        enqueue_processing(db, resource_id)
 
         return redirect(url_for("teacher_course_resources", course_id=course_id))
     else:
@@ -626,43 +920,27 @@ def upload_resource(course_id):
 
 
 @app.route("/teacher/delete_resource/<int:resource_id>", methods=["POST"])
+@role_required("teacher")
 def delete_resource(resource_id):
     """
     Deletes a PDF resource from DB and the filesystem.
     """
-    if "user_id" not in session or session.get("role") != "teacher":
-        return "Access Denied. Teacher Only."
-
     db = get_db()
-    resource = db.execute("""
-        SELECT course_id, file_path
-          FROM course_resources
-         WHERE id = ?
-    """, (resource_id,)).fetchone()
-
-    if not resource:
+    # The file itself is removed only when no other resource shares it
+    course_id = release_resource(db, resource_id)
+    if course_id is None:
         return "Resource not found."
 
-    # Delete from DB
-    db.execute("DELETE FROM course_resources WHERE id=?", (resource_id,))
-    db.commit()
-
-    # Also delete the actual file if it exists
-    if os.path.exists(resource['file_path']):
-        os.remove(resource['file_path'])
-
-    return redirect(url_for("teacher_course_resources", course_id=resource['course_id']))
+    return redirect(url_for("teacher_course_resources", course_id=course_id))
 
 
 @app.route("/teacher/update_resource/<int:resource_id>", methods=["GET", "POST"])
+@role_required("teacher")
 def update_resource(resource_id):
     """
     Allows teacher to rename the resource file_name in DB. 
     (This does not rename the physical file, but you could if desired.)
     """
-    if "user_id" not in session or session.get("role") != "teacher":
-        return "Access Denied. Teacher Only."
-
     db = get_db()
     resource = db.execute("""
         SELECT id, course_id, file_name, file_path
@@ -696,84 +974,57 @@ def update_resource(resource_id):
 # -----------------------------
 @app.route("/login/student", methods=["GET", "POST"])
 def student_login():
-    if request.method == "POST":
-        username = request.form["username"]
-        password = request.form["password"]
-
-        db = get_db()
-        user = db.execute(
-            "SELECT * FROM users WHERE username = ? AND password = ? AND role = 'student'",
-            (username, password)
-        ).fetchone()
-
-        if user:
-            session["user_id"] = user["id"]
-            session["role"] = user["role"]
-            return redirect(url_for("student_dashboard"))
-        else:
-            return "Invalid Student Credentials."
-
-    return render_template("student_login.html")
+    return login_view("student")
 
 @app.route("/student/dashboard")
+@role_required("student")
 def student_dashboard():
-    if "user_id" not in session or session.get("role") != "student":
-        return "Access Denied. Student Only."
-
     db = get_db()
-    enrollments = db.execute("""
-        SELECT e.course_id, c.name AS course_name, c.semester
-        FROM enrollments e
-        JOIN courses c ON e.course_id = c.id
-        WHERE e.user_id = ?
-    """, (session["user_id"],)).fetchall()
+    # Attendance summary comes from the rollup table, not the raw history
+    enrollments = db.execute(STUDENT_COURSES_SQL, (session["user_id"],)).fetchall()
 
     return render_template("student_dashboard.html", enrollments=enrollments)
 
 
 @app.route("/courses")
+@login_required
 def courses():
     """
     Shows all courses. Students can click 'Enroll.'
     Teachers might see 'Mark Attendance' but we separated that into teacher_manage_attendance.
     """
-    if "user_id" not in session:
-        return redirect(url_for("index"))
-
     db = get_db()
-    course_list = db.execute("SELECT * FROM courses").fetchall()
+    course_list = get_courses(db)
+    q = request.args.get("q", "").strip()
+    if q:
+        # Ranked by the search index; the course rows still come from the cache
+        by_id = {c["id"]: c for c in course_list}
+        course_list = [by_id[i] for i in search_course_ids(db, q) if i in by_id]
     # We'll pass is_teacher only if session role is teacher
     is_teacher = (session.get("role") == "teacher")
-    return render_template("courses.html", courses=course_list, is_teacher=is_teacher)
+    return render_template("courses.html", courses=course_list, is_teacher=is_teacher, q=q)
 
 @app.route("/enroll/<int:course_id>", methods=["GET", "POST"])
+@role_required("student")
 def enroll(course_id):
     """
     Student enroll in a course.
     """
-    if "user_id" not in session or session.get("role") != "student":
-        return "Access Denied. Student Only."
-
     db = get_db()
     if request.method == "POST":
-        db.execute(
-            "INSERT INTO enrollments (user_id, course_id) VALUES (?, ?)",
-            (session["user_id"], course_id)
-        )
-        db.commit()
+        # Already-enrolled (e.g. a double-click) is a no-op, not a duplicate row
+        enroll_student(db, session["user_id"], course_id)
         return redirect(url_for("my_enrollments"))
 
     course = db.execute("SELECT * FROM courses WHERE id = ?", (course_id,)).fetchone()
     return render_template("enroll.html", course=course, is_edit=False)
 
 @app.route("/my_enrollments")
+@role_required("student")
 def my_enrollments():
     """
     Shows courses the student is enrolled in.
     """
-    if "user_id" not in session or session.get("role") != "student":
-        return "Access Denied. Student Only."
-
     db = get_db()
     enrollments = db.execute("""
         SELECT c.name AS course_name, c.semester
@@ -788,102 +1039,128 @@ def my_enrollments():
 # -----------------------------
 
 @app.route("/student/my_attendance")
+@role_required("student")
 def my_attendance():
     """
     Shows the logged-in student all of their attendance records for all enrolled courses.
     """
-    if "user_id" not in session or session.get("role") != "student":
-        return "Access Denied. Student Only."
-
     db = get_db()
-    attendance_list = db.execute("""
-        SELECT a.date,
-               a.status,
-               c.name AS course_name
-          FROM attendance a
-          JOIN enrollments e ON a.enrollment_id = e.id
-          JOIN courses c     ON e.course_id = c.id
-         WHERE e.user_id = ?
-      ORDER BY a.date DESC
-    """, (session["user_id"],)).fetchall()
+    # Rows are read in chunks while the page streams out; compacted
+    # semesters are decoded from their bitmaps and merged in by date
+    live = iter_rows(db.execute(STUDENT_ATTENDANCE_SQL, (session["user_id"],)))
+    archived = iter_archived(db, ["e.user_id = ?"], [session["user_id"]])
+    attendance_list = merge(live, archived, key=lambda row: row["date"], reverse=True)
 
-    # Render a template (e.g., "student_view_attendance.html") to list these records
-    return render_template("student_view_attendance.html", attendance_list=attendance_list)
+    return render_report("student_view_attendance.html", attendance_list=attendance_list)
 
 # -----------------------------
 # STUDENT: View/Download PDF Resources
 # -----------------------------
 @app.route("/student/resources/<int:course_id>")
+@role_required("student")
 def student_resources(course_id):
     """
     Lists PDFs for a course if the student is enrolled.
     Student can download/view them.
     """
-    if "user_id" not in session or session.get("role") != "student":
-        return "Access Denied. Student Only."
-
     db = get_db()
     # Check if student is enrolled in this course
-    enrollment_check = db.execute("""
-        SELECT e.id
-          FROM enrollments e
-         WHERE e.course_id = ?
-           AND e.user_id = ?
-    """, (course_id, session["user_id"])).fetchone()
+    enrollment_check = db.execute(ENROLLMENT_SQL, (course_id, session["user_id"])).fetchone()
 
     if not enrollment_check:
         return "You are not enrolled in this course."
 
-    # Fetch all resources
-    resources = db.execute("""
-        SELECT id, file_name, file_path
-          FROM course_resources
-         WHERE course_id = ?
-    """, (course_id,)).fetchall()
+    # Only processed resources: pending uploads are not validated yet
+    resources = db.execute(STUDENT_RESOURCES_SQL, (course_id, READY)).fetchall()
 
     # Render a template like "student_course_resources.html" listing them
     return render_template("student_course_resources.html", resources=resources)
 
+@app.route("/search")
+@role_required("student")
+def search():
+    """
+    Full-text search over the student's enrolled courses and their PDFs.
+    """
+    q = request.args.get("q", "").strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+    results, has_next = search_enrolled(get_db(), session["user_id"], q, page,
+                                        SEARCH_PAGE_SIZE) if q else ([], False)
+    return render_template("search.html", q=q, results=results, page=page,
+                           has_next=has_next)
+
 @app.route("/student/my_grades")
+@role_required("student")
 def my_grades():
     """
     Shows the logged-in student all of their grades by course and category.
     """
-    if "user_id" not in session or session.get("role") != "student":
-        return "Access Denied. Student Only."
-
     db = get_db()
-    # fetch courses & grades for this student
-    # step 1: find all enrollments
-    enrollments = db.execute("""
-        SELECT e.id AS enrollment_id, c.name AS course_name, c.semester
-          FROM enrollments e
-          JOIN courses c ON e.course_id = c.id
-         WHERE e.user_id = ?
-    """, (session["user_id"],)).fetchall()
+    # One statement: every enrollment with its grades (if any) alongside,
+    # collapsed into one entry per enrollment with a {category: grade} map
+    rows = db.execute(STUDENT_GRADES_SQL, (session["user_id"],)).fetchall()
+
+    enrollments = list(group_grades(rows))
+    return render_template("student_my_grades.html", enrollments=enrollments)
 
-    # step 2: fetch all grades for these enrollments
-    enrollment_ids = [str(e["enrollment_id"]) for e in enrollments]
-    if not enrollment_ids:
-        return "No enrollments found."
-
-    # Convert to comma-separated string if needed, or do a parameterized query
-    in_clause = ",".join(enrollment_ids)  # e.g. "3,4,5"
-    grades = db.execute(f"""
-        SELECT g.enrollment_id, g.category, g.grade_value
-          FROM grades g
-         WHERE g.enrollment_id IN ({in_clause})
-    """).fetchall()
-
-    # Build a structure to map enrollment_id -> {category: grade_value}
-    from collections import defaultdict
-    grades_map = defaultdict(dict)
-    for g in grades:
-        grades_map[g["enrollment_id"]][g["category"]] = g["grade_value"]
-
-    return render_template("student_my_grades.html",
-                           enrollments=enrollments,
-                           grades_map=grades_map)
+# -----------------------------
+# ARCHIVED SEMESTERS (read-only)
+# -----------------------------
+@app.route("/archives")
+@role_required("teacher", "admin")
+def archives():
+    """
+    Semesters moved to archive files; ?semester= lists that semester's courses.
+    """
+    db = get_db()
+    semester = request.args.get("semester")
+    courses = []
+    if semester:
+        try:
+            # The archive is attached read-only for just these statements
+            with attached(db, semester) as schema:
+                courses = db.execute(f"""
+                    SELECT c.id, c.name, u.actual_name AS teacher_name, COUNT(e.id) AS enrolled
+                      FROM {schema}.courses c
+                      LEFT JOIN {schema}.archived_users u ON u.id = c.teacher_id
+                      LEFT JOIN {schema}.enrollments e ON e.course_id = c.id
+                  GROUP BY c.id
+                  ORDER BY c.name
+                """).fetchall()
+        except ArchiveError as e:
+            return str(e), 404
+    return render_template("archives.html", semesters=archived_semesters(db),
+                           semester=semester, courses=courses)
+
+@app.route("/archives/<semester>/courses/<int:course_id>")
+@role_required("teacher", "admin")
+def archived_course(semester, course_id):
+    """
+    Final grades and attendance totals of one course of an archived semester.
+    """
+    db = get_db()
+    try:
+        with attached(db, semester) as schema:
+            course = db.execute(f"SELECT * FROM {schema}.courses WHERE id = ?",
+                                (course_id,)).fetchone()
+            rows = db.execute(f"""
+                SELECT e.id AS enrollment_id, u.username, u.actual_name,
+                       COALESCE(r.present_count, 0) AS present_count,
+                       COALESCE(r.absent_count, 0) AS absent_count,
+                       g.category, g.grade_value
+                  FROM {schema}.enrollments e
+                  LEFT JOIN {schema}.archived_users u ON u.id = e.user_id
+                  LEFT JOIN {schema}.enrollment_rollups r ON r.enrollment_id = e.id
+                  LEFT JOIN {schema}.grades g ON g.enrollment_id = e.id
+                 WHERE e.course_id = ?
+              ORDER BY e.id
+            """, (course_id,)).fetchall()
+    except ArchiveError as e:
+        return str(e), 404
+    if not course:
+        return "Course not found.", 404
+    return render_template("archived_course.html", semester=semester, course=course,
+                           enrollments=list(group_grades(rows)), categories=GRADE_CATEGORIES)
 
 # -----------------------------
 # MAIN ENTRY
@@ -0,0 +1,356 @@
+"""
+Compact (columnar) storage for the attendance of closed semesters.
+
+A compacted enrollment keeps its whole attendance history in one
+attendance_archive row instead of one attendance row per day:
+
+    first_day     day number (days since 1970-01-01) of bit 0
+    day_count     number of calendar days covered
+    recorded      bitmap, bit i set = a roll call on first_day + i
+    present       bitmap, bit i set = present on first_day + i
+
+plus the present/absent counts and last dates the rollups need. Bitmaps
+are little-endian integers, so a semester of daily roll calls is ~2 x 16
+bytes per student and course instead of ~120 rows.
+
+Read paths decode transparently: iter_archived() yields archived records
+shaped like rows of the reports query (newest first, attendance_id is the
+negative enrollment id), to be merged with the live rows. Archived records
+are read-only (roll_call rejects writes to their dates, see
+archived_records()); expand a semester back into rows to edit it.
+
+Usage:
+    python attendance_archive.py compact SEMESTER [--db academy.db]
+    python attendance_archive.py expand SEMESTER [--db academy.db]
+    python attendance_archive.py status [--db academy.db]
+"""
+import argparse
+import sqlite3
+import sys
+from datetime import date, timedelta
+
+import rollups
+from db import fetch_in
+
+EPOCH = date(1970, 1, 1)
+CHUNK_SIZE = 500
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS attendance_archive (
+        enrollment_id INTEGER PRIMARY KEY,
+        first_day INTEGER NOT NULL,
+        day_count INTEGER NOT NULL,
+        recorded BLOB NOT NULL,
+        present BLOB NOT NULL,
+        present_count INTEGER NOT NULL,
+        absent_count INTEGER NOT NULL,
+        last_seen TEXT,      -- latest date marked present
+        last_recorded TEXT,  -- latest date with any record
+        FOREIGN KEY (enrollment_id) REFERENCES enrollments(id)
+    )"""
+
+
+def create_table(conn):
+    conn.execute(CREATE_TABLE)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_archive_last_recorded "
+                 "ON attendance_archive(last_recorded)")
+
+
+def day_number(iso_date):
+    return (date.fromisoformat(iso_date) - EPOCH).days
+
+
+def day_date(number):
+    return (EPOCH + timedelta(days=number)).isoformat()
+
+
+def _to_blob(bits, day_count):
+    return bits.to_bytes((day_count + 7) // 8, "little")
+
+
+def encode(statuses):
+    """
+    Pack {iso_date: 'present'|'absent'} into an archive row's columns
+    (first_day, day_count, recorded, present, present_count, absent_count,
+    last_seen, last_recorded).
+    """
+    days = {day_number(day): status for day, status in statuses.items()}
+    first = min(days)
+    day_count = max(days) - first + 1
+    recorded = present = 0
+    for day, status in days.items():
+        recorded |= 1 << (day - first)
+        if status == "present":
+            present |= 1 << (day - first)
+    present_days = [day for day, status in days.items() if status == "present"]
+    return (first, day_count, _to_blob(recorded, day_count), _to_blob(present, day_count),
+            len(present_days), len(days) - len(present_days),
+            day_date(max(present_days)) if present_days else None, day_date(max(days)))
+
+
+def decode(first_day, recorded, present):
+    """{iso_date: status} for one archive row."""
+    recorded = int.from_bytes(recorded, "little")
+    present = int.from_bytes(present, "little")
+    statuses = {}
+    while recorded:
+        bit = recorded.bit_length() - 1
+        recorded ^= 1 << bit
+        statuses[day_date(first_day + bit)] = "present" if present >> bit & 1 else "absent"
+    return statuses
+
+
+# -----------------------------
+# READING
+# -----------------------------
+_CANDIDATES = """
+    SELECT aa.enrollment_id, aa.first_day, aa.recorded, aa.present
+      FROM attendance_archive aa
+"""
+# Only needed to apply filters; names are looked up for the records actually yielded
+_FILTER_JOINS = """
+      JOIN enrollments e ON e.id = aa.enrollment_id
+      JOIN courses c     ON e.course_id = c.id
+      JOIN users u       ON e.user_id = u.id
+"""
+
+
+def has_archive_since(db, day):
+    """True if any archived record may be dated `day` or later (cheap index probe)."""
+    return db.execute("SELECT 1 FROM attendance_archive WHERE last_recorded >= ? LIMIT 1",
+                      (day,)).fetchone() is not None
+
+
+def archived_records(db, records):
+    """The (enrollment_id, iso_date) pairs among `records` that are held in the archive."""
+    by_enrollment = {}
+    for enrollment_id, day in records:
+        by_enrollment.setdefault(enrollment_id, set()).add(day)
+    found = []
+    for enrollment_id, first_day, recorded in fetch_in(
+            db, "SELECT enrollment_id, first_day, recorded FROM attendance_archive "
+                "WHERE enrollment_id IN ({marks})", sorted(by_enrollment)):
+        recorded = int.from_bytes(recorded, "little")
+        for day in sorted(by_enrollment[enrollment_id]):
+            offset = day_number(day) - first_day
+            if offset >= 0 and recorded >> offset & 1:
+                found.append((enrollment_id, day))
+    return found
+
+
+def _describe(db, enrollment_ids, names):
+    missing = [i for i in enrollment_ids if i not in names]
+    for row in fetch_in(db, """
+        SELECT e.id, e.course_id, c.name, u.username
+          FROM enrollments e
+          JOIN courses c ON e.course_id = c.id
+          JOIN users u   ON e.user_id = u.id
+         WHERE e.id IN ({marks})
+    """, missing):
+        names[row[0]] = tuple(row)[1:]
+
+
+def iter_archived(db, clauses=(), params=(), date_from=None, date_to=None, status=None,
+                  before=None):
+    """
+    Yield archived records as dicts (attendance_id, date, status, course_id,
+    course_name, student_name), ordered like the live reports: date
+    descending, then attendance_id descending. attendance_id is
+    -enrollment_id, so within a day archived records sort after live ones.
+
+    `clauses`/`params` filter on enrollments e, courses c and users u;
+    `before` is a (date, attendance_id) keyset position to start after.
+    """
+    clauses = list(clauses)
+    params = list(params)
+    sql = _CANDIDATES + (_FILTER_JOINS if clauses else "")
+    # An archive row can only contribute if its span reaches the range
+    low = date_from
+    if low:
+        clauses.append("aa.last_recorded >= ?")
+        params.append(low)
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY aa.enrollment_id"
+
+    candidates = []
+    cursor = db.cursor()
+    cursor.row_factory = None  # plain tuples: thousands of small rows
+    for enrollment_id, first_day, recorded, present in cursor.execute(sql, params):
+        recorded = int.from_bytes(recorded, "little")
+        present = int.from_bytes(present, "little")
+        wanted = {None: recorded, "present": present, "absent": recorded & ~present}[status]
+        if wanted:
+            candidates.append((enrollment_id, first_day, wanted, present))
+    if not candidates:
+        return
+
+    # The union of all bitmaps tells which days have any record at all, so
+    # empty days (weekends, holidays) are never visited
+    origin = min(candidate[1] for candidate in candidates)
+    union = 0
+    for _, first, wanted, _ in candidates:
+        union |= wanted << (first - origin)
+    high = date_to
+    if before and (high is None or before[0] < high):
+        high = before[0]
+    if high is not None:
+        union &= (1 << max(day_number(high) - origin + 1, 0)) - 1
+    if low is not None:
+        union >>= max(day_number(low) - origin, 0)
+        union <<= max(day_number(low) - origin, 0)
+
+    names = {}
+    while union:
+        bit = union.bit_length() - 1
+        union ^= 1 << bit
+        day = origin + bit
+        iso = day_date(day)
+        hits = []
+        for enrollment_id, first, wanted, present in candidates:
+            offset = day - first
+            if offset < 0 or not wanted >> offset & 1:
+                continue
+            if before and iso == before[0] and -enrollment_id >= before[1]:
+                continue
+            hits.append((enrollment_id, "present" if present >> offset & 1 else "absent"))
+        # Callers usually stop after a page, so describe in page-sized batches
+        for start in range(0, len(hits), 100):
+            batch = hits[start:start + 100]
+            _describe(db, [enrollment_id for enrollment_id, _ in batch], names)
+            for enrollment_id, state in batch:
+                course_id, course_name, student_name = names[enrollment_id]
+                yield {
+                    "attendance_id": -enrollment_id,
+                    "date": iso,
+                    "status": state,
+                    "course_id": course_id,
+                    "course_name": course_name,
+                    "student_name": student_name,
+                }
+
+
+# -----------------------------
+# COMPACTING / EXPANDING
+# -----------------------------
+def _semester_enrollments(db, semester):
+    return [row[0] for row in db.execute("""
+        SELECT e.id FROM enrollments e JOIN courses c ON c.id = e.course_id
+         WHERE c.semester = ?
+      ORDER BY e.id
+    """, (semester,))]
+
+
+def compact_semester(db, semester):
+    """
+    Move the attendance rows of every enrollment in `semester` into
+    attendance_archive (merging with anything archived before; on the same
+    day the live row wins). One transaction. Returns (enrollments, rows).
+    """
+    enrollment_ids = _semester_enrollments(db, semester)
+    enrollments = moved = 0
+    with db:
+        for start in range(0, len(enrollment_ids), CHUNK_SIZE):
+            chunk = enrollment_ids[start:start + CHUNK_SIZE]
+            history = {}
+            for row in fetch_in(db, "SELECT enrollment_id, first_day, recorded, present "
+                                    "FROM attendance_archive WHERE enrollment_id IN ({marks})", chunk):
+                history[row[0]] = decode(row[1], row[2], row[3])
+            live = fetch_in(db, "SELECT enrollment_id, date, status FROM attendance "
+                                "WHERE enrollment_id IN ({marks})", chunk)
+            if not live:
+                continue
+            for enrollment_id, day, status in live:
+                history.setdefault(enrollment_id, {})[day] = status
+            changed = sorted({row[0] for row in live})
+            db.executemany("""
+                INSERT OR REPLACE INTO attendance_archive
+                    (enrollment_id, first_day, day_count, recorded, present,
+                     present_count, absent_count, last_seen, last_recorded)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(enrollment_id, *encode(history[enrollment_id])) for enrollment_id in changed])
+            db.execute(f"DELETE FROM attendance WHERE enrollment_id IN ({','.join('?' * len(changed))})",
+                       changed)
+            rollups.refresh_enrollments(db, changed)
+            enrollments += len(changed)
+            moved += len(live)
+    return enrollments, moved
+
+
+def expand_semester(db, semester):
+    """Turn the semester's archive rows back into attendance rows. Returns (enrollments, rows)."""
+    enrollment_ids = _semester_enrollments(db, semester)
+    enrollments = restored = 0
+    with db:
+        for start in range(0, len(enrollment_ids), CHUNK_SIZE):
+            chunk = enrollment_ids[start:start + CHUNK_SIZE]
+            archived = fetch_in(db, "SELECT enrollment_id, first_day, recorded, present "
+                                    "FROM attendance_archive WHERE enrollment_id IN ({marks})", chunk)
+            if not archived:
+                continue
+            rows = [(row[0], day, status) for row in archived
+                    for day, status in decode(row[1], row[2], row[3]).items()]
+            # Rows recorded after compaction are newer and are kept as they are
+            db.executemany("INSERT OR IGNORE INTO attendance (enrollment_id, date, status) "
+                           "VALUES (?, ?, ?)", rows)
+            ids = [row[0] for row in archived]
+            db.execute(f"DELETE FROM attendance_archive WHERE enrollment_id IN ({','.join('?' * len(ids))})",
+                       ids)
+            rollups.refresh_enrollments(db, ids)
+            enrollments += len(ids)
+            restored += len(rows)
+    return enrollments, restored
+
+
+def status(db):
+    archived = db.execute("""
+        SELECT COUNT(*), TOTAL(present_count + absent_count),
+               TOTAL(length(recorded) + length(present))
+          FROM attendance_archive
+    """).fetchone()
+    semesters = db.execute("""
+        SELECT c.semester, COUNT(*) FROM attendance_archive aa
+          JOIN enrollments e ON e.id = aa.enrollment_id
+          JOIN courses c ON c.id = e.course_id
+      GROUP BY c.semester ORDER BY c.semester
+    """).fetchall()
+    return {
+        "live_rows": db.execute("SELECT COUNT(*) FROM attendance").fetchone()[0],
+        "archived_enrollments": archived[0],
+        "archived_records": int(archived[1]),
+        "archived_bytes": int(archived[2]),
+        "semesters": [tuple(row) for row in semesters],
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Compact closed semesters' attendance.")
+    parser.add_argument("command", choices=("compact", "expand", "status"))
+    parser.add_argument("semester", nargs="?")
+    parser.add_argument("--db", default="academy.db")
+    args = parser.parse_args(argv)
+    if args.command != "status" and not args.semester:
+        parser.error(f"{args.command} needs a SEMESTER")
+
+    conn = sqlite3.connect(args.db)
+    conn.row_factory = sqlite3.Row
+    if args.command == "compact":
+        enrollments, rows = compact_semester(conn, args.semester)
+        print(f"Compacted {rows} attendance rows of {enrollments} enrollments in {args.semester!r}. "
+              "Run VACUUM to return the freed pages to the file system.")
+    elif args.command == "expand":
+        enrollments, rows = expand_semester(conn, args.semester)
+        print(f"Restored {rows} attendance rows of {enrollments} enrollments in {args.semester!r}.")
+    else:
+        info = status(conn)
+        print(f"Live attendance rows: {info['live_rows']}")
+        print(f"Archived: {info['archived_records']} records of {info['archived_enrollments']} "
+              f"enrollments in {info['archived_bytes']} bytes of bitmaps")
+        for semester, count in info["semesters"]:
+            print(f"  {semester}: {count} enrollments")
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,114 @@
+"""
+Authentication and role-based access checks.
+
+The role is cached in the signed session cookie at login, so guarding a
+route never touches the database. role_required() replaces the guard
+block every view used to copy, and records how often and how long each
+endpoint's check runs (see auth_timings.stats()).
+"""
+import hmac
+import threading
+import time
+from functools import wraps
+
+from flask import redirect, request, session, url_for
+
+from passwords import HashingBusy, hash_on_pool, needs_rehash, verify_password
+
+ROLES = ("admin", "teacher", "student")
+
+# A single-row seek on the UNIQUE(username) index; role is checked on that row
+LOGIN_SQL = "SELECT id, role, password FROM users WHERE username = ? AND role = ?"
+
+
+def token_matches(given, expected):
+    """
+    Whether a token sent by a script matches the configured one, compared in
+    constant time. An unset (empty) configured token never matches.
+    """
+    return bool(expected) and hmac.compare_digest((given or "").encode(), expected.encode())
+
+
+class AuthTimings:
+    """Per-endpoint counters for access checks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, endpoint, seconds, allowed):
+        with self._lock:
+            entry = self._routes.setdefault(
+                endpoint, {"checks": 0, "denied": 0, "total_ms": 0.0, "max_ms": 0.0}
+            )
+            entry["checks"] += 1
+            entry["denied"] += 0 if allowed else 1
+            entry["total_ms"] += seconds * 1000
+            entry["max_ms"] = max(entry["max_ms"], seconds * 1000)
+
+    def stats(self):
+        with self._lock:
+            return {
+                endpoint: dict(entry, avg_ms=round(entry["total_ms"] / entry["checks"], 4),
+                               total_ms=round(entry["total_ms"], 3),
+                               max_ms=round(entry["max_ms"], 4))
+                for endpoint, entry in sorted(self._routes.items(),
+                                              key=lambda item: -item[1]["checks"])
+            }
+
+
+auth_timings = AuthTimings()
+
+
+def denied_message(roles):
+    """The text a guarded view returns to a user without one of `roles`."""
+    return f"Access Denied. {' or '.join(r.capitalize() for r in roles)} Only."
+
+
+def role_required(*roles):
+    """Allow the view only for logged-in users whose session role is in `roles`."""
+    def decorator(view):
+        denied = denied_message(roles)
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            allowed = "user_id" in session and session.get("role") in roles
+            auth_timings.record(request.endpoint, time.perf_counter() - start, allowed)
+            if not allowed:
+                return denied
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def login_required(view):
+    """Any logged-in user; anonymous visitors go back to the home page."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        allowed = "user_id" in session
+        auth_timings.record(request.endpoint, time.perf_counter() - start, allowed)
+        if not allowed:
+            return redirect(url_for("index"))
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def authenticate(db, username, password, role):
+    """
+    Return the user row if the credentials match an account with `role`,
+    else None. Legacy plaintext or outdated hashes are re-hashed on success,
+    on the hashing pool; if it is full, the upgrade waits for a later login.
+    """
+    user = db.execute(LOGIN_SQL, (username, role)).fetchone()
+    if not verify_password(user["password"] if user else None, password):
+        return None
+    if needs_rehash(user["password"]):
+        try:
+            hashed = hash_on_pool(password)
+        except HashingBusy:
+            return user
+        db.execute("UPDATE users SET password = ? WHERE id = ?", (hashed, user["id"]))
+        db.commit()
+    return user
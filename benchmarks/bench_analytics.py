@@ -0,0 +1,210 @@
+"""
+analytics.py (NumPy over packed course vectors) against the same
+statistics computed row by row in plain Python.
+
+Usage:
+    python benchmarks/bench_analytics.py [--scale small|medium|large] [--days N]
+        [--db FILE] [--runs N]
+
+Without --db a database is generated at --scale (default large: 100k
+enrollments, ~50k per semester) with only --days roll calls per enrollment,
+since the statistics read attendance from the rollups anyway. For the
+biggest semester it times:
+    python      one query of enrollment rows joined to grades, then a loop
+                per row (grade dict per student, as the gradebook builds it),
+                sorted()-based percentiles and ranks
+    numpy_cold  analytics.load() + summarize() with every course's vectors
+                dropped (built in memory, as before the job worker has run)
+    numpy       analytics.load() + summarize() with stored vectors
+    rebuild     analytics.rebuild_stale() for the whole database (the
+                "grade_vectors" job after a bulk change)
+and checks that both give the same totals, percentiles and at-risk counts.
+"""
+import argparse
+import bisect
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import generate_data  # noqa: E402
+import analytics  # noqa: E402
+from gradebook import GRADE_CATEGORIES  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+
+def _number(value):
+    value = value.strip()
+    if not any(ch.isdigit() for ch in value) or any(ch not in "0123456789." for ch in value):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _percentile(ordered, pct):
+    # Linear interpolation between closest ranks, as numpy.percentile does
+    position = (len(ordered) - 1) * pct / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def summarize_python(db, semester, weights, threshold):
+    """The analytics page's numbers, computed one row at a time."""
+    students = {}
+    for enrollment_id, course_id, present, absent, category, grade_value in db.execute("""
+        SELECT e.id, e.course_id, COALESCE(r.present_count, 0), COALESCE(r.absent_count, 0),
+               g.category, g.grade_value
+          FROM courses c
+          JOIN enrollments e ON e.course_id = c.id
+          LEFT JOIN enrollment_rollups r ON r.enrollment_id = e.id
+          LEFT JOIN grades g ON g.enrollment_id = e.id
+         WHERE c.semester = ?
+    """, (semester,)):
+        student = students.setdefault(enrollment_id, {
+            "course_id": course_id, "present": present, "absent": absent, "grades": {}})
+        if category is not None:
+            student["grades"][category] = grade_value
+
+    totals, rates, at_risk = {}, {}, 0
+    columns = {category: [] for category in GRADE_CATEGORIES}
+    courses = {}
+    for enrollment_id, student in students.items():
+        weighted = weight_sum = 0.0
+        for category in GRADE_CATEGORIES:
+            value = student["grades"].get(category)
+            value = _number(value) if value is not None else None
+            if value is None:
+                continue
+            columns[category].append(value)
+            weighted += weights[category] * value
+            weight_sum += weights[category]
+        total = weighted / weight_sum if weight_sum > 0 else None
+        recorded = student["present"] + student["absent"]
+        rate = student["present"] / recorded if recorded else None
+        totals[enrollment_id] = total
+        rates[enrollment_id] = rate
+        if rate is not None and rate < threshold:
+            at_risk += 1
+        course = courses.setdefault(student["course_id"], [0, 0.0])
+        if total is not None:
+            course[0] += 1
+            course[1] += total
+
+    scored = sorted(t for t in totals.values() if t is not None)
+    ranks = {eid: bisect.bisect_right(scored, t) * 100.0 / len(scored)
+             for eid, t in totals.items() if t is not None}
+    histogram = [0] * analytics.HISTOGRAM_BINS
+    for total in scored:
+        histogram[min(int(total // 10), analytics.HISTOGRAM_BINS - 1)] += 1
+    return {
+        "mean": statistics.fmean(scored),
+        "percentiles": {p: _percentile(scored, p) for p in analytics.PERCENTILES},
+        "category_means": {c: statistics.fmean(v) if v else None for c, v in columns.items()},
+        "at_risk": at_risk,
+        "histogram": histogram,
+        "ranks": ranks,
+        "course_means": {cid: s / n for cid, (n, s) in courses.items() if n},
+    }
+
+
+def check(python, stats, cohort):
+    problems = []
+    if abs(python["mean"] - stats["total_stats"]["mean"]) > 1e-6:
+        problems.append("mean")
+    if any(abs(python["percentiles"][p] - stats["total_stats"]["percentiles"][p]) > 1e-6
+           for p in analytics.PERCENTILES):
+        problems.append("percentiles")
+    if python["at_risk"] != stats["at_risk_count"]:
+        problems.append("at_risk")
+    if python["histogram"] != [count for _, _, count in stats["histogram"]]:
+        problems.append("histogram")
+    for enrollment_id, rank in zip(cohort["enrollment_ids"], stats["ranks"]):
+        expected = python["ranks"].get(int(enrollment_id))
+        if (expected is None) != bool(np.isnan(rank)) or (expected is not None and abs(expected - rank) > 1e-6):
+            problems.append("ranks")
+            break
+    for course in stats["courses"]:
+        expected = python["course_means"].get(course["course_id"])
+        if (expected is None) != (course["average"] is None) or (
+                expected is not None and abs(expected - course["average"]) > 1e-6):
+            problems.append("course averages")
+            break
+    return problems
+
+
+def timed(func, runs):
+    timings = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), result
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="NumPy analytics vs row-by-row Python.")
+    parser.add_argument("--scale", choices=sorted(generate_data.SCALES), default="large")
+    parser.add_argument("--days", type=int, default=5, help="roll calls per enrollment when generating")
+    parser.add_argument("--db")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="academy_bench_analytics_")
+    database = os.path.join(work_dir, "academy.db")
+    if args.db:
+        shutil.copy(os.path.abspath(args.db), database)
+    else:
+        settings = dict(generate_data.SCALES[args.scale], days=args.days)
+        counts = generate_data.generate(database, **settings)
+        print(f"Generated {args.scale} database: "
+              + ", ".join(f"{count} {table}" for table, count in counts.items()))
+
+    db = sqlite3.connect(database)
+    db.row_factory = sqlite3.Row
+    migrate(db)
+    semester, enrollments = db.execute("""
+        SELECT c.semester, COUNT(*) FROM enrollments e JOIN courses c ON c.id = e.course_id
+      GROUP BY c.semester ORDER BY COUNT(*) DESC LIMIT 1
+    """).fetchone()
+    weights, threshold = analytics.DEFAULT_WEIGHTS, analytics.AT_RISK_ATTENDANCE
+
+    def numpy_run():
+        cohort = analytics.load(db, semester=semester)
+        return cohort, analytics.summarize(cohort, weights, threshold)
+
+    python_ms, python = timed(lambda: summarize_python(db, semester, weights, threshold), args.runs)
+    with db:
+        db.execute("DELETE FROM course_grade_vectors")
+    cold_ms, _ = timed(numpy_run, args.runs)
+    rebuild_ms, _ = timed(lambda: analytics.rebuild_stale(db), 1)
+    numpy_ms, (cohort, stats) = timed(numpy_run, args.runs)
+    load_ms, _ = timed(lambda: analytics.load(db, semester=semester), args.runs)
+
+    print(f"\nSemester {semester!r}: {enrollments} enrollments, median of {args.runs} runs\n")
+    print(f"{'python':12} {python_ms:9.1f} ms")
+    print(f"{'numpy_cold':12} {cold_ms:9.1f} ms")
+    print(f"{'numpy':12} {numpy_ms:9.1f} ms  (load {load_ms:.1f} ms)  "
+          f"{python_ms / numpy_ms:.1f}x faster than python")
+    print(f"{'rebuild':12} {rebuild_ms:9.1f} ms  (all courses, once)")
+
+    problems = check(python, stats, cohort)
+    print("\nResults " + ("match" if not problems else "DIFFER: " + ", ".join(problems)))
+    db.close()
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
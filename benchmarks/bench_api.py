@@ -0,0 +1,177 @@
+"""
+The async /api/v1 read API against the HTML pages it mirrors, under
+concurrent load over real HTTP.
+
+Usage:
+    python benchmarks/bench_api.py [--scale small|medium|large] [--db FILE]
+        [--concurrency 1 4 16] [--requests 200]
+
+A copy of the database (generated at --scale, or --db) is served by a
+threaded werkzeug server in a subprocess. Client threads, each logged in
+as a different student, request:
+    html_pages    /student/dashboard + /student/my_grades + /student/my_attendance
+                  (three round trips, queries run one after another)
+    api_overview  /api/v1/student/overview (one round trip, queries fanned out;
+                  recent attendance only, where my_attendance sends all of it)
+and the one-page pairs dashboard vs /api/v1/student/courses and my_grades vs
+/api/v1/student/grades. Prints throughput and p50/p95 per concurrency level.
+"""
+import argparse
+import http.client
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import generate_data  # noqa: E402
+
+SCENARIOS = {
+    "html_pages": ["/student/dashboard", "/student/my_grades", "/student/my_attendance"],
+    "api_overview": ["/api/v1/student/overview"],
+    "html_dashboard": ["/student/dashboard"],
+    "api_courses": ["/api/v1/student/courses"],
+    "html_my_grades": ["/student/my_grades"],
+    "api_grades": ["/api/v1/student/grades"],
+}
+
+SERVER = """
+import sys
+sys.path.insert(0, {root!r})
+import app
+from werkzeug.serving import make_server
+make_server("127.0.0.1", {port}, app.app, threaded=True).serve_forever()
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(database, port, work_dir):
+    env = dict(os.environ, DATABASE_URL=database, CACHE_BACKEND="memory")
+    process = subprocess.Popen([sys.executable, "-c", SERVER.format(root=ROOT, port=port)],
+                               cwd=work_dir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("server did not start")
+
+
+def login(port, username):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    conn.request("POST", "/login/student",
+                 body=urlencode({"username": username, "password": generate_data.PASSWORD}),
+                 headers={"Content-Type": "application/x-www-form-urlencoded"})
+    response = conn.getresponse()
+    response.read()
+    cookie = response.getheader("Set-Cookie")
+    conn.close()
+    if not cookie or response.status != 302:
+        raise RuntimeError(f"login failed for {username}: HTTP {response.status}")
+    return cookie.split(";", 1)[0]
+
+
+def fetch(port, path, cookie):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    conn.request("GET", path, headers={"Cookie": cookie})
+    response = conn.getresponse()
+    body = response.read()
+    conn.close()
+    if response.status != 200:
+        raise RuntimeError(f"{path}: HTTP {response.status}")
+    return len(body)
+
+
+def run_load(port, paths, cookies, concurrency, total):
+    """`total` iterations of `paths` spread over `concurrency` threads."""
+    timings = []
+    lock = threading.Lock()
+    remaining = [total]
+
+    def client(cookie):
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            start = time.perf_counter()
+            for path in paths:
+                fetch(port, path, cookie)
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                timings.append(elapsed)
+
+    threads = [threading.Thread(target=client, args=(cookies[i % len(cookies)],))
+               for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    timings.sort()
+    return {
+        "per_s": total / wall,
+        "p50": statistics.median(timings),
+        "p95": timings[min(len(timings) - 1, int(0.95 * len(timings)))],
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Async API vs HTML pages under load.")
+    parser.add_argument("--scale", choices=sorted(generate_data.SCALES), default="medium")
+    parser.add_argument("--db")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="academy_bench_api_")
+    database = os.path.join(work_dir, "academy.db")
+    if args.db:
+        shutil.copy(args.db, database)
+    else:
+        counts = generate_data.generate(database, **generate_data.SCALES[args.scale])
+        print(f"Generated {args.scale} database: "
+              + ", ".join(f"{count} {table}" for table, count in counts.items()))
+
+    port = free_port()
+    server = start_server(database, port, work_dir)
+    try:
+        cookies = [login(port, f"student{i}") for i in range(1, max(args.concurrency) + 1)]
+        for paths in SCENARIOS.values():  # warm-up
+            for cookie in cookies:
+                for path in paths:
+                    fetch(port, path, cookie)
+
+        print(f"\n{args.requests} iterations per cell; latency is per iteration "
+              f"(all of a scenario's round trips)\n")
+        print(f"{'scenario':16} {'conc':>5} {'iter/s':>8} {'p50 ms':>9} {'p95 ms':>9}")
+        for name, paths in SCENARIOS.items():
+            for concurrency in args.concurrency:
+                r = run_load(port, paths, cookies, concurrency, args.requests)
+                print(f"{name:16} {concurrency:5d} {r['per_s']:8.1f} {r['p50']:9.2f} {r['p95']:9.2f}")
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
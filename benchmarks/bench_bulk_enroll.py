@@ -0,0 +1,73 @@
+"""
+Time a cohort load: N students enrolled into a set of courses with one
+set-based INSERT OR IGNORE (bulk_enroll) against the old one INSERT and
+commit per enrollment.
+
+Usage:
+    python benchmarks/bench_bulk_enroll.py [students] [courses]
+
+Defaults to 10000 students into 1 course. The bulk load is then repeated to
+show that re-running it inserts nothing.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from enrollment import bulk_enroll  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+
+def build_database(path, students, courses):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    migrate(conn)
+    with conn:
+        conn.executemany("INSERT INTO users (username, password, role) VALUES (?, 'x', 'student')",
+                         ((f"cohort_{i:06d}",) for i in range(students)))
+        conn.executemany("INSERT INTO courses (name, semester) VALUES (?, '1')",
+                         ((f"Course {i}",) for i in range(courses)))
+    return conn
+
+
+def main(argv):
+    students = int(argv[0]) if argv else 10000
+    courses = int(argv[1]) if len(argv) > 1 else 1
+    tmp = tempfile.mkdtemp(prefix="bench_enroll_")
+
+    conn = build_database(os.path.join(tmp, "loop.db"), students, courses)
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM users")]
+    course_ids = [row[0] for row in conn.execute("SELECT id FROM courses")]
+    start = time.perf_counter()
+    for course_id in course_ids:
+        for user_id in user_ids:
+            conn.execute("INSERT INTO enrollments (user_id, course_id) VALUES (?, ?)",
+                         (user_id, course_id))
+            conn.commit()
+    loop = time.perf_counter() - start
+    conn.close()
+
+    conn = build_database(os.path.join(tmp, "bulk.db"), students, courses)
+    usernames = [f"cohort_{i:06d}" for i in range(students)]
+    start = time.perf_counter()
+    result = bulk_enroll(conn, course_ids, usernames=usernames)
+    bulk = time.perf_counter() - start
+    start = time.perf_counter()
+    again = bulk_enroll(conn, course_ids, usernames=usernames)
+    rerun = time.perf_counter() - start
+    conn.close()
+
+    pairs = students * courses
+    print(f"{pairs} enrollments ({students} students x {courses} courses)")
+    print(f"  row-by-row commits : {loop * 1000:9.1f} ms")
+    print(f"  bulk_enroll        : {bulk * 1000:9.1f} ms  ({result['enrolled']} inserted)")
+    print(f"  bulk_enroll rerun  : {rerun * 1000:9.1f} ms  ({again['enrolled']} inserted)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,78 @@
+"""
+Latency of /search queries (search.search_enrolled) on a synthetic corpus.
+
+Usage:
+    python benchmarks/bench_search.py [documents] [courses]
+
+Defaults to 50000 resource documents spread over 500 courses, each with
+~200 words of text drawn from a 5000-word vocabulary (Zipf-like, so some
+words are very common). One student is enrolled in 10 courses. Prints
+p50/p95/max per query over repeated runs.
+"""
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from migrations import migrate  # noqa: E402
+from search import search_enrolled  # noqa: E402
+
+QUERIES = ["w1", "w10 w20", "w4999", "w12", "w1 w2 w3", "Course 7", "no_such_term"]
+RUNS = 30
+
+
+def build_database(path, documents, courses, rng):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    migrate(conn)
+    vocabulary = [f"w{i}" for i in range(5000)]
+    weights = [1.0 / (i + 1) for i in range(len(vocabulary))]
+    with conn:
+        conn.execute("INSERT INTO users (id, username, password, role) VALUES (1, 's', 'x', 'student')")
+        conn.executemany("INSERT INTO courses (id, name, semester) VALUES (?, ?, ?)",
+                         [(i, f"Course {i}", f"Term {i % 8}") for i in range(1, courses + 1)])
+        conn.executemany("INSERT INTO enrollments (user_id, course_id) VALUES (1, ?)",
+                         [(i,) for i in rng.sample(range(1, courses + 1), 10)])
+        conn.executemany(
+            "INSERT INTO course_resources (course_id, file_name, file_path, extracted_text) "
+            "VALUES (?, ?, ?, ?)",
+            ((rng.randint(1, courses), f"doc_{i}.pdf", f"blobs/{i}.pdf",
+              " ".join(rng.choices(vocabulary, weights, k=200)))
+             for i in range(documents)),
+        )
+        conn.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+    return conn
+
+
+def main(argv):
+    documents = int(argv[0]) if argv else 50000
+    courses = int(argv[1]) if len(argv) > 1 else 500
+    rng = random.Random(42)
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_search_"), "bench.db")
+    start = time.perf_counter()
+    conn = build_database(path, documents, courses, rng)
+    print(f"Indexed {documents} documents in {time.perf_counter() - start:.1f} s")
+
+    print(f"{'query':16} {'hits':>5} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for query in QUERIES:
+        timings = []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            results, _ = search_enrolled(conn, 1, query)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        print(f"{query:16} {len(results):5} {statistics.median(timings):8.2f} "
+              f"{timings[int(len(timings) * 0.95) - 1]:8.2f} {timings[-1]:8.2f}")
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
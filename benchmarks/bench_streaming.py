@@ -0,0 +1,106 @@
+"""
+Peak memory and time-to-first-byte of report pages: fetchall + render_template
+(the old path) against fetchmany + streamed template (render_report).
+
+Usage:
+    python benchmarks/bench_streaming.py [row_count ...]
+
+Each run builds a throwaway database with one student holding `row_count`
+attendance rows and renders /student/my_attendance both ways.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TMP_DIR = tempfile.mkdtemp(prefix="bench_streaming_")
+os.environ["DATABASE_URL"] = os.path.join(TMP_DIR, "bench.db")
+
+import app as academy  # noqa: E402  (DATABASE_URL must be set first)
+from flask import render_template  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+QUERY = """
+    SELECT a.date, a.status, c.name AS course_name
+      FROM attendance a
+      JOIN enrollments e ON a.enrollment_id = e.id
+      JOIN courses c     ON e.course_id = c.id
+     WHERE e.user_id = ?
+  ORDER BY a.date DESC
+"""
+
+
+def build_database(row_count):
+    path = os.environ["DATABASE_URL"]
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.execute("DELETE FROM attendance")
+    conn.execute("DELETE FROM enrollments")
+    conn.execute("DELETE FROM courses")
+    conn.execute("DELETE FROM users")
+    conn.execute("INSERT INTO users (id, username, password, role) VALUES (1, 's', 'x', 'student')")
+    courses = max(1, row_count // 365)
+    conn.executemany("INSERT INTO courses (id, name, semester) VALUES (?, ?, '1')",
+                     [(i, f"Course {i}") for i in range(1, courses + 1)])
+    conn.executemany("INSERT INTO enrollments (id, user_id, course_id) VALUES (?, 1, ?)",
+                     [(i, i) for i in range(1, courses + 1)])
+    start = date(2000, 1, 1)
+    conn.executemany(
+        "INSERT INTO attendance (enrollment_id, date, status) VALUES (?, ?, ?)",
+        ((i % courses + 1, (start + timedelta(days=i // courses)).isoformat(),
+          "present" if i % 7 else "absent") for i in range(row_count)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def measure(render):
+    """Return (peak traced MB, ms to first chunk, total ms) for one render."""
+    with academy.app.test_request_context("/student/my_attendance"):
+        academy.session["user_id"] = 1
+        academy.session["role"] = "student"
+        tracemalloc.start()
+        start = time.perf_counter()
+        first = None
+        for _ in render():
+            if first is None:
+                first = time.perf_counter()
+        end = time.perf_counter()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return peak / 1e6, (first - start) * 1000, (end - start) * 1000
+
+
+def old_path():
+    db = academy.get_db()
+    rows = db.execute(QUERY, (1,)).fetchall()
+    yield render_template("student_view_attendance.html", attendance_list=rows)
+
+
+def new_path():
+    academy.app.config["STREAM_REPORTS"] = True
+    response = academy.my_attendance()
+    yield from response.response
+
+
+def main(argv):
+    counts = [int(a) for a in argv] or [1000, 10000, 100000]
+    print(f"{'rows':>8} | {'old peak MB':>11} {'old TTFB ms':>11} {'old ms':>8} | "
+          f"{'new peak MB':>11} {'new TTFB ms':>11} {'new ms':>8}")
+    for count in counts:
+        build_database(count)
+        old = measure(old_path)
+        new = measure(new_path)
+        print(f"{count:>8} | {old[0]:>11.2f} {old[1]:>11.1f} {old[2]:>8.1f} | "
+              f"{new[0]:>11.2f} {new[1]:>11.1f} {new[2]:>8.1f}")
+    academy.db_pool.close_all()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,180 @@
+"""
+Build a synthetic academy database at a chosen scale.
+
+Usage:
+    python benchmarks/generate_data.py OUTPUT.db [--scale small|medium|large]
+        [--students N] [--teachers N] [--courses N] [--courses-per-student N]
+        [--days N] [--categories N] [--seed N]
+
+Presets (attendance rows = students * courses-per-student * days):
+    small    500 students,   40 courses, 4 each, 30 days  (~60k attendance rows)
+    medium   5000 students, 200 courses, 5 each, 60 days  (~1.5M)
+    large    20000 students, 400 courses, 5 each, 50 days (~5M)
+Any flag overrides the preset value.
+
+The schema comes from migrations.migrate(), then rows are bulk-inserted and
+the rollup and search tables rebuilt, so the result looks like a database
+that grew through the app. Every account's password is "pass"; usernames are
+admin, teacher1..N and student1..N. Courses alternate between two semesters,
+and roll calls fall on the school days of the course's own semester. Data
+is deterministic for a given seed.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import rollups  # noqa: E402
+import search  # noqa: E402
+from gradebook import GRADE_CATEGORIES  # noqa: E402
+from migrations import migrate  # noqa: E402
+from passwords import hash_password  # noqa: E402
+
+SCALES = {
+    "small": {"students": 500, "teachers": 10, "courses": 40, "courses_per_student": 4,
+              "days": 30, "categories": 3},
+    "medium": {"students": 5000, "teachers": 50, "courses": 200, "courses_per_student": 5,
+               "days": 60, "categories": 4},
+    "large": {"students": 20000, "teachers": 100, "courses": 400, "courses_per_student": 5,
+              "days": 50, "categories": 5},
+}
+PASSWORD = "pass"
+BATCH = 50000
+SUBJECTS = ["Mathematics", "Physics", "Chemistry", "Biology", "History", "Geography",
+            "Literature", "Computer Science", "Economics", "Art", "Music", "Philosophy"]
+FIRST_NAMES = ["Amina", "Ben", "Chen", "Dana", "Elif", "Farid", "Grace", "Hugo", "Ines",
+               "Jonas", "Kofi", "Lena", "Mateo", "Nadia", "Omar", "Priya", "Quinn", "Rosa"]
+LAST_NAMES = ["Ahmed", "Brown", "Costa", "Dubois", "Evans", "Fischer", "Garcia", "Hassan",
+              "Ivanova", "Jensen", "Khan", "Lopez", "Müller", "Nakamura", "Okafor", "Silva"]
+
+
+def semester_start(semester):
+    """First class day of a "2024 Fall" / "2025 Spring" semester."""
+    year, term = semester.split()
+    return date(int(year), 9, 2) if term == "Fall" else date(int(year), 1, 15)
+
+
+def school_days(first_day, count):
+    """The first `count` weekdays from `first_day`, as ISO dates."""
+    days, day = [], first_day
+    while len(days) < count:
+        if day.weekday() < 5:
+            days.append(day.isoformat())
+        day += timedelta(days=1)
+    return days
+
+
+def _insert_batched(conn, sql, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            conn.executemany(sql, batch)
+            batch.clear()
+    if batch:
+        conn.executemany(sql, batch)
+
+
+def generate(path, students, teachers, courses, courses_per_student, days, categories,
+             seed=1):
+    """Create `path` (replacing it) and fill it; returns a dict of row counts."""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    rng = random.Random(seed)
+    password = hash_password(PASSWORD)
+    courses_per_student = min(courses_per_student, courses)
+    categories = GRADE_CATEGORIES[:categories]
+
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    # A throwaway build: skip durability while loading
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -200000")
+
+    def name():
+        return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+    with conn:
+        conn.execute("INSERT INTO users (id, username, password, role, actual_name) "
+                     "VALUES (1, 'admin', ?, 'admin', 'Administrator')", (password,))
+        teacher_ids = list(range(2, teachers + 2))
+        conn.executemany(
+            "INSERT INTO users (id, username, password, role, actual_name) VALUES (?, ?, ?, 'teacher', ?)",
+            [(uid, f"teacher{i}", password, name()) for i, uid in enumerate(teacher_ids, 1)])
+        first_student = teachers + 2
+        _insert_batched(conn,
+            "INSERT INTO users (id, username, password, role, actual_name) VALUES (?, ?, ?, 'student', ?)",
+            ((first_student + i, f"student{i + 1}", password, name()) for i in range(students)))
+
+        conn.executemany(
+            "INSERT INTO courses (id, name, semester, teacher_id) VALUES (?, ?, ?, ?)",
+            [(i, f"{SUBJECTS[i % len(SUBJECTS)]} {100 + i}", f"{2024 + i % 2} {'Fall' if i % 2 else 'Spring'}",
+              teacher_ids[i % len(teacher_ids)]) for i in range(1, courses + 1)])
+
+        # Popular courses get more students (weights fall off like 1/rank)
+        course_ids = list(range(1, courses + 1))
+        weights = [1.0 / (1 + i * 0.05) for i in range(courses)]
+        enrollments = []
+        for i in range(students):
+            chosen = set()
+            while len(chosen) < courses_per_student:
+                chosen.update(rng.choices(course_ids, weights, k=courses_per_student - len(chosen)))
+            enrollments.extend((first_student + i, course_id) for course_id in sorted(chosen))
+        enrollments.sort(key=lambda e: e[1])  # enrolled course by course, like real sign-ups
+        _insert_batched(conn, "INSERT INTO enrollments (id, user_id, course_id) VALUES (?, ?, ?)",
+                        ((i, uid, cid) for i, (uid, cid) in enumerate(enrollments, 1)))
+
+        # Each enrollment: one roll call per school day, with a per-student attendance habit
+        habit = {first_student + i: rng.uniform(0.75, 0.99) for i in range(students)}
+        semesters = dict(conn.execute("SELECT id, semester FROM courses"))
+        dates = {course_id: school_days(semester_start(semester), days)
+                 for course_id, semester in semesters.items()}
+        _insert_batched(conn, "INSERT INTO attendance (enrollment_id, date, status) VALUES (?, ?, ?)",
+                        ((eid, day, "present" if rng.random() < habit[uid] else "absent")
+                         for eid, (uid, cid) in enumerate(enrollments, 1) for day in dates[cid]))
+
+        _insert_batched(conn, "INSERT INTO grades (enrollment_id, grade_value, category) VALUES (?, ?, ?)",
+                        ((eid, str(max(0, min(100, round(rng.gauss(65 + 30 * habit[uid] - 20, 12))))),
+                          category)
+                         for eid, (uid, _) in enumerate(enrollments, 1) for category in categories))
+
+        rollups.rebuild(conn)
+        search.rebuild(conn)
+
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA journal_mode = WAL")
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+              for table in ("users", "courses", "enrollments", "attendance", "grades")}
+    conn.close()
+    return counts
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Build a synthetic academy database.")
+    parser.add_argument("output")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    for option in ("students", "teachers", "courses", "courses_per_student", "days", "categories"):
+        parser.add_argument("--" + option.replace("_", "-"), type=int, dest=option)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    settings = dict(SCALES[args.scale])
+    settings.update({key: value for key, value in vars(args).items()
+                     if key in settings and value is not None})
+    start = time.perf_counter()
+    counts = generate(args.output, seed=args.seed, **settings)
+    print(f"Built {args.output} in {time.perf_counter() - start:.1f}s: "
+          + ", ".join(f"{count} {table}" for table, count in counts.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,245 @@
+"""
+Drive the hot routes through the Flask test client against a generated
+database and report latency, SQL statements per request and peak memory.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--scale small|medium|large] [--db FILE]
+        [--runs N] [--only NAME ...] [--save-baseline FILE] [--compare FILE]
+        [--tolerance 0.25]
+
+Without --db a database is generated at --scale (see generate_data.py);
+with --db a copy of FILE is used, so write scenarios never touch the
+original. Each scenario runs --runs times (after one warm-up) for p50/p95,
+then once more under tracemalloc for the peak Python memory of the request.
+Query counts come from the app's own per-request instrumentation (metrics.py).
+
+--compare checks the results against a stored baseline and exits 1 if a
+scenario regressed: p95 or peak memory more than --tolerance above the
+baseline (ignoring differences under NOISE_MS / NOISE_MB), or more SQL
+statements than before. benchmarks/baseline.json holds the small-scale
+baseline; latency baselines are machine-specific, so regenerate it with
+--save-baseline on the machine that runs the comparison.
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import generate_data  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+NOISE_MS = 5.0
+NOISE_MB = 1.0
+
+
+class Scenario:
+    def __init__(self, name, role, path, method="GET", data=None):
+        self.name = name
+        self.role = role
+        self.path = path
+        self.method = method
+        self.data = data  # None, a dict, or a callable(iteration) -> dict
+
+
+def pick_fixtures(db):
+    """Ids the scenarios use: the busiest course, one of its students, a teacher."""
+    course_id = db.execute("""
+        SELECT course_id FROM enrollments GROUP BY course_id ORDER BY COUNT(*) DESC, course_id LIMIT 1
+    """).fetchone()[0]
+    enrollment_ids = [row[0] for row in db.execute(
+        "SELECT id FROM enrollments WHERE course_id = ? ORDER BY id", (course_id,))]
+    student_id = db.execute("""
+        SELECT user_id FROM enrollments GROUP BY user_id ORDER BY COUNT(*) DESC, user_id LIMIT 1
+    """).fetchone()[0]
+    teacher_id = db.execute("SELECT id FROM users WHERE role = 'teacher' ORDER BY id LIMIT 1").fetchone()[0]
+    last_day = db.execute("SELECT MAX(date) FROM attendance").fetchone()[0] or "2024-09-01"
+    return {"course_id": course_id, "enrollment_ids": enrollment_ids, "student_id": student_id,
+            "teacher_id": teacher_id, "last_day": last_day}
+
+
+def scenarios(fx):
+    course_id, enrollment_ids = fx["course_id"], fx["enrollment_ids"]
+    first_day = date.fromisoformat(fx["last_day"]) + timedelta(days=1)
+
+    def grade_form(iteration):
+        # Alternate the values so every submission really writes
+        return {f"grade_{eid}_{category}": str(60 + (eid + iteration) % 40)
+                for eid in enrollment_ids for category in ("Assignment", "Quiz")}
+
+    def roll_call_form(iteration):
+        form = {f"status_{eid}": "present" if (eid + iteration) % 9 else "absent"
+                for eid in enrollment_ids}
+        form["attendance_date"] = (first_day + timedelta(days=iteration)).isoformat()
+        return form
+
+    return [
+        Scenario("teacher_all_attendance", "teacher", "/teacher/all_attendance"),
+        Scenario("teacher_all_attendance_course", "teacher",
+                 f"/teacher/all_attendance?course_id={course_id}&status=absent"),
+        Scenario("teacher_all_attendance_csv", "teacher",
+                 f"/teacher/all_attendance.csv?course_id={course_id}"),
+        Scenario("course_grades", "teacher", f"/teacher/course_grades/{course_id}"),
+        Scenario("submit_grades", "teacher", f"/teacher/submit_grades/{course_id}", "POST", grade_form),
+        Scenario("course_attendance", "teacher", f"/teacher/course_attendance/{course_id}"),
+        Scenario("process_attendance", "teacher", f"/teacher/process_attendance/{course_id}",
+                 "POST", roll_call_form),
+        Scenario("student_dashboard", "student", "/student/dashboard"),
+        Scenario("my_attendance", "student", "/student/my_attendance"),
+        Scenario("my_grades", "student", "/student/my_grades"),
+        Scenario("my_enrollments", "student", "/my_enrollments"),
+        Scenario("courses", "student", "/courses"),
+        Scenario("search", "student", "/search?q=Mathematics"),
+    ]
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_suite(database, runs, only=None):
+    os.environ["DATABASE_URL"] = database
+    import app as academy  # DATABASE_URL must be set first
+    from metrics import metrics
+
+    with academy.app.app_context():
+        fx = pick_fixtures(academy.get_db())
+    users = {"teacher": fx["teacher_id"], "student": fx["student_id"]}
+    client = academy.app.test_client()
+    urls = academy.app.url_map.bind("localhost")
+    iteration = [0]
+
+    def request(scenario):
+        data = scenario.data(iteration[0]) if callable(scenario.data) else scenario.data
+        iteration[0] += 1
+        with client.session_transaction() as session:
+            session["user_id"] = users[scenario.role]
+            session["role"] = scenario.role
+        response = client.open(scenario.path, method=scenario.method, data=data)
+        response.get_data()  # consume streamed bodies
+        if response.status_code >= 400:
+            raise RuntimeError(f"{scenario.name}: HTTP {response.status_code}")
+        return response
+
+    def queries_of(endpoint):
+        entry = metrics._endpoints.get(endpoint)
+        return entry["queries"].total if entry else 0
+
+    results = {}
+    for scenario in scenarios(fx):
+        if only and scenario.name not in only:
+            continue
+        request(scenario)  # warm-up: template compile, caches, page cache
+        endpoint, _ = urls.match(scenario.path.split("?")[0], method=scenario.method)
+        timings, queries = [], []
+        for _ in range(runs):
+            before = queries_of(endpoint)
+            start = time.perf_counter()
+            request(scenario)
+            timings.append((time.perf_counter() - start) * 1000)
+            queries.append(queries_of(endpoint) - before)
+
+        tracemalloc.start()
+        request(scenario)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results[scenario.name] = {
+            "p50_ms": round(statistics.median(timings), 2),
+            "p95_ms": round(_percentile(timings, 95), 2),
+            "queries": int(max(queries)),
+            "peak_mb": round(peak / 1e6, 2),
+        }
+    return results, fx
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of human-readable regressions against `baseline`."""
+    problems = []
+    for name, now in results.items():
+        then = baseline["results"].get(name)
+        if then is None:
+            continue
+        if now["p95_ms"] > then["p95_ms"] * (1 + tolerance) and now["p95_ms"] - then["p95_ms"] > NOISE_MS:
+            problems.append(f"{name}: p95 {then['p95_ms']} -> {now['p95_ms']} ms")
+        if now["queries"] > then["queries"]:
+            problems.append(f"{name}: queries per request {then['queries']} -> {now['queries']}")
+        if now["peak_mb"] > then["peak_mb"] * (1 + tolerance) and now["peak_mb"] - then["peak_mb"] > NOISE_MB:
+            problems.append(f"{name}: peak memory {then['peak_mb']} -> {now['peak_mb']} MB")
+    return problems
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the hot routes.")
+    parser.add_argument("--scale", choices=sorted(generate_data.SCALES), default="small")
+    parser.add_argument("--db", help="existing database to copy instead of generating one")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--only", nargs="+", help="scenario names to run")
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--compare", metavar="FILE")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    baseline_out = args.save_baseline and os.path.abspath(args.save_baseline)
+    baseline_in = args.compare and os.path.abspath(args.compare)
+    work_dir = tempfile.mkdtemp(prefix="academy_bench_")
+    database = os.path.join(work_dir, "academy.db")
+    if args.db:
+        shutil.copy(os.path.abspath(args.db), database)
+        conn = sqlite3.connect(database)
+        migrate(conn)  # a database from an older checkout
+        conn.close()
+        counts = None
+    else:
+        start = time.perf_counter()
+        counts = generate_data.generate(database, **generate_data.SCALES[args.scale])
+        print(f"Generated {args.scale} database in {time.perf_counter() - start:.1f}s: "
+              + ", ".join(f"{count} {table}" for table, count in counts.items()))
+    # Uploads, profiles and the shared cache go to the work directory too
+    os.chdir(work_dir)
+
+    results, fx = run_suite(database, args.runs, args.only)
+    print(f"\nBusiest course {fx['course_id']} ({len(fx['enrollment_ids'])} students), "
+          f"{args.runs} runs per scenario\n")
+    print(f"{'scenario':32} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'peak MB':>8}")
+    for name, r in results.items():
+        print(f"{name:32} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} {r['queries']:8d} {r['peak_mb']:8.2f}")
+
+    status = 0
+    if baseline_in:
+        with open(baseline_in) as f:
+            baseline = json.load(f)
+        if baseline.get("scale") != (None if args.db else args.scale):
+            print(f"\nWarning: baseline was recorded at scale {baseline.get('scale')!r}")
+        problems = compare(results, baseline, args.tolerance)
+        if problems:
+            print("\nRegressions against", args.compare)
+            for problem in problems:
+                print("  " + problem)
+            status = 1
+        else:
+            print(f"\nNo regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+    if baseline_out:
+        with open(baseline_out, "w") as f:
+            json.dump({"scale": None if args.db else args.scale, "rows": counts,
+                       "runs": args.runs, "python": sys.version.split()[0],
+                       "results": results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,266 @@
+"""
+Cache layer with pluggable backends and versioned namespaces.
+
+Backends implement a Redis-like key/value interface (get, set with a TTL,
+delete, incr), so a Redis backend can be added later by subclassing
+CacheBackend, implementing those four methods (a backend missing one cannot
+be instantiated) and registering it in BACKENDS:
+
+* MemoryBackend  - per-process TTL + LRU dict; fastest, but every gunicorn
+                   worker keeps its own copy.
+* SQLiteBackend  - one small SQLite file on the local box shared by all
+                   worker processes.
+
+Invalidation never deletes entries. Each namespace has a version counter
+stored in the backend, and entries are keyed by that version, so bumping
+the counter in one worker makes every worker miss on its next lookup.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class CacheBackend(ABC):
+    """Interface every backend implements."""
+
+    name = "base"
+
+    @abstractmethod
+    def get(self, key):
+        """Return the stored value, or MISSING if absent or expired."""
+
+    @abstractmethod
+    def set(self, key, value, ttl=None):
+        """Store value; ttl is in seconds, None means no expiry."""
+
+    @abstractmethod
+    def delete(self, key):
+        """Remove key if present."""
+
+    @abstractmethod
+    def incr(self, key):
+        """Atomically increment an integer counter (created at 0) and return it."""
+
+    def stats(self):
+        return {"backend": self.name}
+
+
+class MemoryBackend(CacheBackend):
+    """In-process dict with TTL expiry and LRU eviction."""
+
+    name = "memory"
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # key -> (expires_at or None, value)
+        self._counters = {}  # kept apart so LRU eviction never resets a version
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def stats(self):
+        with self._lock:
+            return {"backend": self.name, "entries": len(self._data),
+                    "maxsize": self.maxsize, "evictions": self.evictions}
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Cache entries in a local SQLite file shared by every worker process.
+    Values are pickled; expired and surplus entries are pruned as sets happen.
+    """
+
+    name = "sqlite"
+    PRUNE_EVERY = 100  # sets between prune passes
+
+    def __init__(self, path, maxsize=10000, busy_timeout_ms=2000):
+        self.path = path
+        self.maxsize = maxsize
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._sets = 0
+        self.evictions = 0
+        with self._conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires_at REAL
+                )""")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000.0)
+            conn.execute("PRAGMA journal_mode = WAL")
+            # Cached data can always be rebuilt, so skip fsyncs entirely.
+            conn.execute("PRAGMA synchronous = OFF")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return MISSING
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires_at),
+            )
+        self._sets += 1
+        if self._sets % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def delete(self, key):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def incr(self, key):
+        conn = self._conn()
+        # Take the write lock before reading so concurrent workers cannot both
+        # read the same version and lose an increment.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            value = self._peek_int(conn, key) + 1
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, NULL)",
+                (key, pickle.dumps(value)),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return value
+
+    def _peek_int(self, conn, key):
+        row = conn.execute("SELECT value FROM cache_entries WHERE key = ?", (key,)).fetchone()
+        return pickle.loads(row[0]) if row else 0
+
+    def prune(self):
+        """Drop expired entries, then the oldest expiring ones beyond maxsize."""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),))
+            surplus = conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0] - self.maxsize
+            if surplus > 0:
+                conn.execute("""
+                    DELETE FROM cache_entries WHERE key IN (
+                        SELECT key FROM cache_entries WHERE expires_at IS NOT NULL
+                      ORDER BY expires_at LIMIT ?)
+                """, (surplus,))
+                self.evictions += surplus
+
+    def stats(self):
+        entries = self._conn().execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+        return {"backend": self.name, "path": self.path, "entries": entries,
+                "maxsize": self.maxsize, "evictions": self.evictions}
+
+
+BACKENDS = {
+    "memory": MemoryBackend,
+    "sqlite": SQLiteBackend,
+}
+
+
+def create_backend(name, **options):
+    """Build a backend by name, e.g. create_backend("sqlite", path="cache.db")."""
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown cache backend {name!r}; choose from {sorted(BACKENDS)}")
+    return backend_class(**options)
+
+
+class Cache:
+    """Read-through cache over a backend, with per-namespace invalidation."""
+
+    def __init__(self, backend, ttl=60.0):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _key(self, namespace, key):
+        version = self.backend.get(f"ns:{namespace}")
+        return f"{namespace}:v{0 if version is MISSING else version}:{key}"
+
+    def get_or_load(self, namespace, key, loader):
+        """Return the cached value, calling loader() to fill it on a miss."""
+        full_key = self._key(namespace, key)
+        value = self.backend.get(full_key)
+        with self._lock:
+            if value is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is MISSING:
+            value = loader()
+            self.backend.set(full_key, value, self.ttl)
+        return value
+
+    def invalidate(self, namespace):
+        """Make every entry in the namespace stale, in all processes sharing the backend."""
+        self.backend.incr(f"ns:{namespace}")
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+        stats.update(self.backend.stats())
+        return stats
@@ -0,0 +1,70 @@
+"""
+Cached reads of the course catalog and teacher list.
+
+Rows are returned as plain dicts so they can be pickled by shared backends
+and outlive the connection that loaded them. Every route that changes
+courses or users must call the matching invalidate_*() after committing.
+
+CACHE_BACKEND selects the backend: "sqlite" (default; shared by all worker
+processes, and by CLIs such as semester_archive, through the file at
+CACHE_PATH, by default next to the database) or "memory" (per process, so
+an invalidation only reaches the process that made it; for a single
+worker).
+"""
+import os
+
+from cache import Cache, create_backend
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")
+
+
+def default_cache_path(database):
+    """academy.db -> academy_cache.db, so each database has its own cache."""
+    return os.path.splitext(database)[0] + "_cache.db"
+
+
+def _backend_from_env(database=None):
+    name = CACHE_BACKEND
+    if name == "sqlite":
+        database = database or os.getenv("DATABASE_URL", "academy.db")
+        return create_backend(
+            "sqlite",
+            path=os.getenv("CACHE_PATH") or default_cache_path(database),
+            maxsize=int(os.getenv("CATALOG_CACHE_SIZE", "10000")),
+        )
+    return create_backend(name, maxsize=int(os.getenv("CATALOG_CACHE_SIZE", "128")))
+
+
+COURSES_SQL = "SELECT id, name, semester, teacher_id FROM courses"
+TEACHERS_SQL = "SELECT id, username, actual_name FROM users WHERE role = 'teacher'"
+
+catalog_cache = Cache(_backend_from_env(), ttl=float(os.getenv("CATALOG_CACHE_TTL", "60")))
+
+
+def get_courses(db):
+    """All courses (id, name, semester, teacher_id)."""
+    return catalog_cache.get_or_load("courses", "all", lambda: [
+        dict(row) for row in
+        db.execute(COURSES_SQL)
+    ])
+
+
+def get_teachers(db):
+    """All teacher accounts, without passwords."""
+    return catalog_cache.get_or_load("teachers", "all", lambda: [
+        dict(row) for row in
+        db.execute(TEACHERS_SQL)
+    ])
+
+
+def use_database(database):
+    """Use the cache of `database` (for CLIs given --db instead of DATABASE_URL)."""
+    catalog_cache.backend = _backend_from_env(database)
+
+
+def invalidate_courses():
+    catalog_cache.invalidate("courses")
+
+
+def invalidate_teachers():
+    catalog_cache.invalidate("teachers")
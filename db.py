@@ -0,0 +1,201 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from urllib.parse import quote
+
+# PRAGMAs applied to every pooled connection when it is opened.
+# WAL lets readers proceed while a writer commits; NORMAL sync is safe under WAL.
+DEFAULT_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -16000),        # negative = KiB, so ~16 MB page cache
+    ("mmap_size", 134217728),      # 128 MB memory-mapped reads
+    ("temp_store", "MEMORY"),
+)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    A small thread-safe pool of SQLite connections for one process.
+
+    Connections are opened up front (pre-warmed) with the PRAGMAs above and
+    handed out LIFO so the hottest page cache gets reused. If the process
+    forks (gunicorn preload), the child notices the PID change and builds
+    its own connections instead of sharing the parent's file handles.
+    With read_only=True connections are opened with mode=ro and query_only,
+    for code paths that must never write.
+    """
+
+    def __init__(self, database, size=5, timeout=10.0, busy_timeout_ms=5000,
+                 pragmas=DEFAULT_PRAGMAS, factory=sqlite3.Connection, read_only=False):
+        self.database = database
+        self.factory = factory
+        self.read_only = read_only
+        self.size = size
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.pragmas = pragmas
+        self._lock = threading.Lock()
+        self._pid = None
+        self._idle = None
+        self._opened = 0
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._checkouts = 0
+        self._in_use = 0
+        self._high_water = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+
+    def _connect(self):
+        database, pragmas = self.database, self.pragmas
+        if self.read_only:
+            # Opened read-only by SQLite itself; the journal mode is the writers' business
+            database = f"file:{quote(os.path.abspath(database))}?mode=ro"
+            pragmas = [(name, value) for name, value in pragmas
+                       if name not in ("journal_mode", "synchronous")]
+            pragmas.append(("query_only", "ON"))
+        conn = sqlite3.connect(
+            database,
+            timeout=self.busy_timeout_ms / 1000.0,
+            check_same_thread=False,
+            factory=self.factory,
+            uri=self.read_only,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        for name, value in pragmas:
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _ensure_process(self):
+        """(Re)build the idle queue if this is a new process."""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            # Connections inherited across fork must not be used; just drop them.
+            self._idle = queue.LifoQueue()
+            self._opened = 0
+            self._reset_stats()
+            for _ in range(self.size):
+                self._idle.put(self._connect())
+                self._opened += 1
+            self._pid = pid
+
+    def acquire(self):
+        """Check out a connection, waiting up to `timeout` seconds for one."""
+        self._ensure_process()
+        start = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeout(
+                f"No database connection free after {self.timeout}s "
+                f"(pool size {self.size})"
+            )
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+            self._high_water = max(self._high_water, self._in_use)
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back any open transaction."""
+        if self._pid != os.getpid():
+            conn.close()
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # A broken connection is replaced instead of being reused.
+            conn.close()
+            conn = self._connect()
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(conn)
+
+    def stats(self):
+        """Snapshot of pool usage counters, e.g. for sizing under load."""
+        self._ensure_process()
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                "pid": self._pid,
+                "size": self.size,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "checkouts": checkouts,
+                "high_water": self._high_water,
+                "timeouts": self._timeouts,
+                "wait_total_ms": round(self._wait_total * 1000, 3),
+                "wait_avg_ms": round(self._wait_total * 1000 / checkouts, 3) if checkouts else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+            }
+
+    def close_all(self):
+        """Close every idle connection (used at shutdown and in scripts)."""
+        if self._idle is None:
+            return
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._pid = None
+
+
+def iter_rows(cursor, chunk_size=500):
+    """Iterate a cursor in fetchmany() chunks instead of loading it with fetchall()."""
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+
+# Stay well below SQLITE_MAX_VARIABLE_NUMBER (999 on older builds)
+IN_CHUNK_SIZE = 500
+
+
+def _chunks(values, chunk_size):
+    values = list(dict.fromkeys(values))  # de-duplicate, keep order
+    for start in range(0, len(values), chunk_size):
+        yield values[start:start + chunk_size]
+
+
+def fetch_in(db, sql, values, params=(), chunk_size=IN_CHUNK_SIZE):
+    """
+    Run a SELECT whose "{marks}" placeholder is an IN list over `values`.
+
+    The list is bound as parameters (never formatted into the SQL) and split
+    into chunks, so each chunk size maps to one cached prepared statement.
+    `params` are bound before the IN list. Returns all rows.
+    """
+    rows = []
+    for chunk in _chunks(values, chunk_size):
+        statement = sql.format(marks=",".join("?" * len(chunk)))
+        rows.extend(db.execute(statement, (*params, *chunk)).fetchall())
+    return rows
+
+
+def execute_in(db, sql, values, params=(), chunk_size=IN_CHUNK_SIZE):
+    """Like fetch_in(), for statements that write instead of returning rows."""
+    for chunk in _chunks(values, chunk_size):
+        db.execute(sql.format(marks=",".join("?" * len(chunk))), (*params, *chunk))
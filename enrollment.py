@@ -0,0 +1,118 @@
+"""
+Set-based enrollment of whole cohorts into courses.
+
+enrollments has a UNIQUE (user_id, course_id) index (migration 5), so every
+insert here is INSERT OR IGNORE: re-running a load, or a student double-
+clicking "Enroll", never creates a duplicate row.
+
+A cohort is picked by an explicit username list, by a username prefix
+(e.g. "cs2026_"), by membership of an existing course, or any mix of these
+(the filters are ANDed). The whole load, for every selected course, is one
+INSERT ... SELECT inside one transaction.
+"""
+
+# Usernames are staged in a per-connection temp table rather than an IN list,
+# so a 10k-name cohort is still a single join.
+_STAGE_TABLE = "temp.bulk_enroll_usernames"
+
+ENROLLMENT_SQL = "SELECT e.id FROM enrollments e WHERE e.course_id = ? AND e.user_id = ?"
+
+# A student's courses with the attendance summary from enrollment_rollups
+STUDENT_COURSES_SQL = """
+    SELECT e.course_id, c.name AS course_name, c.semester,
+           r.present_count, r.absent_count, r.last_seen
+      FROM enrollments e
+      JOIN courses c ON e.course_id = c.id
+      LEFT JOIN enrollment_rollups r ON r.enrollment_id = e.id
+     WHERE e.user_id = ?
+"""
+
+
+class EnrollmentError(ValueError):
+    """The bulk enrollment request cannot be applied."""
+
+
+def enroll_student(db, user_id, course_id):
+    """Enroll one student; returns False if they were already enrolled."""
+    with db:
+        cur = db.execute(
+            "INSERT OR IGNORE INTO enrollments (user_id, course_id) VALUES (?, ?)",
+            (user_id, course_id),
+        )
+    return cur.rowcount == 1
+
+
+def parse_usernames(text):
+    """Split a pasted list (newlines, commas or spaces) into unique usernames."""
+    names = text.replace(",", " ").split()
+    return list(dict.fromkeys(names))
+
+
+def _cohort_filter(db, usernames, username_prefix, from_course_id):
+    """Return (joins, where, params) over users u that select the cohort."""
+    joins, where, params = [], ["u.role = 'student'"], []
+    if usernames is not None:
+        db.execute("CREATE TEMP TABLE IF NOT EXISTS bulk_enroll_usernames "
+                   "(username TEXT PRIMARY KEY)")
+        db.execute(f"DELETE FROM {_STAGE_TABLE}")
+        db.executemany(f"INSERT OR IGNORE INTO {_STAGE_TABLE} (username) VALUES (?)",
+                       ((name,) for name in usernames))
+        joins.append(f"JOIN {_STAGE_TABLE} s ON s.username = u.username")
+    if username_prefix:
+        # substr() instead of LIKE so "_" and "%" in the prefix are literal
+        where.append("substr(u.username, 1, ?) = ?")
+        params += [len(username_prefix), username_prefix]
+    if from_course_id is not None:
+        where.append("EXISTS (SELECT 1 FROM enrollments f "
+                     "WHERE f.user_id = u.id AND f.course_id = ?)")
+        params.append(from_course_id)
+    return " ".join(joins), " AND ".join(where), params
+
+
+def bulk_enroll(db, course_ids, usernames=None, username_prefix=None, from_course_id=None):
+    """
+    Enroll every student matched by the filters into each of `course_ids`,
+    in one transaction.
+
+    Returns {"students", "pairs", "enrolled", "already_enrolled",
+    "unknown_usernames"}. Names in `usernames` that are not student accounts
+    are listed in unknown_usernames and otherwise ignored.
+    """
+    course_ids = sorted(set(int(c) for c in course_ids))
+    if not course_ids:
+        raise EnrollmentError("Select at least one course.")
+    if usernames is None and not username_prefix and from_course_id is None:
+        raise EnrollmentError("Give a list of usernames or at least one filter.")
+
+    marks = ",".join("?" * len(course_ids))
+    found = {row[0] for row in db.execute(f"SELECT id FROM courses WHERE id IN ({marks})",
+                                          course_ids)}
+    missing = [c for c in course_ids if c not in found]
+    if missing:
+        raise EnrollmentError(f"Unknown course id(s): {', '.join(map(str, missing))}")
+
+    with db:
+        joins, where, params = _cohort_filter(db, usernames, username_prefix, from_course_id)
+        students = db.execute(f"SELECT COUNT(*) FROM users u {joins} WHERE {where}",
+                              params).fetchone()[0]
+        cur = db.execute(f"""
+            INSERT OR IGNORE INTO enrollments (user_id, course_id)
+            SELECT u.id, c.id
+              FROM users u {joins}
+              JOIN courses c ON c.id IN ({marks})
+             WHERE {where}
+        """, (*course_ids, *params))
+        enrolled = cur.rowcount
+        unknown = []
+        if usernames is not None:
+            unknown = [row[0] for row in db.execute(f"""
+                SELECT s.username FROM {_STAGE_TABLE} s
+                 WHERE NOT EXISTS (SELECT 1 FROM users u
+                                    WHERE u.username = s.username AND u.role = 'student')
+              ORDER BY s.username
+            """)]
+            db.execute(f"DELETE FROM {_STAGE_TABLE}")
+
+    pairs = students * len(course_ids)
+    return {"students": students, "pairs": pairs, "enrolled": enrolled,
+            "already_enrolled": pairs - enrolled, "unknown_usernames": unknown}
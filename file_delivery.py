@@ -0,0 +1,96 @@
+"""
+Delivery of uploaded course files.
+
+Every response carries an ETag and Last-Modified taken from the file's
+size and modification time, so a repeat download is answered with a bodiless
+304 and a resumed or partial download (Range / If-Range) gets a 206 with
+just the requested bytes.
+
+Modes (FILE_DELIVERY):
+    direct      the app sends the file through werkzeug's send_file, which
+                hands it to the server's wsgi.file_wrapper (gunicorn uses
+                sendfile(2) for full responses).
+    x-accel     nginx: the app only checks access and replies with an
+                X-Accel-Redirect to an `internal` location that serves
+                UPLOAD_FOLDER, e.g.
+                    location /protected-uploads/ { internal; alias /srv/academy/uploads/; }
+    x-sendfile  Apache mod_xsendfile / lighttpd: same, with X-Sendfile and
+                the absolute path.
+In the proxy modes the worker is free as soon as the headers are written.
+"""
+import os
+from urllib.parse import quote
+
+from flask import current_app, request, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.http import http_date, is_resource_modified
+
+DELIVERY_MODES = ("direct", "x-accel", "x-sendfile")
+
+
+def file_etag(stat):
+    """Strong validator from size and mtime; changes whenever the file is replaced."""
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def _private_cache(response, max_age):
+    # Files sit behind a login, so shared caches must not keep them.
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    return response
+
+
+def _proxy_response(path, stat, download_name, mode, mimetype, max_age, as_attachment):
+    etag = file_etag(stat)
+    response = current_app.response_class(mimetype=mimetype)
+    response.set_etag(etag)
+    response.last_modified = stat.st_mtime
+    if not is_resource_modified(request.environ, etag=etag, last_modified=http_date(stat.st_mtime)):
+        # Answer revalidations here; no need to involve the proxy at all.
+        response.status_code = 304
+        return _private_cache(response, max_age)
+
+    response.headers["Content-Disposition"] = (
+        f"{'attachment' if as_attachment else 'inline'}; filename*=UTF-8''{quote(download_name)}"
+    )
+    if mode == "x-accel":
+        root = os.path.abspath(current_app.config["UPLOAD_FOLDER"])
+        relative = os.path.relpath(os.path.abspath(path), root)
+        if relative.startswith(os.pardir):
+            raise NotFound()
+        prefix = current_app.config["FILE_DELIVERY_PREFIX"].rstrip("/")
+        response.headers["X-Accel-Redirect"] = f"{prefix}/{quote(relative.replace(os.sep, '/'))}"
+    else:
+        response.headers["X-Sendfile"] = os.path.abspath(path)
+    return _private_cache(response, max_age)
+
+
+def serve_file(path, download_name=None, mimetype="application/pdf", as_attachment=True):
+    """
+    Return a response delivering `path` (as an attachment by default), honouring
+    If-None-Match / If-Modified-Since (304) and Range / If-Range (206).
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise NotFound()
+    download_name = download_name or os.path.basename(path)
+    mode = current_app.config["FILE_DELIVERY"]
+    max_age = current_app.config["RESOURCE_MAX_AGE"]
+
+    if mode in ("x-accel", "x-sendfile"):
+        return _proxy_response(path, stat, download_name, mode, mimetype, max_age,
+                               as_attachment)
+
+    response = send_file(
+        os.path.abspath(path),
+        mimetype=mimetype,
+        as_attachment=as_attachment,
+        download_name=download_name,
+        conditional=True,
+        etag=file_etag(stat),
+        last_modified=stat.st_mtime,
+        max_age=max_age,
+    )
+    return _private_cache(response, max_age)
@@ -0,0 +1,145 @@
+"""
+Batched grade writes for the teacher gradebook.
+
+The gradebook form posts one field per cell, named
+"grade_<enrollment_id>_<category>". Instead of a SELECT plus UPDATE/INSERT
+per cell, the whole form is parsed and validated once, compared against the
+course's current grades in memory, and only the changed cells are written
+with a single executemany upsert (plus one delete for cells blanked out).
+"""
+
+from rollups import refresh_enrollments
+
+GRADE_CATEGORIES = ("Assignment", "Quiz", "Project", "Midterm", "Final")
+MAX_GRADE_LENGTH = 20
+
+COURSE_ENROLLMENT_IDS_SQL = "SELECT id FROM enrollments WHERE course_id = ?"
+
+# Every enrollment of a course with its grades (if any) alongside, one row
+# per grade; group_grades() collapses them into one entry per enrollment
+COURSE_GRADES_SQL = """
+    SELECT e.id AS enrollment_id, u.username, u.actual_name, g.category, g.grade_value
+      FROM enrollments e
+      JOIN users u ON e.user_id = u.id
+      LEFT JOIN grades g ON g.enrollment_id = e.id
+     WHERE e.course_id = ?
+  ORDER BY e.id
+"""
+
+# The same for every course a student is enrolled in
+STUDENT_GRADES_SQL = """
+    SELECT e.id AS enrollment_id, c.name AS course_name, c.semester,
+           g.category, g.grade_value
+      FROM enrollments e
+      JOIN courses c ON e.course_id = c.id
+      LEFT JOIN grades g ON g.enrollment_id = e.id
+     WHERE e.user_id = ?
+  ORDER BY e.id
+"""
+
+
+class GradeFormError(ValueError):
+    """The submitted gradebook contains a field that cannot be applied."""
+
+
+def parse_grade_form(form):
+    """
+    Turn the posted form into {(enrollment_id, category): grade_value}.
+    Blank cells map to None: apply_grades() deletes the grade if there is
+    one, so blanks clear mistakes but never create empty grade rows.
+    """
+    grades = {}
+    for key, value in form.items():
+        if not key.startswith("grade_"):
+            continue
+        parts = key.split("_", 2)  # ["grade", "5", "Assignment"]
+        if len(parts) < 3 or not parts[1].isdigit():
+            raise GradeFormError(f"Malformed grade field: {key}")
+        category = parts[2]
+        if category not in GRADE_CATEGORIES:
+            raise GradeFormError(f"Unknown grade category: {category}")
+        value = value.strip()
+        if not value:
+            grades[(int(parts[1]), category)] = None
+            continue
+        if len(value) > MAX_GRADE_LENGTH:
+            raise GradeFormError(f"Grade too long for {key}")
+        grades[(int(parts[1]), category)] = value
+    return grades
+
+
+def apply_grades(db, course_id, grades):
+    """
+    Write the parsed grades for one course in a single transaction.
+
+    Returns a summary dict with the number of rows inserted, updated,
+    cleared (blank cell over an existing grade) and left unchanged.
+    Resubmitting an identical gradebook writes nothing.
+    """
+    enrollment_ids = {
+        row["id"] for row in
+        db.execute(COURSE_ENROLLMENT_IDS_SQL, (course_id,))
+    }
+    unknown = {eid for eid, _ in grades} - enrollment_ids
+    if unknown:
+        raise GradeFormError(
+            f"Enrollment(s) not in this course: {', '.join(map(str, sorted(unknown)))}"
+        )
+
+    existing = {
+        (row["enrollment_id"], row["category"]): row["grade_value"]
+        for row in db.execute("""
+            SELECT g.enrollment_id, g.category, g.grade_value
+              FROM grades g
+              JOIN enrollments e ON g.enrollment_id = e.id
+             WHERE e.course_id = ?
+        """, (course_id,))
+    }
+
+    summary = {"inserted": 0, "updated": 0, "cleared": 0, "unchanged": 0}
+    changes, cleared = [], []
+    for (enrollment_id, category), value in grades.items():
+        current = existing.get((enrollment_id, category))
+        if current == value:
+            summary["unchanged"] += 1
+        elif value is None:
+            summary["cleared"] += 1
+            cleared.append((enrollment_id, category))
+        else:
+            summary["inserted" if current is None else "updated"] += 1
+            changes.append((enrollment_id, category, value))
+
+    if changes or cleared:
+        with db:
+            if changes:
+                db.executemany("""
+                    INSERT INTO grades (enrollment_id, category, grade_value)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(enrollment_id, category)
+                    DO UPDATE SET grade_value = excluded.grade_value
+                """, changes)
+            if cleared:
+                db.executemany("DELETE FROM grades WHERE enrollment_id = ? AND category = ?",
+                               cleared)
+            refresh_enrollments(db, {enrollment_id for enrollment_id, *_ in changes + cleared})
+    return summary
+
+
+def group_grades(rows):
+    """
+    Collapse rows of an enrollments LEFT JOIN grades query, ordered by
+    enrollment_id, into one dict per enrollment with a {category: value}
+    "grades" mapping. Works lazily, so it can feed a streamed page.
+    """
+    current = None
+    for row in rows:
+        if current is None or current["enrollment_id"] != row["enrollment_id"]:
+            if current is not None:
+                yield current
+            current = {key: row[key] for key in row.keys()
+                       if key not in ("category", "grade_value")}
+            current["grades"] = {}
+        if row["category"] is not None:
+            current["grades"][row["category"]] = row["grade_value"]
+    if current is not None:
+        yield current
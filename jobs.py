@@ -0,0 +1,272 @@
+"""
+A small SQLite-backed job queue and worker.
+
+Web requests only enqueue(); separate worker processes claim jobs from the
+`jobs` table, run the handler registered for the job's kind, and record
+progress, success or failure. A failed job is retried with exponential
+backoff until max_attempts, then left as 'failed' with its last error (and
+the kind's failure_handler, if any, settles whatever the job was for). A
+job whose worker died mid-run is requeued once its lease expires.
+
+Finished ('done' or 'failed') jobs are kept for JOB_RETENTION_DAYS so their
+outcome can still be shown, then deleted by the workers (at most every
+JOB_PURGE_INTERVAL seconds) or by `python jobs.py purge`.
+
+Claiming is a single UPDATE ... RETURNING under SQLite's write lock, so any
+number of worker processes can share one database without double-running.
+
+Usage:
+    python jobs.py work [--processes 2] [--db academy.db]   # run workers
+    python jobs.py status [--db academy.db]                 # counts per status
+    python jobs.py purge [--days 7] [--db academy.db]       # delete old finished jobs
+"""
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+import traceback
+
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "5"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", "7"))
+JOB_PURGE_INTERVAL = float(os.getenv("JOB_PURGE_INTERVAL", "3600"))
+
+CREATE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL DEFAULT '{}',   -- JSON
+        status TEXT NOT NULL DEFAULT 'queued',
+        -- 'queued', 'running', 'done' or 'failed'
+        progress INTEGER NOT NULL DEFAULT 0,  -- 0..100
+        message TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        run_after REAL NOT NULL,              -- unix time
+        locked_at REAL,
+        worker TEXT,
+        created_at REAL NOT NULL,
+        finished_at REAL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs(status, run_after)",
+]
+
+# kind -> handler(db, payload, report); report(progress, message) updates the job row
+HANDLERS = {}
+# kind -> on_failure(db, payload, error), run in the transaction that marks a job 'failed'
+FAILURE_HANDLERS = {}
+
+
+def handler(kind):
+    """Register the decorated function as the handler for jobs of `kind`."""
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def failure_handler(kind):
+    """Register the decorated function to clean up after a job of `kind` fails for good."""
+    def decorator(func):
+        FAILURE_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def create_tables(conn):
+    for sql in CREATE_TABLES:
+        conn.execute(sql)
+
+
+def enqueue(db, kind, payload, max_attempts=JOB_MAX_ATTEMPTS, delay=0):
+    """Insert a queued job and return its id. The caller commits."""
+    now = time.time()
+    return db.execute("""
+        INSERT INTO jobs (kind, payload, max_attempts, run_after, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (kind, json.dumps(payload), max_attempts, now + delay, now)).lastrowid
+
+
+def enqueue_unique(db, kind, payload, max_attempts=JOB_MAX_ATTEMPTS, delay=0):
+    """
+    Like enqueue(), unless a job of `kind` is already queued (for handlers
+    that process whatever is outstanding, so one waiting run is enough).
+    The caller commits.
+    """
+    now = time.time()
+    db.execute("""
+        INSERT INTO jobs (kind, payload, max_attempts, run_after, created_at)
+        SELECT ?, ?, ?, ?, ?
+         WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE status = 'queued' AND kind = ?)
+    """, (kind, json.dumps(payload), max_attempts, now + delay, now, kind))
+
+
+# Takes the oldest runnable job; served by idx_jobs_status_run_after
+CLAIM_SQL = """
+    UPDATE jobs
+       SET status = 'running', attempts = attempts + 1, progress = 0,
+           locked_at = ?, worker = ?, message = NULL
+     WHERE id = (SELECT id FROM jobs
+                  WHERE status = 'queued' AND run_after <= ?
+               ORDER BY run_after, id LIMIT 1)
+ RETURNING id, kind, payload, attempts, max_attempts
+"""
+
+
+def claim(db, worker):
+    """Atomically take the oldest runnable job, or return None."""
+    now = time.time()
+    with db:
+        # Jobs whose worker vanished go back to the queue
+        db.execute("""
+            UPDATE jobs SET status = 'queued', worker = NULL,
+                            message = 'requeued after lease expired'
+             WHERE status = 'running' AND locked_at < ?
+        """, (now - JOB_LEASE_SECONDS,))
+        return db.execute(CLAIM_SQL, (now, worker, now)).fetchone()
+
+
+def report_progress(db, job_id, progress, message=None):
+    with db:
+        db.execute("UPDATE jobs SET progress = ?, message = ?, locked_at = ? WHERE id = ?",
+                   (int(progress), message, time.time(), job_id))
+
+
+def finish(db, job_id, message=None):
+    with db:
+        db.execute("""
+            UPDATE jobs SET status = 'done', progress = 100, message = ?, finished_at = ?
+             WHERE id = ?
+        """, (message, time.time(), job_id))
+
+
+def fail(db, job, error):
+    """Requeue with backoff, or mark failed once attempts are used up."""
+    now = time.time()
+    with db:
+        if job["attempts"] < job["max_attempts"]:
+            delay = JOB_RETRY_DELAY * 2 ** (job["attempts"] - 1)
+            db.execute("""
+                UPDATE jobs SET status = 'queued', run_after = ?, worker = NULL, message = ?
+                 WHERE id = ?
+            """, (now + delay, f"retrying: {error}", job["id"]))
+        else:
+            db.execute("""
+                UPDATE jobs SET status = 'failed', message = ?, finished_at = ? WHERE id = ?
+            """, (str(error), now, job["id"]))
+            on_failure = FAILURE_HANDLERS.get(job["kind"])
+            if on_failure is not None:
+                on_failure(db, json.loads(job["payload"]), error)
+
+
+def purge_finished(db, days=JOB_RETENTION_DAYS):
+    """Delete done and failed jobs finished more than `days` ago; returns the count."""
+    with db:
+        return db.execute("""
+            DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?
+        """, (time.time() - days * 86400,)).rowcount
+
+
+def run_job(db, job):
+    func = HANDLERS.get(job["kind"])
+    if func is None:
+        fail(db, dict(job, attempts=job["max_attempts"]), f"no handler for {job['kind']!r}")
+        return False
+    try:
+        message = func(db, json.loads(job["payload"]),
+                       lambda progress, text=None: report_progress(db, job["id"], progress, text))
+    except Exception as e:
+        if db.in_transaction:
+            db.rollback()
+        traceback.print_exc()
+        fail(db, job, f"{type(e).__name__}: {e}")
+        return False
+    finish(db, job["id"], message)
+    return True
+
+
+def connect(database):
+    conn = sqlite3.connect(database, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA busy_timeout = 30000")
+    return conn
+
+
+def work(database, worker, poll_interval=JOB_POLL_INTERVAL, stop_when_idle=False):
+    """Claim and run jobs until interrupted (or the queue is empty, if asked)."""
+    import analytics  # noqa: F401  (registers its handlers)
+    import resource_processing  # noqa: F401
+    import roster  # noqa: F401
+
+    db = connect(database)
+    last_purge = 0.0
+    try:
+        while True:
+            if time.time() - last_purge >= JOB_PURGE_INTERVAL:
+                purge_finished(db)
+                last_purge = time.time()
+            job = claim(db, worker)
+            if job is None:
+                if stop_when_idle:
+                    return
+                time.sleep(poll_interval)
+                continue
+            run_job(db, job)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close()
+
+
+def status_counts(db):
+    return {row["status"]: row["count"] for row in
+            db.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status")}
+
+
+def main(argv):
+    def option(name, default):
+        return argv[argv.index(name) + 1] if name in argv else default
+
+    database = option("--db", os.getenv("DATABASE_URL", "academy.db"))
+    command = argv[0] if argv else None
+    if command == "status":
+        db = connect(database)
+        for status, count in sorted(status_counts(db).items()):
+            print(f"{status:8} {count}")
+        db.close()
+        return 0
+    if command == "purge":
+        db = connect(database)
+        print(f"Deleted {purge_finished(db, float(option('--days', JOB_RETENTION_DAYS)))} finished job(s)")
+        db.close()
+        return 0
+    if command != "work":
+        print(__doc__.strip().split("Usage:")[1].strip())
+        return 2
+
+    processes = int(option("--processes", "2"))
+    workers = [
+        multiprocessing.Process(target=work, args=(database, f"{os.uname().nodename}:{i}"),
+                                daemon=True)
+        for i in range(processes)
+    ]
+    for process in workers:
+        process.start()
+    print(f"Started {processes} job worker(s) on {database}")
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        for process in workers:
+            process.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,252 @@
+"""
+Per-route request and database instrumentation.
+
+Pooled connections are opened as InstrumentedConnection, whose cursors time
+every execute()/executemany() and add the count and duration to the stats
+of the request that is currently running (a context variable, so it works
+per thread; a streamed body falls back to the request's g). When the
+request ends, its latency, statement count and DB time go into per-endpoint
+histograms, rendered in Prometheus text format by Metrics.render().
+
+Statements slower than SLOW_QUERY_MS (unset = off) are logged to the
+"academy.slow_query" logger with their SQL and bound parameters, and the
+latest SLOW_QUERY_KEEP of them are kept in memory for the admin page.
+Parameters of statements that touch passwords are redacted.
+
+Like the pool and cache counters, these are per worker process.
+"""
+import contextvars
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0") or 0)
+SLOW_QUERY_KEEP = int(os.getenv("SLOW_QUERY_KEEP", "100"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+slow_query_log = logging.getLogger("academy.slow_query")
+
+_current = contextvars.ContextVar("request_db_stats", default=None)
+
+
+class RequestStats:
+    """Statement count and DB time of one request."""
+    __slots__ = ("queries", "db_seconds", "started", "endpoint")
+
+    def __init__(self, endpoint):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.started = time.perf_counter()
+        self.endpoint = endpoint
+
+
+def start_request(endpoint):
+    stats = RequestStats(endpoint)
+    return stats, _current.set(stats)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def _one_line(sql):
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def _record(sql, params, seconds, rows=1):
+    stats = _current.get()
+    if stats is None and has_request_context():
+        # A streamed body runs outside the context the stats were set in
+        stats = g.get("_metrics_stats")
+    if stats is not None:
+        stats.queries += rows
+        stats.db_seconds += seconds
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+        metrics.record_slow_query(sql, params, seconds, stats.endpoint if stats else None)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record(sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        # Materialise so the row count is known; callers pass lists or short generators
+        seq_of_parameters = list(seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record(sql, seq_of_parameters[:3], time.perf_counter() - start,
+                    rows=max(len(seq_of_parameters), 1))
+
+    def executescript(self, sql_script):
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            _record(sql_script, (), time.perf_counter() - start)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements are counted and timed."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute() & co. bypass the Python-level cursor methods, so
+    # route them through an instrumented cursor explicitly.
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+
+class Metrics:
+    """Per-endpoint histograms and counters for this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self.slow_queries = deque(maxlen=SLOW_QUERY_KEEP)  # the latest ones, for the admin page
+        self.slow_query_count = 0
+
+    def observe_request(self, endpoint, method, status, stats):
+        seconds = time.perf_counter() - stats.started
+        key = endpoint or "<unmatched>"
+        with self._lock:
+            entry = self._endpoints.get(key)
+            if entry is None:
+                entry = self._endpoints[key] = {
+                    "latency": Histogram(LATENCY_BUCKETS),
+                    "queries": Histogram(QUERY_COUNT_BUCKETS),
+                    "db_seconds": 0.0,
+                    "responses": {},
+                }
+            entry["latency"].observe(seconds)
+            entry["queries"].observe(stats.queries)
+            entry["db_seconds"] += stats.db_seconds
+            code = (method, str(status))
+            entry["responses"][code] = entry["responses"].get(code, 0) + 1
+
+    def record_slow_query(self, sql, params, seconds, endpoint):
+        if "password" in sql.lower():
+            params = "<redacted>"
+        else:
+            params = repr(params)[:500]
+        entry = {"ms": round(seconds * 1000, 3), "endpoint": endpoint,
+                 "sql": _one_line(sql)[:2000], "params": params, "at": time.time()}
+        with self._lock:
+            self.slow_queries.append(entry)
+            self.slow_query_count += 1
+        slow_query_log.warning("slow query %.1f ms [%s] %s params=%s",
+                               entry["ms"], endpoint, entry["sql"], params)
+
+    def render(self):
+        """All metrics in Prometheus text exposition format."""
+        def label(value):
+            return value.replace("\\", "\\\\").replace('"', '\\"')
+
+        lines = []
+
+        def histogram(name, help_text, key, buckets_fmt):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for endpoint, entry in sorted(self._endpoints.items()):
+                h = entry[key]
+                cumulative = 0
+                for bound, count in zip((*h.buckets, "+Inf"), h.counts):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else buckets_fmt(bound)
+                    lines.append(f'{name}_bucket{{endpoint="{label(endpoint)}",le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{endpoint="{label(endpoint)}"}} {h.total:.6f}')
+                lines.append(f'{name}_count{{endpoint="{label(endpoint)}"}} {h.count}')
+
+        with self._lock:
+            histogram("academy_request_duration_seconds",
+                      "Request latency per endpoint, including streamed bodies.",
+                      "latency", lambda b: f"{b:g}")
+            histogram("academy_db_queries_per_request",
+                      "SQL statements executed per request (executemany counts each row).",
+                      "queries", lambda b: str(b))
+            lines.append("# HELP academy_db_seconds_total Time spent executing SQL per endpoint.")
+            lines.append("# TYPE academy_db_seconds_total counter")
+            for endpoint, entry in sorted(self._endpoints.items()):
+                lines.append(f'academy_db_seconds_total{{endpoint="{label(endpoint)}"}} '
+                             f'{entry["db_seconds"]:.6f}')
+            lines.append("# HELP academy_responses_total Responses per endpoint, method and status.")
+            lines.append("# TYPE academy_responses_total counter")
+            for endpoint, entry in sorted(self._endpoints.items()):
+                for (method, status), count in sorted(entry["responses"].items()):
+                    lines.append(f'academy_responses_total{{endpoint="{label(endpoint)}",'
+                                 f'method="{method}",status="{status}"}} {count}')
+            lines.append("# HELP academy_slow_queries_total Statements over SLOW_QUERY_MS.")
+            lines.append("# TYPE academy_slow_queries_total counter")
+            lines.append(f"academy_slow_queries_total {self.slow_query_count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def init_app(app):
+    """Time every request and attribute its SQL statements to its endpoint."""
+    from flask import request
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_stats, g._metrics_token = start_request(request.endpoint)
+
+    @app.after_request
+    def _remember_status(response):
+        g._metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _observe(exception):
+        token = g.pop("_metrics_token", None)
+        if token is not None:
+            try:
+                end_request(token)
+            except ValueError:
+                pass  # set in another context; nothing to reset
+        if g.get("_stream_pending"):
+            return  # observed again once the streamed body is done
+        stats = g.pop("_metrics_stats", None)
+        if stats is None:
+            return
+        status = 500 if exception is not None else g.pop("_metrics_status", 500)
+        metrics.observe_request(request.endpoint, request.method, status, stats)
@@ -0,0 +1,679 @@
+"""
+Versioned schema migrations for academy.db.
+
+Each migration runs once, in order, inside its own transaction. The number
+of the last applied migration is kept in SQLite's `PRAGMA user_version`, so
+`migrate()` is cheap to call on every start-up.
+
+Usage:
+    python migrations.py [database]                 # apply pending migrations
+    python migrations.py --check-plans [database]   # EXPLAIN QUERY PLAN check
+"""
+import sqlite3
+import sys
+import time
+
+from db import execute_in, fetch_in
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _add_column(conn, table, column, definition):
+    if column not in _columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _base_schema(conn):
+    """
+    Single source of truth for the tables. Databases created by the old
+    init_db() lacked users.actual_name, courses.teacher_id, grades.category
+    and course_resources, so those are added here when missing.
+    """
+    statements = [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL,
+            -- possible roles: 'admin', 'teacher', 'student'
+            actual_name TEXT
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS courses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            semester TEXT NOT NULL,
+            teacher_id INTEGER,
+            FOREIGN KEY(teacher_id) REFERENCES users(id)
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS enrollments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            course_id INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (course_id) REFERENCES courses(id)
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS attendance (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            enrollment_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            status TEXT NOT NULL, -- 'present' or 'absent'
+            FOREIGN KEY (enrollment_id) REFERENCES enrollments(id)
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS grades (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            enrollment_id INTEGER NOT NULL,
+            grade_value TEXT NOT NULL,
+            category TEXT,  -- e.g. "Assignment", "Quiz", "Midterm", etc.
+            FOREIGN KEY (enrollment_id) REFERENCES enrollments(id)
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS course_resources (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            course_id INTEGER NOT NULL,
+            file_name TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            FOREIGN KEY(course_id) REFERENCES courses(id)
+        )""",
+    ]
+    for sql in statements:
+        conn.execute(sql)
+    _add_column(conn, "users", "actual_name", "TEXT")
+    _add_column(conn, "courses", "teacher_id", "INTEGER REFERENCES users(id)")
+    _add_column(conn, "grades", "category", "TEXT")
+
+
+def _hot_join_indexes(conn):
+    """Secondary indexes for the enrollment/attendance/grade joins."""
+    # Keep only the newest grade per (enrollment, category) before enforcing it.
+    conn.execute("""
+        DELETE FROM grades
+         WHERE id NOT IN (SELECT MAX(id) FROM grades GROUP BY enrollment_id, category)
+    """)
+    statements = [
+        "CREATE INDEX IF NOT EXISTS idx_enrollments_user_course ON enrollments(user_id, course_id)",
+        "CREATE INDEX IF NOT EXISTS idx_enrollments_course_user ON enrollments(course_id, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_attendance_enrollment_date ON attendance(enrollment_id, date, status)",
+        "CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(date)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_grades_enrollment_category ON grades(enrollment_id, category)",
+        "CREATE INDEX IF NOT EXISTS idx_course_resources_course ON course_resources(course_id)",
+        "CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)",
+    ]
+    for sql in statements:
+        conn.execute(sql)
+
+
+def _unique_attendance_per_day(conn):
+    """One attendance row per enrollment per day; keep the latest duplicate."""
+    conn.execute("""
+        DELETE FROM attendance
+         WHERE id NOT IN (SELECT MAX(id) FROM attendance GROUP BY enrollment_id, date)
+    """)
+    conn.execute("DROP INDEX IF EXISTS idx_attendance_enrollment_date")
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_attendance_enrollment_date "
+        "ON attendance(enrollment_id, date)"
+    )
+
+
+# The rollup tables and refresh SQL as of migration 4. Migrations 4 and 5 run
+# these frozen copies: rollups.py follows the latest schema (it also reads
+# attendance_archive, created by migration 9), which a database being
+# upgraded from before migration 9 does not have yet.
+_NUMERIC_V4 = "(trim(g.grade_value) GLOB '*[0-9]*' AND trim(g.grade_value) NOT GLOB '*[^0-9.]*')"
+
+_ROLLUP_TABLES_V4 = [
+    """
+    CREATE TABLE IF NOT EXISTS enrollment_rollups (
+        enrollment_id INTEGER PRIMARY KEY,
+        present_count INTEGER NOT NULL DEFAULT 0,
+        absent_count INTEGER NOT NULL DEFAULT 0,
+        last_seen TEXT,      -- latest date marked present
+        last_recorded TEXT,  -- latest date with any attendance record
+        grade_count INTEGER NOT NULL DEFAULT 0,
+        numeric_grade_count INTEGER NOT NULL DEFAULT 0,
+        numeric_grade_sum REAL NOT NULL DEFAULT 0,
+        FOREIGN KEY (enrollment_id) REFERENCES enrollments(id)
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS course_category_rollups (
+        course_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        grade_count INTEGER NOT NULL,
+        grade_sum REAL NOT NULL,
+        grade_min REAL,
+        grade_max REAL,
+        PRIMARY KEY (course_id, category),
+        FOREIGN KEY (course_id) REFERENCES courses(id)
+    )""",
+]
+
+_ENROLLMENT_ROLLUP_V4 = f"""
+    INSERT OR REPLACE INTO enrollment_rollups
+        (enrollment_id, present_count, absent_count, last_seen, last_recorded,
+         grade_count, numeric_grade_count, numeric_grade_sum)
+    SELECT e.id,
+           (SELECT COUNT(*) FROM attendance a WHERE a.enrollment_id = e.id AND a.status = 'present'),
+           (SELECT COUNT(*) FROM attendance a WHERE a.enrollment_id = e.id AND a.status = 'absent'),
+           (SELECT MAX(a.date) FROM attendance a WHERE a.enrollment_id = e.id AND a.status = 'present'),
+           (SELECT MAX(a.date) FROM attendance a WHERE a.enrollment_id = e.id),
+           (SELECT COUNT(*) FROM grades g WHERE g.enrollment_id = e.id),
+           (SELECT COUNT(*) FROM grades g WHERE g.enrollment_id = e.id AND {_NUMERIC_V4}),
+           (SELECT TOTAL(CAST(g.grade_value AS REAL)) FROM grades g
+             WHERE g.enrollment_id = e.id AND {_NUMERIC_V4})
+      FROM enrollments e
+"""
+
+_CATEGORY_ROLLUP_V4 = f"""
+    INSERT INTO course_category_rollups
+        (course_id, category, grade_count, grade_sum, grade_min, grade_max)
+    SELECT e.course_id, g.category, COUNT(*), TOTAL(CAST(g.grade_value AS REAL)),
+           MIN(CAST(g.grade_value AS REAL)), MAX(CAST(g.grade_value AS REAL))
+      FROM grades g
+      JOIN enrollments e ON g.enrollment_id = e.id
+     WHERE g.category IS NOT NULL AND {_NUMERIC_V4}
+"""
+
+
+def _rollup_tables(conn):
+    """Summary tables for attendance and grades, backfilled from history."""
+    for sql in _ROLLUP_TABLES_V4:
+        conn.execute(sql)
+    conn.execute("DELETE FROM enrollment_rollups")
+    conn.execute(_ENROLLMENT_ROLLUP_V4)
+    conn.execute("DELETE FROM course_category_rollups")
+    conn.execute(_CATEGORY_ROLLUP_V4 + " GROUP BY e.course_id, g.category")
+
+
+def _unique_enrollments(conn):
+    """
+    One enrollment per (student, course). Duplicates are merged into the
+    oldest row: their attendance and grades are moved over (the newest record
+    wins where both have the same day or category), then the extras are deleted.
+    """
+    conn.execute("""
+        CREATE TEMP TABLE enrollment_merge AS
+        SELECT e.id AS old_id, k.keep_id
+          FROM enrollments e
+          JOIN (SELECT user_id, course_id, MIN(id) AS keep_id
+                  FROM enrollments
+              GROUP BY user_id, course_id
+                HAVING COUNT(*) > 1) k
+            ON e.user_id = k.user_id AND e.course_id = k.course_id
+         WHERE e.id <> k.keep_id
+    """)
+    affected = "(SELECT old_id FROM enrollment_merge UNION SELECT keep_id FROM enrollment_merge)"
+    for table, key in (("attendance", "date"), ("grades", "category")):
+        conn.execute(f"""
+            DELETE FROM {table}
+             WHERE enrollment_id IN {affected}
+               AND id NOT IN (
+                   SELECT MAX(t.id)
+                     FROM {table} t
+                LEFT JOIN enrollment_merge m ON m.old_id = t.enrollment_id
+                    WHERE t.enrollment_id IN {affected}
+                 GROUP BY COALESCE(m.keep_id, t.enrollment_id), t.{key})
+        """)
+        conn.execute(f"""
+            UPDATE {table}
+               SET enrollment_id = (SELECT keep_id FROM enrollment_merge
+                                     WHERE old_id = {table}.enrollment_id)
+             WHERE enrollment_id IN (SELECT old_id FROM enrollment_merge)
+        """)
+    keep_ids = [row[0] for row in conn.execute("SELECT DISTINCT keep_id FROM enrollment_merge")]
+    conn.execute("DELETE FROM enrollment_rollups WHERE enrollment_id IN (SELECT old_id FROM enrollment_merge)")
+    conn.execute("DELETE FROM enrollments WHERE id IN (SELECT old_id FROM enrollment_merge)")
+    conn.execute("DROP TABLE enrollment_merge")
+    execute_in(conn, _ENROLLMENT_ROLLUP_V4 + " WHERE e.id IN ({marks})", keep_ids)
+    course_ids = {row[0] for row in fetch_in(
+        conn, "SELECT DISTINCT course_id FROM enrollments WHERE id IN ({marks})", keep_ids)}
+    for course_id in sorted(course_ids):
+        conn.execute("DELETE FROM course_category_rollups WHERE course_id = ?", (course_id,))
+        conn.execute(_CATEGORY_ROLLUP_V4 + " AND e.course_id = ? GROUP BY e.course_id, g.category",
+                     (course_id,))
+
+    # The unique index also serves every lookup the old (user_id, course_id) one did
+    conn.execute("DROP INDEX IF EXISTS idx_enrollments_user_course")
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_enrollments_user_course "
+        "ON enrollments(user_id, course_id)"
+    )
+
+
+# Tables, triggers and backfill SQL of migrations 7-12, frozen as they ran.
+# Like the rollup copies above, they must not follow later changes to
+# jobs.py, search.py, attendance_archive.py, semester_archive.py or
+# analytics.py, or older databases would be upgraded to a different schema.
+_JOB_TABLES_V7 = [
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL DEFAULT '{}',   -- JSON
+        status TEXT NOT NULL DEFAULT 'queued',
+        -- 'queued', 'running', 'done' or 'failed'
+        progress INTEGER NOT NULL DEFAULT 0,  -- 0..100
+        message TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        run_after REAL NOT NULL,              -- unix time
+        locked_at REAL,
+        worker TEXT,
+        created_at REAL NOT NULL,
+        finished_at REAL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs(status, run_after)",
+]
+
+_SEARCH_INDEX_V8 = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        title, course_name, semester, body,
+        scope,                -- "c<course_id>", so MATCH itself can filter by course
+        kind UNINDEXED,       -- 'course' or 'resource'
+        course_id UNINDEXED,
+        ref_id UNINDEXED,     -- courses.id or course_resources.id
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+_SEARCH_INDEX_RESOURCE_V8 = """
+    INSERT INTO search_index
+        (rowid, title, course_name, semester, body, scope, kind, course_id, ref_id)
+    SELECT NEW.id * 2 + 1, NEW.file_name, c.name, c.semester, COALESCE(NEW.extracted_text, ''),
+           'c' || NEW.course_id, 'resource', NEW.course_id, NEW.id
+      FROM courses c
+     WHERE c.id = NEW.course_id AND NEW.processing_status <> 'invalid';
+"""
+
+_SEARCH_TRIGGERS_V8 = [
+    """
+    CREATE TRIGGER IF NOT EXISTS search_courses_ai AFTER INSERT ON courses BEGIN
+        INSERT INTO search_index
+            (rowid, title, course_name, semester, body, scope, kind, course_id, ref_id)
+        VALUES (NEW.id * 2, NEW.name, NEW.name, NEW.semester, '', 'c' || NEW.id,
+                'course', NEW.id, NEW.id);
+    END""",
+    """
+    CREATE TRIGGER IF NOT EXISTS search_courses_au AFTER UPDATE OF name, semester ON courses BEGIN
+        UPDATE search_index SET title = NEW.name, course_name = NEW.name, semester = NEW.semester
+         WHERE rowid = NEW.id * 2;
+        UPDATE search_index SET course_name = NEW.name, semester = NEW.semester
+         WHERE rowid IN (SELECT id * 2 + 1 FROM course_resources WHERE course_id = NEW.id);
+    END""",
+    """
+    CREATE TRIGGER IF NOT EXISTS search_courses_ad AFTER DELETE ON courses BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 2;
+        DELETE FROM search_index
+         WHERE rowid IN (SELECT id * 2 + 1 FROM course_resources WHERE course_id = OLD.id);
+    END""",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS search_resources_ai AFTER INSERT ON course_resources BEGIN
+        {_SEARCH_INDEX_RESOURCE_V8}
+    END""",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS search_resources_au
+    AFTER UPDATE OF file_name, extracted_text, processing_status, course_id ON course_resources BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 2 + 1;
+        {_SEARCH_INDEX_RESOURCE_V8}
+    END""",
+    """
+    CREATE TRIGGER IF NOT EXISTS search_resources_ad AFTER DELETE ON course_resources BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 2 + 1;
+    END""",
+]
+
+_SEARCH_REBUILD_V8 = [
+    "DELETE FROM search_index",
+    """
+    INSERT INTO search_index
+        (rowid, title, course_name, semester, body, scope, kind, course_id, ref_id)
+    SELECT id * 2, name, name, semester, '', 'c' || id, 'course', id, id FROM courses
+    """,
+    """
+    INSERT INTO search_index
+        (rowid, title, course_name, semester, body, scope, kind, course_id, ref_id)
+    SELECT r.id * 2 + 1, r.file_name, c.name, c.semester, COALESCE(r.extracted_text, ''),
+           'c' || r.course_id, 'resource', r.course_id, r.id
+      FROM course_resources r
+      JOIN courses c ON c.id = r.course_id
+     WHERE r.processing_status <> 'invalid'
+    """,
+    "INSERT INTO search_index (search_index) VALUES ('optimize')",
+]
+
+_ATTENDANCE_ARCHIVE_V9 = [
+    """
+    CREATE TABLE IF NOT EXISTS attendance_archive (
+        enrollment_id INTEGER PRIMARY KEY,
+        first_day INTEGER NOT NULL,
+        day_count INTEGER NOT NULL,
+        recorded BLOB NOT NULL,
+        present BLOB NOT NULL,
+        present_count INTEGER NOT NULL,
+        absent_count INTEGER NOT NULL,
+        last_seen TEXT,      -- latest date marked present
+        last_recorded TEXT,  -- latest date with any record
+        FOREIGN KEY (enrollment_id) REFERENCES enrollments(id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_attendance_archive_last_recorded "
+    "ON attendance_archive(last_recorded)",
+]
+
+_SEMESTER_ARCHIVES_V10 = [
+    """
+    CREATE TABLE IF NOT EXISTS semester_archives (
+        semester TEXT PRIMARY KEY,
+        file_name TEXT NOT NULL,
+        archived_at REAL NOT NULL,
+        course_count INTEGER NOT NULL,
+        enrollment_count INTEGER NOT NULL
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS archived_resource_files (
+        file_path TEXT NOT NULL,
+        semester TEXT NOT NULL,
+        PRIMARY KEY (file_path, semester)
+    ) WITHOUT ROWID""",
+]
+
+_GRADE_VECTORS_V12 = """
+    CREATE TABLE IF NOT EXISTS course_grade_vectors (
+        course_id INTEGER PRIMARY KEY,
+        row_count INTEGER NOT NULL,      -- enrollments when built
+        max_enrollment_id INTEGER,       -- with row_count, detects enrollment changes
+        categories TEXT NOT NULL,        -- column order of `grades`
+        enrollment_ids BLOB NOT NULL,    -- little-endian int64, one per enrollment
+        user_ids BLOB NOT NULL,
+        present BLOB NOT NULL,           -- little-endian float64, one per enrollment
+        absent BLOB NOT NULL,
+        grades BLOB NOT NULL,            -- float64 rows x categories, NaN = no numeric grade
+        FOREIGN KEY (course_id) REFERENCES courses(id)
+    )"""
+
+# Queues the job that builds every course's vectors, unless one is queued
+_QUEUE_GRADE_VECTORS_V12 = """
+    INSERT INTO jobs (kind, payload, max_attempts, run_after, created_at)
+    SELECT 'grade_vectors', '{}', 3, :now, :now
+     WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE status = 'queued' AND kind = 'grade_vectors')
+"""
+
+
+def _content_addressed_resources(conn):
+    """Resource files are stored by SHA-256 and shared; rows per file are its refcount."""
+    _add_column(conn, "course_resources", "content_hash", "TEXT")
+    _add_column(conn, "course_resources", "file_size", "INTEGER")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_course_resources_file_path "
+        "ON course_resources(file_path)"
+    )
+
+
+def _resource_processing(conn):
+    """Job queue, plus the results of background PDF processing per resource."""
+    for sql in _JOB_TABLES_V7:
+        conn.execute(sql)
+    # Existing resources predate processing and stay downloadable as they are
+    _add_column(conn, "course_resources", "processing_status", "TEXT NOT NULL DEFAULT 'ready'")
+    _add_column(conn, "course_resources", "processing_message", "TEXT")
+    _add_column(conn, "course_resources", "page_count", "INTEGER")
+    _add_column(conn, "course_resources", "thumbnail_path", "TEXT")
+    _add_column(conn, "course_resources", "extracted_text", "TEXT")
+    _add_column(conn, "course_resources", "job_id", "INTEGER REFERENCES jobs(id)")
+
+
+def _search_index(conn):
+    """FTS5 index over courses and resources, kept in sync by triggers."""
+    conn.execute(_SEARCH_INDEX_V8)
+    for sql in _SEARCH_TRIGGERS_V8 + _SEARCH_REBUILD_V8:
+        conn.execute(sql)
+
+
+def _attendance_archive(conn):
+    """Bitmap storage for the attendance of compacted (closed) semesters."""
+    for sql in _ATTENDANCE_ARCHIVE_V9:
+        conn.execute(sql)
+
+
+def _semester_archives(conn):
+    """Registry of semesters moved out to archive files, and their pinned uploads."""
+    for sql in _SEMESTER_ARCHIVES_V10:
+        conn.execute(sql)
+
+
+def _course_grade_vectors_v11(conn):
+    """
+    Superseded by migration 12. This used to create course_grade_vectors
+    through rollups.create_tables(), which migration 4 also ran, so that
+    table showed up in databases too old to have it.
+    """
+
+
+def _course_grade_vectors(conn):
+    """Per-course column arrays for the analytics page, built by the job worker."""
+    conn.execute(_GRADE_VECTORS_V12)
+    conn.execute(_QUEUE_GRADE_VECTORS_V12, {"now": time.time()})
+
+
+def _failed_processing(conn):
+    """Resources whose processing job already failed for good were left 'pending'."""
+    conn.execute("""
+        UPDATE course_resources
+           SET processing_status = 'invalid',
+               processing_message = 'Processing failed: '
+                   || COALESCE((SELECT j.message FROM jobs j WHERE j.id = course_resources.job_id), '')
+         WHERE processing_status = 'pending'
+           AND job_id IN (SELECT id FROM jobs WHERE status = 'failed')
+    """)
+
+
+# (version, description, function). Append new migrations; never renumber.
+MIGRATIONS = [
+    (1, "reconcile base schema", _base_schema),
+    (2, "indexes for hot join columns", _hot_join_indexes),
+    (3, "unique attendance per enrollment and day", _unique_attendance_per_day),
+    (4, "attendance and grade rollup tables", _rollup_tables),
+    (5, "unique enrollment per student and course", _unique_enrollments),
+    (6, "content-addressed course resources", _content_addressed_resources),
+    (7, "background job queue and resource processing", _resource_processing),
+    (8, "full-text search index", _search_index),
+    (9, "compact attendance archive", _attendance_archive),
+    (10, "semester archive registry", _semester_archives),
+    (11, "course grade vectors (superseded by 12)", _course_grade_vectors_v11),
+    (12, "course grade vectors", _course_grade_vectors),
+    (13, "settle resources whose processing failed", _failed_processing),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply every pending migration. Returns the list of versions applied."""
+    applied = []
+    for version, description, func in MIGRATIONS:
+        if version <= current_version(conn):
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            func(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+# -----------------------------
+# QUERY PLAN REGRESSION CHECK
+# -----------------------------
+# Statistics of the "large" benchmark database (benchmarks/generate_data.py
+# --scale large: 20k users, 400 courses, 100k enrollments, 5M attendance
+# rows), as ANALYZE records them. The plans are checked against these rather
+# than the database's own, so the result depends only on its schema and not
+# on how much data it happens to hold.
+PLAN_TABLE_ROWS = {
+    "users": 20000,
+    "courses": 400,
+    "enrollments": 100000,
+    "attendance": 5000000,
+    "grades": 500000,
+    "enrollment_rollups": 100000,
+    "course_category_rollups": 2000,
+    "course_resources": 8000,
+    "jobs": 10000,
+}
+# Average rows per value of each index prefix, as sqlite_stat1 records them
+PLAN_INDEX_KEYS = {
+    "sqlite_autoindex_users_1": "1",
+    "idx_users_role": "6700",
+    "idx_enrollments_course_user": "250 1",
+    "ux_enrollments_user_course": "5 1",
+    "idx_attendance_date": "50000",
+    "ux_attendance_enrollment_date": "50 1",
+    "ux_grades_enrollment_category": "5 1",
+    "idx_course_resources_course": "20",
+    "idx_course_resources_file_path": "1",
+    "idx_jobs_status_run_after": "2500 1",
+}
+PLAN_DEFAULT_ROWS = 10000
+
+
+def route_queries():
+    """
+    The statements the routes run, taken from the modules that run them and
+    bound the same way, as {name: (sql, params, allowed)}. allowed lists the
+    table aliases that may be scanned because the page genuinely lists the
+    whole table (e.g. the course catalog), or a single allowed SCAN line.
+    """
+    # Imported here: these modules need the schema this module creates
+    import auth
+    import catalog
+    import enrollment
+    import gradebook
+    import jobs
+    import reports
+    import resource_store
+    import roll_call
+
+    page = reports.ATTENDANCE_PAGE_SIZE
+    cursor = "2025-01-01_100"
+    return {
+        "courses": (catalog.COURSES_SQL, (), {"courses"}),
+        "teachers": (catalog.TEACHERS_SQL, (), set()),
+        "login": (auth.LOGIN_SQL, ("admin", "admin"), set()),
+        "course_grades": (gradebook.COURSE_GRADES_SQL, (1,), set()),
+        "course_enrollment_ids": (gradebook.COURSE_ENROLLMENT_IDS_SQL, (1,), set()),
+        # The first page walks idx_attendance_date newest first and stops after LIMIT rows
+        "teacher_all_attendance": reports.attendance_page_query({}, None, page) + (
+            {"SCAN a USING INDEX idx_attendance_date"},),
+        "teacher_all_attendance.next_page": reports.attendance_page_query({}, cursor, page) + (set(),),
+        "teacher_all_attendance.course": reports.attendance_page_query(
+            {"course_id": 1}, cursor, page) + (set(),),
+        "student_dashboard": (enrollment.STUDENT_COURSES_SQL, (1,), set()),
+        "my_attendance": (reports.STUDENT_ATTENDANCE_SQL, (1,), set()),
+        "student_resources.enrollment": (enrollment.ENROLLMENT_SQL, (1, 1), set()),
+        "student_resources": (resource_store.STUDENT_RESOURCES_SQL, (1, "ready"), set()),
+        "student_resource": (resource_store.STUDENT_RESOURCE_SQL, (1, 1, "ready"), set()),
+        "course_resources": (resource_store.RESOURCE_STATUS_SQL, (1,), set()),
+        "jobs.claim": (jobs.CLAIM_SQL, (0, "worker", 0), set()),
+        "resource_refcount": (resource_store.REFCOUNT_SQL, ("uploads/blobs/ab/ab.pdf",) * 2, {"CONSTANT"}),
+        "my_grades": (gradebook.STUDENT_GRADES_SQL, (1,), set()),
+        "roll_call.valid_enrollments": (
+            roll_call.VALID_ENROLLMENTS_SQL.format(marks="?,?,?"), (1, 2, 3), set()),
+    }
+
+
+def plan_check_schema(conn):
+    """
+    In-memory copy of conn's tables and indexes (no rows, triggers or FTS
+    tables) with sqlite_stat1 filled in from PLAN_TABLE_ROWS and
+    PLAN_INDEX_KEYS. An index missing from PLAN_INDEX_KEYS is assumed to
+    match 10 rows on its first column and 1 on the full key.
+    """
+    scratch = sqlite3.connect(":memory:")
+    for (sql,) in conn.execute("""
+        SELECT sql FROM sqlite_master
+         WHERE type IN ('table', 'index') AND sql IS NOT NULL
+           AND name NOT LIKE 'sqlite_%'
+           AND sql NOT LIKE 'CREATE VIRTUAL TABLE%' AND sql NOT LIKE 'CREATE TABLE ''%'
+      ORDER BY type DESC
+    """):
+        scratch.execute(sql)
+    scratch.execute("ANALYZE")
+    scratch.execute("DELETE FROM sqlite_stat1")
+    tables = [row[0] for row in scratch.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+    for table in tables:
+        rows = PLAN_TABLE_ROWS.get(table, PLAN_DEFAULT_ROWS)
+        scratch.execute("INSERT INTO sqlite_stat1 VALUES (?, NULL, ?)", (table, str(rows)))
+        for index in scratch.execute(f"PRAGMA index_list('{table}')").fetchall():
+            name, unique = index[1], index[2]
+            keys = PLAN_INDEX_KEYS.get(name)
+            if keys is None:
+                width = len(scratch.execute(f"PRAGMA index_info('{name}')").fetchall())
+                keys = "1" if unique and width == 1 else " ".join(["10"] + ["1"] * (width - 1))
+            scratch.execute("INSERT INTO sqlite_stat1 VALUES (?, ?, ?)",
+                            (table, name, f"{rows} {keys}"))
+    scratch.execute("ANALYZE sqlite_master")  # load the statistics
+    return scratch
+
+
+def check_query_plans(conn, queries=None):
+    """
+    Run EXPLAIN QUERY PLAN for each route query against conn's schema (see
+    plan_check_schema) and return a list of (name, plan detail) for every
+    full-table SCAN that is not allowed.
+    """
+    scratch = plan_check_schema(conn)
+    problems = []
+    try:
+        for name, (sql, params, allowed) in (queries or route_queries()).items():
+            for row in scratch.execute("EXPLAIN QUERY PLAN " + sql, params):
+                detail = row[3]
+                if not detail.startswith("SCAN "):
+                    continue
+                table = detail.split()[1]
+                if table not in allowed and detail not in allowed:
+                    problems.append((name, detail))
+    finally:
+        scratch.close()
+    return problems
+
+
+def main(argv):
+    check = "--check-plans" in argv
+    args = [a for a in argv if not a.startswith("--")]
+    database = args[0] if args else "academy.db"
+
+    conn = sqlite3.connect(database)
+    applied = migrate(conn)
+    print(f"Schema at version {current_version(conn)}"
+          + (f" (applied {applied})" if applied else ""))
+
+    if check:
+        problems = check_query_plans(conn)
+        for name, detail in problems:
+            print(f"FAIL {name}: {detail}")
+        conn.close()
+        if problems:
+            return 1
+        print(f"OK: {len(route_queries())} route queries use indexes")
+        return 0
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
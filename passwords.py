@@ -0,0 +1,162 @@
+"""
+Password hashing with a tunable cost and a bounded verification pool.
+
+Hashes use Werkzeug's PBKDF2-SHA256 format ("pbkdf2:sha256:<iterations>$salt$hash").
+The iteration count comes from PASSWORD_HASH_ITERATIONS; pick it with the
+calibrate command so one verify costs a known number of milliseconds.
+
+Verification runs on a small thread pool (hashlib releases the GIL while
+hashing), so at most PASSWORD_HASH_WORKERS hashes burn CPU at once and a
+login storm queues instead of starving every other request. When the
+queue is full, verify_password() raises HashingBusy.
+
+Rows that still hold a plaintext password, or a hash with an outdated
+iteration count, verify normally and are flagged by needs_rehash(), so
+the login route can upgrade them on the next successful login (hashing
+on the same pool, via hash_on_pool()).
+
+Usage:
+    python passwords.py calibrate [--target-ms 50]
+"""
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+HASH_ITERATIONS = int(os.getenv("PASSWORD_HASH_ITERATIONS", "200000"))
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", str(HASH_WORKERS * 8)))
+HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "5"))
+
+_HASH_PREFIXES = ("pbkdf2:", "scrypt:")
+
+
+class HashingBusy(Exception):
+    """Too many password checks are already queued; the caller should retry."""
+
+
+def hash_password(password, iterations=None):
+    return generate_password_hash(
+        password, method=f"pbkdf2:sha256:{iterations or HASH_ITERATIONS}"
+    )
+
+
+def is_hashed(stored):
+    return stored.startswith(_HASH_PREFIXES)
+
+
+def needs_rehash(stored):
+    """True for legacy plaintext rows and hashes made with a different cost."""
+    if not is_hashed(stored):
+        return True
+    return not stored.startswith(f"pbkdf2:sha256:{HASH_ITERATIONS}$")
+
+
+def _check(stored, candidate):
+    if is_hashed(stored):
+        return check_password_hash(stored, candidate)
+    # Legacy plaintext row: constant-time compare, rehashed by the caller.
+    return hmac.compare_digest(stored.encode(), candidate.encode())
+
+
+_executor = None
+_executor_pid = None
+_slots = threading.BoundedSemaphore(HASH_QUEUE)
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    if _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS,
+                                               thread_name_prefix="pwhash")
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _submit(func, *args):
+    """
+    Queue func(*args) on the hashing pool and return its future. The queue
+    slot is held until the hash is done; HashingBusy if none frees up
+    within HASH_TIMEOUT.
+    """
+    if not _slots.acquire(timeout=HASH_TIMEOUT):
+        raise HashingBusy("Password hashing queue is full")
+    try:
+        future = _get_executor().submit(func, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+def verify_password(stored, candidate):
+    """
+    Check `candidate` against the stored hash (or legacy plaintext) on the
+    hashing pool. Pass stored=None for an unknown user: a dummy hash is
+    still checked so response time does not reveal which usernames exist.
+    """
+    target = stored if stored is not None else _DUMMY_HASH
+    ok = _submit(_check, target, candidate).result()
+    return ok and stored is not None
+
+
+def hash_on_pool(password):
+    """hash_password() on the hashing pool, bounded like verify_password()."""
+    return _submit(hash_password, password).result()
+
+
+def hash_passwords(passwords):
+    """
+    hash_password() for each of `passwords`, in order, on the hashing pool.
+    At most HASH_WORKERS of them hold queue slots at a time, so logins
+    still get through while a roster is being imported.
+    """
+    hashes, pending = [], deque()
+    for password in passwords:
+        if len(pending) >= HASH_WORKERS:
+            hashes.append(pending.popleft().result())
+        pending.append(_submit(hash_password, password))
+    hashes.extend(future.result() for future in pending)
+    return hashes
+
+
+_DUMMY_HASH = hash_password("not-a-real-password")
+
+
+def calibrate(target_ms=50.0, samples=5):
+    """Return the iteration count whose single verify takes about target_ms."""
+    probe = 100000
+    stored = hash_password("calibration", probe)
+    start = time.perf_counter()
+    for _ in range(samples):
+        check_password_hash(stored, "calibration")
+    per_iteration = (time.perf_counter() - start) / samples / probe
+    return max(10000, int(target_ms / 1000.0 / per_iteration) // 1000 * 1000)
+
+
+def main(argv):
+    if not argv or argv[0] != "calibrate":
+        print(__doc__.strip().splitlines()[-1].strip())
+        return 2
+    target_ms = float(argv[argv.index("--target-ms") + 1]) if "--target-ms" in argv else 50.0
+    iterations = calibrate(target_ms)
+    stored = hash_password("calibration", iterations)
+    start = time.perf_counter()
+    check_password_hash(stored, "calibration")
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"PASSWORD_HASH_ITERATIONS={iterations}  # ~{elapsed:.1f} ms per verify on this machine")
+    print(f"With {HASH_WORKERS} hashing workers: ~{HASH_WORKERS * 1000 / max(elapsed, 0.001):.0f} logins/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,242 @@
+"""
+On-demand request profiling with flamegraph-ready output.
+
+A request is profiled when it is flagged:
+    * header "X-Profile: <PROFILE_TOKEN>" (never a query parameter, which
+      would end up in access logs and Referer headers),
+    * "?_profile=1" (or any X-Profile header) from an admin session, or
+    * sampling: a random fraction (the sample rate) of requests, optionally
+      only for one endpoint. Admins set the rate at /admin/profiles, so a
+      teacher's slow gradebook can be caught without their involvement.
+
+Two profilers are available (PROFILE_MODE, or "&_profile_mode=" per request):
+    sample    a background thread snapshots the request thread's stack every
+              PROFILE_INTERVAL_MS; low overhead, statistically exact stacks.
+    cprofile  deterministic cProfile; exact call counts, more overhead. The
+              raw .prof is kept too (for snakeviz / pstats).
+Both write collapsed stacks ("a;b;c <weight>" per line), the input format of
+flamegraph.pl, speedscope and inferno, to PROFILE_DIR. Only the newest
+PROFILE_KEEP profiles are kept.
+
+When nothing is flagged the per-request cost is one dict lookup and, with a
+sample rate set, one random() call.
+"""
+import cProfile
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from auth import token_matches
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sample")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "2"))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_MODES = ("sample", "cprofile")
+
+_NAME = re.compile(r"^(\d+)_([\w.]+)_(sample|cprofile)_(\d+)ms\.collapsed$")
+
+
+class Sampling:
+    """Per-process sampling settings, changed at runtime from the admin page."""
+
+    def __init__(self):
+        self.rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+        self.endpoint = os.getenv("PROFILE_ENDPOINT") or None
+
+    def wants(self, endpoint):
+        if not self.rate or (self.endpoint and endpoint != self.endpoint):
+            return False
+        return random.random() < self.rate
+
+
+sampling = Sampling()
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Collects the stacks of one thread from a background thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return self.samples
+
+
+def collapse_pstats(stats):
+    """
+    Approximate collapsed stacks (weights in microseconds) from cProfile
+    data. cProfile only records caller->callee edges, so each function's own
+    time is split across its call paths in proportion to the edge times.
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, (_, _, _, edge_ct) in callers.items():
+            callees.setdefault(caller, []).append((func, edge_ct))
+    roots = [func for func, (_, _, _, _, callers) in stats.stats.items() if not callers]
+
+    def label(func):
+        filename, line, name = func
+        return f"{name} ({os.path.basename(filename)}:{line})"
+
+    out = Counter()
+
+    def visit(func, path, share):
+        _, _, tottime, cumtime, _ = stats.stats[func]
+        if cumtime * share * 1e6 < 1:
+            return  # under a microsecond on this path; keeps the output small
+        path = path + [label(func)]
+        if tottime * share * 1e6 >= 1:
+            out[";".join(path)] += int(tottime * share * 1e6)
+        for callee, edge_ct in callees.get(func, ()):
+            if label(callee) in path or not cumtime:
+                continue  # recursion: already counted on this path
+            callee_ct = stats.stats[callee][3] or 1e-12
+            visit(callee, path, share * min(edge_ct / callee_ct, 1.0))
+
+    for root in roots:
+        visit(root, [], 1.0)
+    return out
+
+
+class RequestProfile:
+    def __init__(self, mode):
+        self.mode = mode
+        self.started = time.perf_counter()
+        if mode == "cprofile":
+            try:
+                self._profiler = cProfile.Profile()
+                self._profiler.enable()
+            except ValueError:
+                # Only one cProfile can run at a time; sample this one instead
+                self.mode = mode = "sample"
+        if mode == "sample":
+            self._profiler = StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000.0)
+            self._profiler.start()
+
+    def finish(self, endpoint, directory=PROFILE_DIR):
+        """Stop profiling and write the collapsed stacks; returns the file name."""
+        if self.mode == "cprofile":
+            self._profiler.disable()
+        else:
+            self._profiler.stop()
+        elapsed_ms = int((time.perf_counter() - self.started) * 1000)
+
+        os.makedirs(directory, exist_ok=True)
+        base = f"{int(time.time() * 1000)}_{endpoint or 'unmatched'}_{self.mode}_{elapsed_ms}ms"
+        if self.mode == "cprofile":
+            self._profiler.dump_stats(os.path.join(directory, base + ".prof"))
+            stacks = collapse_pstats(pstats.Stats(self._profiler))
+        else:
+            stacks = self._profiler.collapsed()
+        with open(os.path.join(directory, base + ".collapsed"), "w") as f:
+            for stack, weight in sorted(stacks.items()):
+                f.write(f"{stack} {weight}\n")
+        rotate(directory)
+        return base + ".collapsed"
+
+
+def rotate(directory=PROFILE_DIR, keep=PROFILE_KEEP):
+    """Delete all but the newest `keep` profiles (and their .prof files)."""
+    for entry in list_profiles(directory)[keep:]:
+        for suffix in (".collapsed", ".prof"):
+            try:
+                os.remove(os.path.join(directory, entry["base"] + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(directory=PROFILE_DIR):
+    """Captured profiles, newest first."""
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in os.listdir(directory):
+        match = _NAME.match(name)
+        if not match:
+            continue
+        base = name[:-len(".collapsed")]
+        profiles.append({
+            "name": name,
+            "base": base,
+            "captured_at": int(match.group(1)) / 1000.0,
+            "captured": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(int(match.group(1)) / 1000.0)),
+            "endpoint": match.group(2),
+            "mode": match.group(3),
+            "duration_ms": int(match.group(4)),
+            "size": os.path.getsize(os.path.join(directory, name)),
+            "has_pstats": os.path.exists(os.path.join(directory, base + ".prof")),
+        })
+    profiles.sort(key=lambda p: p["captured_at"], reverse=True)
+    return profiles
+
+
+def is_profile_file(name, directory=PROFILE_DIR):
+    """True for a .collapsed/.prof file this module wrote (safe to send)."""
+    base, ext = os.path.splitext(name)
+    return (ext in (".collapsed", ".prof") and _NAME.match(base + ".collapsed") is not None
+            and os.path.exists(os.path.join(directory, name)))
+
+
+def _requested_mode(request, session):
+    if session.get("role") == "admin":
+        flagged = request.headers.get("X-Profile") or request.args.get("_profile")
+    else:
+        flagged = token_matches(request.headers.get("X-Profile"), PROFILE_TOKEN)
+    if not flagged:
+        return None
+    mode = request.args.get("_profile_mode", PROFILE_MODE)
+    return mode if mode in PROFILE_MODES else PROFILE_MODE
+
+
+def init_app(app):
+    """Profile flagged or sampled requests from start to teardown."""
+    from flask import g, request, session
+
+    @app.before_request
+    def _maybe_start_profile():
+        mode = _requested_mode(request, session)
+        if mode is None and sampling.wants(request.endpoint):
+            mode = PROFILE_MODE
+        if mode is not None:
+            g._profile = RequestProfile(mode)
+
+    @app.teardown_request
+    def _maybe_finish_profile(exception):
+        if g.get("_stream_pending"):
+            return  # keep profiling until the streamed body is done
+        profile = g.pop("_profile", None)
+        if profile is not None:
+            name = profile.finish(request.endpoint)
+            app.logger.info("Saved request profile %s", name)
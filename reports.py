@@ -0,0 +1,175 @@
+"""
+Filtered, keyset-paginated attendance reports.
+
+Pages are ordered by (date, id) descending and the next page starts strictly
+after the last row shown, so the cost of a page depends on the page size,
+not on how much history sits in front of it. Filters are pushed into SQL.
+Compacted semesters (attendance_archive) are merged in, in the same order.
+"""
+import csv
+import io
+from heapq import merge
+from itertools import islice
+
+from attendance_archive import has_archive_since, iter_archived
+from db import iter_rows
+from roll_call import ATTENDANCE_STATUSES, AttendanceError, parse_date
+
+ATTENDANCE_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+_ATTENDANCE_SELECT = """
+    SELECT a.id AS attendance_id,
+           a.date,
+           a.status,
+           c.name AS course_name,
+           u.username AS student_name
+      FROM attendance a
+      JOIN enrollments e ON a.enrollment_id = e.id
+      JOIN courses c     ON e.course_id = c.id
+      JOIN users u       ON e.user_id = u.id
+"""
+
+
+def attendance_filters(args):
+    """
+    Read the report filters from request args.
+    Returns a dict with only the filters that were given.
+    """
+    filters = {}
+    course_id = args.get("course_id", "").strip()
+    if course_id:
+        if not course_id.isdigit():
+            raise AttendanceError(f"Invalid course id: {course_id}")
+        filters["course_id"] = int(course_id)
+    student = args.get("student", "").strip()
+    if student:
+        filters["student"] = student
+    for key in ("date_from", "date_to"):
+        if args.get(key, "").strip():
+            filters[key] = parse_date(args[key])
+    status = args.get("status", "").strip()
+    if status:
+        if status not in ATTENDANCE_STATUSES:
+            raise AttendanceError(f"Invalid status: {status}")
+        filters["status"] = status
+    return filters
+
+
+def _where(filters):
+    clauses, params = [], []
+    if "course_id" in filters:
+        clauses.append("e.course_id = ?")
+        params.append(filters["course_id"])
+    if "student" in filters:
+        # Prefix match on username or display name
+        clauses.append("(u.username LIKE ? ESCAPE '\\' OR u.actual_name LIKE ? ESCAPE '\\')")
+        pattern = (filters["student"].replace("\\", "\\\\")
+                   .replace("%", "\\%").replace("_", "\\_") + "%")
+        params.extend([pattern, pattern])
+    if "date_from" in filters:
+        clauses.append("a.date >= ?")
+        params.append(filters["date_from"])
+    if "date_to" in filters:
+        clauses.append("a.date <= ?")
+        params.append(filters["date_to"])
+    if "status" in filters:
+        clauses.append("a.status = ?")
+        params.append(filters["status"])
+    return clauses, params
+
+
+def encode_cursor(row):
+    return f"{row['date']}_{row['attendance_id']}"
+
+
+def decode_cursor(value):
+    """Parse an "after" cursor of the form "<date>_<id>" (negative ids are archived records)."""
+    day, _, attendance_id = (value or "").rpartition("_")
+    if not day or not attendance_id.lstrip("-").isdigit():
+        raise AttendanceError(f"Invalid page cursor: {value}")
+    return parse_date(day), int(attendance_id)
+
+
+def _sort_key(row):
+    return row["date"], row["attendance_id"]
+
+
+def _archived(db, filters, before=None):
+    """Compacted records matching `filters`, in report order (see attendance_archive)."""
+    clauses, params = _where({key: filters[key] for key in ("course_id", "student") if key in filters})
+    return iter_archived(db, clauses, params, filters.get("date_from"), filters.get("date_to"),
+                         filters.get("status"), before)
+
+
+# A student's own attendance (live rows; compacted records are merged in)
+STUDENT_ATTENDANCE_SQL = """
+    SELECT a.date,
+           a.status,
+           c.name AS course_name
+      FROM attendance a
+      JOIN enrollments e ON a.enrollment_id = e.id
+      JOIN courses c     ON e.course_id = c.id
+     WHERE e.user_id = ?
+  ORDER BY a.date DESC
+"""
+
+
+def attendance_page_query(filters, after=None, page_size=ATTENDANCE_PAGE_SIZE):
+    """(sql, params) of one page of live rows, page_size + 1 of them."""
+    clauses, params = _where(filters)
+    if after:
+        day, attendance_id = decode_cursor(after)
+        # Row-value comparison lets SQLite seek idx_attendance_date directly
+        clauses.append("(a.date, a.id) < (?, ?)")
+        params.extend([day, attendance_id])
+    sql = _ATTENDANCE_SELECT
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY a.date DESC, a.id DESC LIMIT ?"
+    params.append(page_size + 1)
+    return sql, params
+
+
+def attendance_page(db, filters, after=None, page_size=ATTENDANCE_PAGE_SIZE):
+    """
+    Fetch one page of attendance records.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    sql, params = attendance_page_query(filters, after, page_size)
+    rows = db.execute(sql, params).fetchall()
+    # Compacted semesters only matter once the page reaches back to their dates
+    if len(rows) <= page_size or has_archive_since(db, rows[page_size]["date"]):
+        before = decode_cursor(after) if after else None
+        rows = list(islice(merge(rows, _archived(db, filters, before), key=_sort_key, reverse=True),
+                           page_size + 1))
+    next_cursor = encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
+
+
+def iter_attendance_csv(db, filters, chunk_size=1000):
+    """Yield the filtered report as CSV text, one chunk of rows at a time."""
+    clauses, params = _where(filters)
+    sql = _ATTENDANCE_SELECT
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY a.date DESC, a.id DESC"
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["attendance_id", "date", "student", "course", "status"])
+    rows = merge(iter_rows(db.execute(sql, params), chunk_size), _archived(db, filters),
+                 key=_sort_key, reverse=True)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        for row in chunk:
+            writer.writerow([row["attendance_id"], row["date"], row["student_name"],
+                             row["course_name"], row["status"]])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue()
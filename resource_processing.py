@@ -0,0 +1,203 @@
+"""
+Post-processing of uploaded course PDFs, run by the job worker (jobs.py).
+
+For each new resource the worker checks the %PDF- magic bytes, counts the
+pages, renders a first-page PNG thumbnail and extracts the text, then marks
+the resource 'ready' (or 'invalid' with a reason, also when the job fails
+for good). Blobs are shared between resources (see resource_store), so a
+resource whose content was already processed just copies the earlier
+results.
+
+Thumbnails and the better text extraction use poppler's pdftoppm/pdftotext
+when they are on PATH. Without them there is no thumbnail, and text is
+pulled from the PDF's own text operators (fine for most generated PDFs,
+nothing for scans).
+"""
+import os
+import re
+import shutil
+import subprocess
+import zlib
+
+import jobs
+
+PDF_MAGIC = b"%PDF-"
+THUMBNAIL_WIDTH = 240
+MAX_TEXT_CHARS = 1_000_000
+TOOL_TIMEOUT = 120
+
+# processing_status values of course_resources
+PENDING, READY, INVALID = "pending", "ready", "invalid"
+
+
+def enqueue_processing(db, resource_id):
+    """Queue processing for a just-stored resource (one transaction)."""
+    with db:
+        job_id = jobs.enqueue(db, "process_resource", {"resource_id": resource_id})
+        db.execute("UPDATE course_resources SET processing_status = ?, job_id = ? WHERE id = ?",
+                   (PENDING, job_id, resource_id))
+    return job_id
+
+
+# -----------------------------
+# PDF INSPECTION (stdlib only)
+# -----------------------------
+_STREAM = re.compile(rb"stream\r?\n(.*?)\r?\nendstream", re.S)
+_PAGES_COUNT = re.compile(rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b", re.S)
+_PAGE = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+_TEXT_BLOCK = re.compile(rb"BT(.*?)ET", re.S)
+_TEXT_SHOW = re.compile(rb"\[((?:\\.|[^\]\\])*)\]\s*TJ|(\((?:\\.|[^\\)])*\))\s*(?:Tj|'|\")", re.S)
+_STRING = re.compile(rb"\(((?:\\.|[^\\)])*)\)", re.S)
+_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f",
+            b"(": b"(", b")": b")", b"\\": b"\\"}
+
+
+def _inflated_streams(data):
+    for match in _STREAM.finditer(data):
+        raw = match.group(1)
+        try:
+            yield zlib.decompress(raw)
+        except zlib.error:
+            yield raw
+
+
+def count_pages(data):
+    """Page count from the /Pages tree (falls back to counting /Page objects)."""
+    chunks = [data, *_inflated_streams(data)]
+    counts = [int(a or b) for chunk in chunks for a, b in _PAGES_COUNT.findall(chunk)]
+    if counts:
+        return max(counts)
+    return sum(len(_PAGE.findall(chunk)) for chunk in chunks)
+
+
+def _unescape(raw):
+    out, i = bytearray(), 0
+    while i < len(raw):
+        ch = raw[i:i + 1]
+        if ch != b"\\":
+            out += ch
+            i += 1
+            continue
+        nxt = raw[i + 1:i + 2]
+        octal = re.match(rb"[0-7]{1,3}", raw[i + 1:i + 4])
+        if octal:
+            out.append(int(octal.group(0), 8) & 0xFF)
+            i += 1 + len(octal.group(0))
+        else:
+            out += _ESCAPES.get(nxt, b"")
+            i += 2
+    return bytes(out)
+
+
+def extract_text_builtin(data):
+    lines = []
+    for stream in _inflated_streams(data):
+        for block in _TEXT_BLOCK.findall(stream):
+            pieces = []
+            for array, single in _TEXT_SHOW.findall(block):
+                strings = _STRING.findall(array) if array else [single[1:-1]]
+                pieces.append(b"".join(_unescape(s) for s in strings))
+            if pieces:
+                lines.append(b" ".join(pieces).decode("latin-1"))
+    return "\n".join(lines)
+
+
+def extract_text(path, data):
+    if shutil.which("pdftotext"):
+        result = subprocess.run(["pdftotext", "-q", "-enc", "UTF-8", path, "-"],
+                                capture_output=True, timeout=TOOL_TIMEOUT)
+        if result.returncode == 0:
+            return result.stdout.decode("utf-8", "replace")[:MAX_TEXT_CHARS]
+    return extract_text_builtin(data)[:MAX_TEXT_CHARS]
+
+
+def render_thumbnail(path, out_path):
+    """First page as PNG via pdftoppm; returns out_path, or None if unavailable."""
+    if not shutil.which("pdftoppm"):
+        return None
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    prefix = out_path[:-len(".png")]
+    result = subprocess.run(
+        ["pdftoppm", "-q", "-png", "-f", "1", "-l", "1", "-singlefile",
+         "-scale-to-x", str(THUMBNAIL_WIDTH), "-scale-to-y", "-1", path, prefix],
+        capture_output=True, timeout=TOOL_TIMEOUT,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"pdftoppm failed: {result.stderr.decode(errors='replace').strip()}")
+    return out_path
+
+
+def thumbnail_path_for(file_path):
+    """Thumbnails sit next to the blob, named after it (so they are shared too)."""
+    return os.path.splitext(file_path)[0] + ".thumb.png"
+
+
+# -----------------------------
+# JOB HANDLER
+# -----------------------------
+def _mark(db, resource_id, status, message=None, page_count=None, thumbnail_path=None,
+          text=None):
+    with db:
+        db.execute("""
+            UPDATE course_resources
+               SET processing_status = ?, processing_message = ?, page_count = ?,
+                   thumbnail_path = ?, extracted_text = ?
+             WHERE id = ?
+        """, (status, message, page_count, thumbnail_path, text, resource_id))
+
+
+@jobs.failure_handler("process_resource")
+def processing_failed(db, payload, error):
+    """Out of retries: hide the unchecked file instead of leaving it 'pending'."""
+    db.execute("""
+        UPDATE course_resources SET processing_status = ?, processing_message = ?
+         WHERE id = ? AND processing_status = ?
+    """, (INVALID, f"Processing failed: {error}", payload["resource_id"], PENDING))
+
+
+@jobs.handler("process_resource")
+def process_resource(db, payload, report):
+    resource_id = payload["resource_id"]
+    resource = db.execute(
+        "SELECT id, file_path, content_hash FROM course_resources WHERE id = ?", (resource_id,)
+    ).fetchone()
+    if resource is None:
+        return "resource was deleted"
+
+    # Same content already processed for another resource: reuse its results
+    if resource["content_hash"]:
+        done = db.execute("""
+            SELECT processing_status, processing_message, page_count, thumbnail_path, extracted_text
+              FROM course_resources
+             WHERE content_hash = ? AND id <> ? AND processing_status IN (?, ?)
+             LIMIT 1
+        """, (resource["content_hash"], resource_id, READY, INVALID)).fetchone()
+        if done:
+            _mark(db, resource_id, *done)
+            return f"reused results for {resource['content_hash'][:12]}"
+
+    report(10, "checking file type")
+    try:
+        with open(resource["file_path"], "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        _mark(db, resource_id, INVALID, "File is missing from the server")
+        return "file missing"
+    if not data.startswith(PDF_MAGIC):
+        _mark(db, resource_id, INVALID, "Not a PDF file")
+        return "not a PDF"
+
+    report(30, "counting pages")
+    pages = count_pages(data)
+    if pages == 0:
+        _mark(db, resource_id, INVALID, "No pages found (damaged PDF?)")
+        return "no pages"
+
+    report(50, "rendering thumbnail")
+    thumbnail = render_thumbnail(resource["file_path"], thumbnail_path_for(resource["file_path"]))
+
+    report(75, "extracting text")
+    text = extract_text(resource["file_path"], data)
+
+    _mark(db, resource_id, READY, None, pages, thumbnail, text)
+    return f"{pages} pages, {len(text)} characters of text"
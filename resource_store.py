@@ -0,0 +1,189 @@
+"""
+Content-addressed storage for course resource files.
+
+Uploads to the resource endpoints are streamed by werkzeug's form parser
+straight into a temp file under UPLOAD_FOLDER/tmp, and hashed (SHA-256)
+chunk by chunk as they are written, so the file is never buffered in memory
+or read a second time. The finished file is then moved (a rename, same
+filesystem) to
+
+    UPLOAD_FOLDER/blobs/<first two hex digits>/<sha256>.pdf
+
+Identical files therefore share one blob. The refcount of a blob is the
+number of course_resources rows whose file_path points at it (plus archived
+semesters that still reference it); the file is unlinked only when the last
+reference goes. Both the "is it stored yet?" check on
+upload and the "was that the last reference?" check on delete run under
+the database write lock, so they cannot interleave.
+
+Request size is capped by MAX_CONTENT_LENGTH: werkzeug answers 413 from the
+Content-Length header before reading the body, and stops a chunked body once
+it crosses the limit.
+"""
+import hashlib
+import os
+import tempfile
+
+from flask import Request, current_app
+
+REFCOUNT_SQL = """
+    SELECT (SELECT COUNT(*) FROM course_resources WHERE file_path = ?)
+         + (SELECT COUNT(*) FROM archived_resource_files WHERE file_path = ?)
+"""
+
+# A course's resources with the state of their processing job
+RESOURCE_STATUS_SQL = """
+    SELECT r.id, r.file_name, r.file_path, r.processing_status, r.processing_message,
+           r.page_count, r.thumbnail_path, j.status AS job_status,
+           j.progress AS job_progress, j.message AS job_message, j.attempts AS job_attempts
+      FROM course_resources r
+      LEFT JOIN jobs j ON j.id = r.job_id
+     WHERE r.course_id = ?
+  ORDER BY r.id
+"""
+
+# What a student may see: resources of a course they are enrolled in that
+# passed processing (bound to 'ready'); pending uploads are not validated yet
+STUDENT_RESOURCES_SQL = """
+    SELECT id, file_name, file_path, page_count, thumbnail_path
+      FROM course_resources
+     WHERE course_id = ? AND processing_status = ?
+"""
+STUDENT_RESOURCE_SQL = """
+    SELECT r.file_name, r.file_path, r.thumbnail_path
+      FROM course_resources r
+      JOIN enrollments e ON e.course_id = r.course_id AND e.user_id = ?
+     WHERE r.id = ? AND r.processing_status = ?
+"""
+
+# Only these endpoints get hashed, disk-backed upload streams; every other
+# form upload keeps werkzeug's default (spooled) handling.
+HASHED_UPLOAD_ENDPOINTS = {"upload_resource"}
+
+
+class HashingFile:
+    """
+    A writable temp file that keeps a running SHA-256 and byte count of
+    everything written to it. close() removes the file unless it was
+    claimed with mark_moved() after being renamed into the store.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=directory, suffix=".part", delete=False)
+        self.name = self._file.name
+        self._hash = hashlib.sha256()
+        self.size = 0
+        self._moved = False
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def mark_moved(self):
+        self._moved = True
+
+    def close(self):
+        self._file.close()
+        if not self._moved:
+            try:
+                os.remove(self.name)
+            except FileNotFoundError:
+                pass
+
+    def __getattr__(self, name):
+        # read/seek/tell/flush and friends go to the underlying file
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+
+class ResourceRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        if self.endpoint in HASHED_UPLOAD_ENDPOINTS:
+            return HashingFile(os.path.join(current_app.config["UPLOAD_FOLDER"], "tmp"))
+        return super()._get_file_stream(total_content_length, content_type, filename,
+                                        content_length)
+
+
+def blob_path(upload_folder, digest):
+    return os.path.join(upload_folder, "blobs", digest[:2], f"{digest}.pdf")
+
+
+def refcount(db, file_path):
+    # Resources of archived semesters (semester_archive.py) still count
+    return db.execute(REFCOUNT_SQL, (file_path, file_path)).fetchone()[0]
+
+
+def store_upload(db, course_id, upload, file_name):
+    """
+    Add `upload` (a FileStorage from a ResourceRequest) to the course.
+    Returns (resource_id, deduplicated), where deduplicated is True if an
+    identical file was already stored and is now shared.
+    """
+    stream = upload.stream
+    if not isinstance(stream, HashingFile):
+        raise TypeError("store_upload() needs an upload parsed by ResourceRequest")
+    stream.flush()
+    digest = stream.hexdigest()
+    file_path = blob_path(current_app.config["UPLOAD_FOLDER"], digest)
+
+    db.execute("BEGIN IMMEDIATE")
+    moved = False
+    try:
+        deduplicated = refcount(db, file_path) > 0
+        if not deduplicated:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            os.replace(stream.name, file_path)
+            stream.mark_moved()
+            moved = True
+        resource_id = db.execute("""
+            INSERT INTO course_resources (course_id, file_name, file_path, content_hash, file_size)
+            VALUES (?, ?, ?, ?, ?)
+        """, (course_id, file_name, file_path, digest, stream.size)).lastrowid
+        db.commit()
+    except Exception:
+        # The blob this call moved in has no row pointing at it. Unlink it
+        # before the write lock is released, like release_resource() does.
+        try:
+            if moved and os.path.exists(file_path):
+                os.remove(file_path)
+        finally:
+            db.rollback()
+        raise
+    return resource_id, deduplicated
+
+
+def release_resource(db, resource_id):
+    """
+    Delete one resource row and, if no other row shares its file, the file
+    and its thumbnail.
+    Returns the deleted row's course_id, or None if there was no such row.
+    """
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        row = db.execute("""
+            DELETE FROM course_resources WHERE id = ?
+         RETURNING course_id, file_path, thumbnail_path
+        """, (resource_id,)).fetchone()
+        if row is None:
+            db.rollback()
+            return None
+        # Unlink while still holding the write lock, so a concurrent upload of
+        # the same content cannot re-reference the blob in between.
+        if refcount(db, row["file_path"]) == 0:
+            for path in (row["file_path"], row["thumbnail_path"]):
+                if path and os.path.exists(path):
+                    os.remove(path)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return row["course_id"]
+
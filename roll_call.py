@@ -0,0 +1,117 @@
+"""
+Batched, idempotent attendance writes.
+
+A roll call is one course on one date with a status per enrollment. Each
+batch is validated up front and written with a single executemany upsert
+keyed on UNIQUE(enrollment_id, date), so re-submitting the same roll call
+(double click, re-run of a nightly import) never duplicates rows.
+"""
+from datetime import date as _date
+
+from attendance_archive import archived_records
+from db import fetch_in
+from rollups import refresh_enrollments
+
+ATTENDANCE_STATUSES = ("present", "absent")
+
+VALID_ENROLLMENTS_SQL = "SELECT course_id, id FROM enrollments WHERE course_id IN ({marks})"
+
+
+class AttendanceError(ValueError):
+    """A roll call in the batch cannot be applied."""
+
+
+def parse_date(value):
+    """Validate a YYYY-MM-DD date string and return it normalised."""
+    try:
+        return _date.fromisoformat(str(value).strip()).isoformat()
+    except ValueError:
+        raise AttendanceError(f"Invalid date (expected YYYY-MM-DD): {value}")
+
+
+def parse_roll_call_form(form):
+    """Collect {enrollment_id: status} from the "status_<enrollment_id>" fields."""
+    statuses = {}
+    for key, value in form.items():
+        if not key.startswith("status_"):
+            continue
+        enrollment_id = key.split("_", 1)[1]
+        if not enrollment_id.isdigit():
+            raise AttendanceError(f"Malformed attendance field: {key}")
+        statuses[int(enrollment_id)] = value
+    return statuses
+
+
+def _normalise(roll_calls):
+    """Validate the batch; return a list of (course_id, enrollment_id, date, status)."""
+    rows = []
+    for roll_call in roll_calls:
+        if not isinstance(roll_call, dict) or not isinstance(roll_call.get("statuses"), dict):
+            raise AttendanceError("Each roll call needs course_id, date and a statuses mapping")
+        try:
+            course_id = int(roll_call.get("course_id"))
+        except (TypeError, ValueError):
+            raise AttendanceError(f"Invalid course id: {roll_call.get('course_id')}")
+        day = parse_date(roll_call.get("date"))
+        for enrollment_id, status in roll_call["statuses"].items():
+            if status not in ATTENDANCE_STATUSES:
+                raise AttendanceError(f"Invalid status for enrollment {enrollment_id}: {status}")
+            try:
+                enrollment_id = int(enrollment_id)
+            except (TypeError, ValueError):
+                raise AttendanceError(f"Invalid enrollment id: {enrollment_id}")
+            rows.append((course_id, enrollment_id, day, status))
+    return rows
+
+
+def record_roll_calls(db, roll_calls):
+    """
+    Write one or more roll calls (multi-day, multi-course) in one transaction.
+
+    `roll_calls` is an iterable of {"course_id", "date", "statuses"} dicts,
+    where statuses maps enrollment_id -> 'present' | 'absent'.
+    Returns {"roll_calls", "records", "written", "unchanged"}.
+    """
+    roll_calls = list(roll_calls)
+    rows = _normalise(roll_calls)
+
+    # Every enrollment must belong to the course it is reported under.
+    course_ids = sorted({course_id for course_id, _, _, _ in rows})
+    valid = {
+        (row["course_id"], row["id"]) for row in
+        fetch_in(db, VALID_ENROLLMENTS_SQL, course_ids)
+    }
+    bad = [(c, e) for c, e, _, _ in rows if (c, e) not in valid]
+    if bad:
+        course_id, enrollment_id = bad[0]
+        raise AttendanceError(
+            f"Enrollment {enrollment_id} is not in course {course_id}"
+            + (f" (and {len(bad) - 1} more)" if len(bad) > 1 else "")
+        )
+    # A live row next to an archived record of the same day would be counted twice
+    archived = archived_records(db, {(e, d) for _, e, d, _ in rows})
+    if archived:
+        enrollment_id, day = archived[0]
+        raise AttendanceError(
+            f"Attendance of enrollment {enrollment_id} on {day} is archived; "
+            "expand its semester to change it"
+            + (f" (and {len(archived) - 1} more)" if len(archived) > 1 else "")
+        )
+
+    before = db.total_changes
+    with db:
+        db.executemany("""
+            INSERT INTO attendance (enrollment_id, date, status)
+            VALUES (?, ?, ?)
+            ON CONFLICT(enrollment_id, date)
+            DO UPDATE SET status = excluded.status
+                    WHERE attendance.status != excluded.status
+        """, [(e, d, s) for _, e, d, s in rows])
+        written = db.total_changes - before
+        refresh_enrollments(db, {e for _, e, _, _ in rows})
+    return {
+        "roll_calls": len(roll_calls),
+        "records": len(rows),
+        "written": written,
+        "unchanged": len(rows) - written,
+    }
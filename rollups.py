@@ -0,0 +1,152 @@
+"""
+Precomputed attendance and grade summaries.
+
+enrollment_rollups holds one row per enrollment (present/absent counts,
+last dates, numeric grade count/sum; compacted attendance in
+attendance_archive is included) and course_category_rollups one row
+per (course, category) with numeric grade aggregates. Write paths call
+refresh_enrollments() for just the enrollments they touched, inside the
+same transaction, so summary pages read O(enrollments) rows instead of
+the whole attendance/grade history.
+
+The analytics arrays of a refreshed course (course_grade_vectors) are
+dropped in the same transaction and a "grade_vectors" job is queued to
+rebuild them (see analytics.rebuild_stale), so writes stay cheap and
+readers never have to write.
+
+Usage:
+    python rollups.py rebuild [database]   # full backfill
+"""
+import os
+import sqlite3
+import sys
+
+import jobs
+from db import execute_in, fetch_in
+
+VECTORS_JOB = "grade_vectors"
+# Writes in quick succession (a gradebook session) share one rebuild
+VECTORS_DELAY = float(os.getenv("GRADE_VECTORS_DELAY", "5"))
+
+# grade_value is free text; only plain numbers ("85", "92.5") are aggregated.
+# SQL condition on a grades row aliased g; analytics.py pivots with it too.
+NUMERIC_GRADE = "(trim(g.grade_value) GLOB '*[0-9]*' AND trim(g.grade_value) NOT GLOB '*[^0-9.]*')"
+
+CREATE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS enrollment_rollups (
+        enrollment_id INTEGER PRIMARY KEY,
+        present_count INTEGER NOT NULL DEFAULT 0,
+        absent_count INTEGER NOT NULL DEFAULT 0,
+        last_seen TEXT,      -- latest date marked present
+        last_recorded TEXT,  -- latest date with any attendance record
+        grade_count INTEGER NOT NULL DEFAULT 0,
+        numeric_grade_count INTEGER NOT NULL DEFAULT 0,
+        numeric_grade_sum REAL NOT NULL DEFAULT 0,
+        FOREIGN KEY (enrollment_id) REFERENCES enrollments(id)
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS course_category_rollups (
+        course_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        grade_count INTEGER NOT NULL,
+        grade_sum REAL NOT NULL,
+        grade_min REAL,
+        grade_max REAL,
+        PRIMARY KEY (course_id, category),
+        FOREIGN KEY (course_id) REFERENCES courses(id)
+    )""",
+]
+
+_ENROLLMENT_ROLLUP = f"""
+    INSERT OR REPLACE INTO enrollment_rollups
+        (enrollment_id, present_count, absent_count, last_seen, last_recorded,
+         grade_count, numeric_grade_count, numeric_grade_sum)
+    SELECT e.id,
+           (SELECT COUNT(*) FROM attendance a WHERE a.enrollment_id = e.id AND a.status = 'present')
+             + COALESCE(x.present_count, 0),
+           (SELECT COUNT(*) FROM attendance a WHERE a.enrollment_id = e.id AND a.status = 'absent')
+             + COALESCE(x.absent_count, 0),
+           (SELECT MAX(d) FROM (SELECT MAX(a.date) AS d FROM attendance a
+                                 WHERE a.enrollment_id = e.id AND a.status = 'present'
+                                UNION ALL SELECT x.last_seen)),
+           (SELECT MAX(d) FROM (SELECT MAX(a.date) AS d FROM attendance a WHERE a.enrollment_id = e.id
+                                UNION ALL SELECT x.last_recorded)),
+           (SELECT COUNT(*) FROM grades g WHERE g.enrollment_id = e.id),
+           (SELECT COUNT(*) FROM grades g WHERE g.enrollment_id = e.id AND {NUMERIC_GRADE}),
+           (SELECT TOTAL(CAST(g.grade_value AS REAL)) FROM grades g
+             WHERE g.enrollment_id = e.id AND {NUMERIC_GRADE})
+      FROM enrollments e
+      LEFT JOIN attendance_archive x ON x.enrollment_id = e.id
+"""
+
+_CATEGORY_ROLLUP = f"""
+    INSERT INTO course_category_rollups
+        (course_id, category, grade_count, grade_sum, grade_min, grade_max)
+    SELECT e.course_id, g.category, COUNT(*), TOTAL(CAST(g.grade_value AS REAL)),
+           MIN(CAST(g.grade_value AS REAL)), MAX(CAST(g.grade_value AS REAL))
+      FROM grades g
+      JOIN enrollments e ON g.enrollment_id = e.id
+     WHERE g.category IS NOT NULL AND {NUMERIC_GRADE}
+"""
+
+
+def create_tables(conn):
+    for sql in CREATE_TABLES:
+        conn.execute(sql)
+
+
+def refresh_enrollments(db, enrollment_ids):
+    """Recompute the rollup rows of the given enrollments and their courses."""
+    ids = sorted(set(int(i) for i in enrollment_ids))
+    execute_in(db, _ENROLLMENT_ROLLUP + " WHERE e.id IN ({marks})", ids)
+    course_ids = {
+        row[0] for row in
+        fetch_in(db, "SELECT DISTINCT course_id FROM enrollments WHERE id IN ({marks})", ids)
+    }
+    refresh_courses(db, course_ids)
+
+
+def refresh_courses(db, course_ids):
+    """Recompute the per-category grade aggregates of the given courses; drop their vectors."""
+    for course_id in sorted(course_ids):
+        db.execute("DELETE FROM course_grade_vectors WHERE course_id = ?", (course_id,))
+        db.execute("DELETE FROM course_category_rollups WHERE course_id = ?", (course_id,))
+        db.execute(_CATEGORY_ROLLUP + " AND e.course_id = ? GROUP BY e.course_id, g.category",
+                   (course_id,))
+    if course_ids:
+        schedule_vectors(db)
+
+
+def schedule_vectors(db):
+    """Queue a rebuild of every stale course's vectors, unless one is already waiting."""
+    jobs.enqueue_unique(db, VECTORS_JOB, {}, delay=VECTORS_DELAY)
+
+
+def rebuild(db):
+    """Recompute every rollup row from the raw tables."""
+    db.execute("DELETE FROM enrollment_rollups")
+    db.execute(_ENROLLMENT_ROLLUP)
+    db.execute("DELETE FROM course_category_rollups")
+    db.execute(_CATEGORY_ROLLUP + " GROUP BY e.course_id, g.category")
+    db.execute("DELETE FROM course_grade_vectors")
+    schedule_vectors(db)
+
+
+def main(argv):
+    if not argv or argv[0] != "rebuild":
+        print(__doc__.strip().splitlines()[-1].strip())
+        return 2
+    database = argv[1] if len(argv) > 1 else "academy.db"
+    conn = sqlite3.connect(database)
+    with conn:
+        create_tables(conn)
+        rebuild(conn)
+    count = conn.execute("SELECT COUNT(*) FROM enrollment_rollups").fetchone()[0]
+    conn.close()
+    print(f"Rebuilt rollups for {count} enrollments")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,246 @@
+"""
+Bulk import of teacher/student accounts from a CSV roster.
+
+The file is read row by row (constant memory), validated, and written in
+batches: each batch's passwords are hashed in parallel on the shared
+hashing pool (passwords.hash_passwords), then inserted with one
+executemany inside one transaction. Rows that fail validation, or whose
+username already exists, are reported with their row number and skipped.
+
+The admin page imports up to ROSTER_INLINE_ROWS rows within the request.
+Larger files are saved under ROSTER_DIR and imported by the job worker
+(an "import_roster" job); the job writes its error report next to the
+file and deletes the roster itself, passwords and all, when it ends.
+
+If an import stops part-way, every batch up to `last_committed_row` is in
+the database; re-run with start_row = last_committed_row + 1. Re-running
+from the top is also safe, since existing usernames are reported and skipped.
+
+CSV columns: username, password, role (teacher|student), actual_name (optional)
+
+Usage:
+    python roster.py roster.csv [--db academy.db] [--batch-size 500]
+                                [--start-row N] [--errors errors.csv]
+"""
+import csv
+import os
+import shutil
+import sqlite3
+import sys
+import uuid
+
+import jobs
+from catalog import invalidate_teachers
+from db import fetch_in
+from passwords import hash_passwords
+
+IMPORT_ROLES = ("teacher", "student")
+REQUIRED_COLUMNS = ("username", "password", "role")
+DEFAULT_BATCH_SIZE = int(os.getenv("ROSTER_BATCH_SIZE", "500"))
+MAX_USERNAME_LENGTH = 64
+ROSTER_INLINE_ROWS = int(os.getenv("ROSTER_INLINE_ROWS", "200"))
+ROSTER_DIR = os.getenv("ROSTER_DIR", os.path.join("uploads", "rosters"))
+ROSTER_JOB = "import_roster"
+
+
+class RosterError(ValueError):
+    """The roster file as a whole cannot be imported (e.g. missing columns)."""
+
+
+def _validate(row):
+    username = (row.get("username") or "").strip()
+    password = row.get("password") or ""
+    role = (row.get("role") or "").strip().lower()
+    if not username:
+        return None, "missing username"
+    if len(username) > MAX_USERNAME_LENGTH:
+        return None, "username too long"
+    if not password:
+        return None, "missing password"
+    if role not in IMPORT_ROLES:
+        return None, f"role must be one of {', '.join(IMPORT_ROLES)}"
+    actual_name = (row.get("actual_name") or "").strip() or None
+    return (username, password, role, actual_name), None
+
+
+def _flush(db, batch, result):
+    """Hash, de-duplicate against the DB and insert one batch in a transaction."""
+    existing = {
+        row["username"] for row in
+        fetch_in(db, "SELECT username FROM users WHERE username IN ({marks})",
+                 [user[1] for user in batch])
+    }
+    fresh = []
+    for row_number, username, password, role, actual_name in batch:
+        if username in existing:
+            result["errors"].append((row_number, username, "username already exists"))
+        else:
+            fresh.append((row_number, username, password, role, actual_name))
+
+    hashes = hash_passwords([user[2] for user in fresh])
+    with db:
+        before = db.total_changes
+        db.executemany(
+            "INSERT OR IGNORE INTO users (username, password, role, actual_name) VALUES (?, ?, ?, ?)",
+            [(username, hashed, role, actual_name)
+             for (_, username, _, role, actual_name), hashed in zip(fresh, hashes)],
+        )
+        inserted = db.total_changes - before
+    result["inserted"] += inserted
+    result["roles"].update(user[3] for user in fresh)
+    result["last_committed_row"] = batch[-1][0]
+
+
+def import_roster(db, text_stream, batch_size=DEFAULT_BATCH_SIZE, start_row=1, result=None,
+                  progress=None):
+    """
+    Import accounts from a CSV text stream. Data rows are numbered from 1
+    (the header is not counted); rows before `start_row` are skipped.
+
+    Returns {"processed", "inserted", "errors": [(row, username, message)],
+    "last_committed_row", "roles"}. Pass your own `result` dict to keep the
+    progress (notably last_committed_row) if the import raises part-way;
+    `progress(result)` is called after each committed batch.
+    """
+    reader = csv.DictReader(text_stream)
+    columns = [c.strip().lower() for c in (reader.fieldnames or [])]
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise RosterError(f"Roster is missing column(s): {', '.join(missing)}")
+    reader.fieldnames = columns
+
+    if result is None:
+        result = {}
+    result.update(processed=0, inserted=0, errors=[],
+                  last_committed_row=start_row - 1, roles=set())
+    batch, seen = [], set()
+    for row_number, row in enumerate(reader, start=1):
+        if row_number < start_row:
+            continue
+        result["processed"] += 1
+        user, error = _validate(row)
+        if error is None and user[0] in seen:
+            error = "username repeated earlier in the file"
+        if error:
+            result["errors"].append((row_number, (row.get("username") or "").strip(), error))
+            continue
+        seen.add(user[0])
+        batch.append((row_number, *user))
+        if len(batch) >= batch_size:
+            _flush(db, batch, result)
+            batch, seen = [], set()
+            if progress:
+                progress(result)
+    if batch:
+        _flush(db, batch, result)
+    return result
+
+
+def summary(result):
+    return (f"Processed {result['processed']} rows, inserted {result['inserted']}, "
+            f"{len(result['errors'])} errors")
+
+
+def write_error_report(errors, stream):
+    writer = csv.writer(stream)
+    writer.writerow(["row", "username", "error"])
+    writer.writerows(errors)
+
+
+# -----------------------------
+# BACKGROUND IMPORTS
+# -----------------------------
+def save_roster(stream):
+    """Copy an uploaded roster to ROSTER_DIR; returns (path, number of data rows)."""
+    os.makedirs(ROSTER_DIR, exist_ok=True)
+    path = os.path.join(ROSTER_DIR, f"{uuid.uuid4().hex}.csv")
+    with open(path, "wb") as f:
+        shutil.copyfileobj(stream, f)
+    try:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            rows = sum(1 for _ in csv.reader(f)) - 1
+    except UnicodeDecodeError:
+        os.remove(path)
+        raise
+    return path, max(rows, 0)
+
+
+def error_report_path(path):
+    return os.path.splitext(path)[0] + ".errors.csv"
+
+
+def enqueue_import(db, path, rows, batch_size=DEFAULT_BATCH_SIZE, start_row=1):
+    """
+    Queue a saved roster for the job worker. It is not retried: a rerun
+    would report every row it already inserted as a duplicate, so a
+    failure says where to resume instead.
+    """
+    with db:
+        return jobs.enqueue(db, ROSTER_JOB, {"path": path, "rows": rows,
+                                             "batch_size": batch_size, "start_row": start_row},
+                            max_attempts=1)
+
+
+@jobs.handler(ROSTER_JOB)
+def import_roster_job(db, payload, report):
+    path = payload["path"]
+    total = max(payload["rows"] - payload["start_row"] + 1, 1)
+    result = {"last_committed_row": payload["start_row"] - 1}
+    try:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            import_roster(db, f, batch_size=payload["batch_size"],
+                          start_row=payload["start_row"], result=result,
+                          progress=lambda r: report(min(99, r["processed"] * 100 // total),
+                                                    summary(r)))
+    except (UnicodeDecodeError, sqlite3.Error) as e:
+        raise RosterError(f"{e}. Rows up to {result['last_committed_row']} were saved; "
+                          f"re-upload with start row {result['last_committed_row'] + 1}.")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+        if "errors" in result:
+            with open(error_report_path(path), "w", newline="") as f:
+                write_error_report(result["errors"], f)
+        if "teacher" in result.get("roles", ()):
+            invalidate_teachers()
+    return summary(result)
+
+
+def main(argv):
+    def option(name, default):
+        return argv[argv.index(name) + 1] if name in argv else default
+
+    paths = [a for i, a in enumerate(argv)
+             if not a.startswith("--") and (i == 0 or not argv[i - 1].startswith("--"))]
+    if not paths:
+        print(__doc__.strip().split("Usage:")[1].strip())
+        return 2
+
+    conn = sqlite3.connect(option("--db", os.getenv("DATABASE_URL", "academy.db")))
+    conn.row_factory = sqlite3.Row
+    start_row = int(option("--start-row", "1"))
+    result = {"last_committed_row": start_row - 1}
+    try:
+        with open(paths[0], newline="", encoding="utf-8-sig") as f:
+            import_roster(conn, f, batch_size=int(option("--batch-size", DEFAULT_BATCH_SIZE)),
+                          start_row=start_row, result=result)
+    except (RosterError, sqlite3.Error) as e:
+        print(f"Import stopped: {e}")
+        print(f"Resume with --start-row {result['last_committed_row'] + 1}")
+        return 1
+    finally:
+        conn.close()
+
+    print(summary(result))
+    errors_path = option("--errors", None)
+    if errors_path:
+        with open(errors_path, "w", newline="") as f:
+            write_error_report(result["errors"], f)
+        print(f"Error report written to {errors_path}")
+    else:
+        write_error_report(result["errors"][:20], sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
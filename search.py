@@ -0,0 +1,166 @@
+"""
+Full-text search over courses and course resources (SQLite FTS5).
+
+search_index holds one document per course (name, semester) and one per
+course resource (file name, its course's name and semester, and the text the
+job worker extracted from the PDF). Triggers on courses and course_resources
+keep it in sync, so no write path has to remember to re-index. Resources
+that failed validation are left out.
+
+Document rowids are derived from the source row (course id * 2, resource
+id * 2 + 1), so every trigger updates the index by rowid instead of scanning
+it. Results are ranked with bm25, weighting title matches above body text.
+"""
+import re
+
+from markupsafe import Markup, escape
+
+SEARCH_PAGE_SIZE = 20
+
+# Column weights for bm25(): title, course_name, semester, body, scope
+_WEIGHTS = "10.0, 3.0, 2.0, 1.0, 0.0"
+# Control characters used as snippet markers, replaced after HTML-escaping
+_MARK_START, _MARK_END = "\x02", "\x03"
+
+CREATE_INDEX = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        title, course_name, semester, body,
+        scope,                -- "c<course_id>", so MATCH itself can filter by course
+        kind UNINDEXED,       -- 'course' or 'resource'
+        course_id UNINDEXED,
+        ref_id UNINDEXED,     -- courses.id or course_resources.id
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+_INDEX_RESOURCE = """
+    INSERT INTO search_index
+        (rowid, title, course_name, semester, body, scope, kind, course_id, ref_id)
+    SELECT NEW.id * 2 + 1, NEW.file_name, c.name, c.semester, COALESCE(NEW.extracted_text, ''),
+           'c' || NEW.course_id, 'resource', NEW.course_id, NEW.id
+      FROM courses c
+     WHERE c.id = NEW.course_id AND NEW.processing_status <> 'invalid';
+"""
+
+CREATE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS search_courses_ai AFTER INSERT ON courses BEGIN
+        INSERT INTO search_index
+            (rowid, title, course_name, semester, body, scope, kind, course_id, ref_id)
+        VALUES (NEW.id * 2, NEW.name, NEW.name, NEW.semester, '', 'c' || NEW.id,
+                'course', NEW.id, NEW.id);
+    END""",
+    """
+    CREATE TRIGGER IF NOT EXISTS search_courses_au AFTER UPDATE OF name, semester ON courses BEGIN
+        UPDATE search_index SET title = NEW.name, course_name = NEW.name, semester = NEW.semester
+         WHERE rowid = NEW.id * 2;
+        UPDATE search_index SET course_name = NEW.name, semester = NEW.semester
+         WHERE rowid IN (SELECT id * 2 + 1 FROM course_resources WHERE course_id = NEW.id);
+    END""",
+    """
+    CREATE TRIGGER IF NOT EXISTS search_courses_ad AFTER DELETE ON courses BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 2;
+        DELETE FROM search_index
+         WHERE rowid IN (SELECT id * 2 + 1 FROM course_resources WHERE course_id = OLD.id);
+    END""",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS search_resources_ai AFTER INSERT ON course_resources BEGIN
+        {_INDEX_RESOURCE}
+    END""",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS search_resources_au
+    AFTER UPDATE OF file_name, extracted_text, processing_status, course_id ON course_resources BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 2 + 1;
+        {_INDEX_RESOURCE}
+    END""",
+    """
+    CREATE TRIGGER IF NOT EXISTS search_resources_ad AFTER DELETE ON course_resources BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 2 + 1;
+    END""",
+]
+
+
+def create_index(conn):
+    conn.execute(CREATE_INDEX)
+    for sql in CREATE_TRIGGERS:
+        conn.execute(sql)
+
+
+def rebuild(conn):
+    """Re-index every course and resource from the source tables."""
+    conn.execute("DELETE FROM search_index")
+    conn.execute("""
+        INSERT INTO search_index
+            (rowid, title, course_name, semester, body, scope, kind, course_id, ref_id)
+        SELECT id * 2, name, name, semester, '', 'c' || id, 'course', id, id FROM courses
+    """)
+    conn.execute("""
+        INSERT INTO search_index
+            (rowid, title, course_name, semester, body, scope, kind, course_id, ref_id)
+        SELECT r.id * 2 + 1, r.file_name, c.name, c.semester, COALESCE(r.extracted_text, ''),
+               'c' || r.course_id, 'resource', r.course_id, r.id
+          FROM course_resources r
+          JOIN courses c ON c.id = r.course_id
+         WHERE r.processing_status <> 'invalid'
+    """)
+    conn.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+
+
+def to_match_query(text):
+    """
+    Turn free text into an FTS5 query: every word must match, and the last
+    one may be a prefix (the word still being typed). Quoting each term means
+    user input can never be a syntax error.
+    """
+    terms = [f'"{term}"' for term in re.findall(r"\w+", text, flags=re.UNICODE)[:16]]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _highlight(snippet):
+    # Escape first, then turn the markers into <mark> (PDF text is untrusted)
+    return Markup(str(escape(snippet)).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>"))
+
+
+def search_enrolled(db, user_id, text, page=1, page_size=SEARCH_PAGE_SIZE):
+    """
+    Ranked search over the courses the student is enrolled in and their
+    resources. Returns (results, has_next); each result is a dict with kind,
+    course_id, ref_id, title, course_name, semester and an HTML snippet.
+    """
+    match = to_match_query(text)
+    course_ids = [row[0] for row in
+                  db.execute("SELECT course_id FROM enrollments WHERE user_id = ?", (user_id,))]
+    if not match or not course_ids:
+        return [], False
+    # The enrollment filter is part of the MATCH, so FTS intersects posting
+    # lists and bm25 only ranks documents from the student's own courses.
+    scope = " OR ".join(f"c{int(course_id)}" for course_id in course_ids)
+    # Resources still being processed are indexed but not shown to students yet
+    rows = db.execute(f"""
+        SELECT s.kind, s.course_id, s.ref_id, s.title, s.course_name, s.semester,
+               snippet(search_index, 3, '{_MARK_START}', '{_MARK_END}', ' … ', 16) AS snippet
+          FROM search_index s
+          LEFT JOIN course_resources r ON s.kind = 'resource' AND r.id = s.ref_id
+         WHERE search_index MATCH ?
+           AND (s.kind = 'course' OR r.processing_status = 'ready')
+      ORDER BY bm25(search_index, {_WEIGHTS})
+         LIMIT ? OFFSET ?
+    """, (f"({match}) AND scope : ({scope})", page_size + 1,
+          (page - 1) * page_size)).fetchall()
+    results = [dict(row, snippet=_highlight(row["snippet"])) for row in rows[:page_size]]
+    return results, len(rows) > page_size
+
+
+def search_course_ids(db, text):
+    """Ids of courses whose name or semester match, best match first."""
+    match = to_match_query(text)
+    if not match:
+        return []
+    return [row[0] for row in db.execute(f"""
+        SELECT course_id FROM search_index
+         WHERE search_index MATCH ? AND kind = 'course'
+      ORDER BY bm25(search_index, {_WEIGHTS})
+    """, ("{title course_name semester} : (" + match + ")",))]
@@ -0,0 +1,399 @@
+"""
+Per-semester archive files: finished semesters move out of academy.db.
+
+`archive` moves a semester's courses, enrollments, attendance (rows and
+compacted bitmaps), grades, resource metadata and the matching rollups
+into ARCHIVE_DIR/<semester>.db, so the live tables only hold current
+data. The file is written and checksummed first and only then are the
+rows deleted from the live database, in one transaction. The uploaded
+files themselves stay in UPLOAD_FOLDER: archived_resource_files keeps
+them referenced (resource_store.refcount) so they are not unlinked.
+
+Archives are read by ATTACHing the file read-only for the duration of a
+request (attached()); nothing else in the app sees archived rows.
+`restore` moves a semester back, `verify` recomputes every table's row
+count and SHA-256 checksum and compares them with those recorded at
+archive time.
+
+archive and restore invalidate the course catalog cache of --db, which
+the web workers share with the default CACHE_BACKEND=sqlite; with the
+per-process memory backend they keep listing the old courses until
+CATALOG_CACHE_TTL expires.
+
+Usage:
+    python semester_archive.py archive SEMESTER [--db academy.db] [--vacuum]
+    python semester_archive.py restore SEMESTER [--db academy.db] [--keep-file]
+    python semester_archive.py verify [SEMESTER] [--db academy.db]
+    python semester_archive.py list [--db academy.db]
+"""
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from catalog import CACHE_BACKEND, invalidate_courses, use_database
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archives")
+ARCHIVE_SCHEMA = "archive"
+
+CREATE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS semester_archives (
+        semester TEXT PRIMARY KEY,
+        file_name TEXT NOT NULL,
+        archived_at REAL NOT NULL,
+        course_count INTEGER NOT NULL,
+        enrollment_count INTEGER NOT NULL
+    )""",
+    # Uploaded files still referenced by archived resource rows
+    """
+    CREATE TABLE IF NOT EXISTS archived_resource_files (
+        file_path TEXT NOT NULL,
+        semester TEXT NOT NULL,
+        PRIMARY KEY (file_path, semester)
+    ) WITHOUT ROWID""",
+]
+
+# Bookkeeping tables inside each archive file
+_FILE_TABLES = [
+    "CREATE TABLE archive_info (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    """
+    CREATE TABLE archive_tables (
+        name TEXT PRIMARY KEY,
+        row_count INTEGER NOT NULL,
+        checksum TEXT NOT NULL  -- SHA-256 over the rows in key order
+    )""",
+    # Names as they were, for reading the archive after accounts change
+    """
+    CREATE TABLE archived_users (
+        id INTEGER PRIMARY KEY,
+        username TEXT NOT NULL,
+        actual_name TEXT,
+        role TEXT NOT NULL
+    )""",
+]
+
+_COURSE_IDS = "SELECT id FROM {schema}.courses WHERE semester = :semester"
+_ENROLLMENT_IDS = f"SELECT id FROM {{schema}}.enrollments WHERE course_id IN ({_COURSE_IDS})"
+
+# (table, key order, the semester's rows); parents before children
+TABLES = [
+    ("courses", "id", "semester = :semester"),
+    ("enrollments", "id", f"course_id IN ({_COURSE_IDS})"),
+    ("attendance", "id", f"enrollment_id IN ({_ENROLLMENT_IDS})"),
+    ("attendance_archive", "enrollment_id", f"enrollment_id IN ({_ENROLLMENT_IDS})"),
+    ("grades", "id", f"enrollment_id IN ({_ENROLLMENT_IDS})"),
+    ("course_resources", "id", f"course_id IN ({_COURSE_IDS})"),
+    ("enrollment_rollups", "enrollment_id", f"enrollment_id IN ({_ENROLLMENT_IDS})"),
+    ("course_category_rollups", "course_id, category", f"course_id IN ({_COURSE_IDS})"),
+    ("course_grade_vectors", "course_id", f"course_id IN ({_COURSE_IDS})"),
+]
+
+
+class ArchiveError(Exception):
+    """Archiving, restoring or reading an archive cannot go ahead; str() is for the user."""
+
+
+def create_tables(conn):
+    for sql in CREATE_TABLES:
+        conn.execute(sql)
+
+
+def file_name_for(semester):
+    """"2024 Spring" -> "2024-spring.db"."""
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", semester).strip("-").lower()
+    if not slug:
+        raise ArchiveError(f"Error: {semester!r} is not a usable semester name.")
+    return slug + ".db"
+
+
+def _where(where, schema):
+    return where.format(schema=schema) if where else "1"
+
+
+def table_checksum(conn, schema, table, order, where=None, params=None):
+    """(row count, SHA-256 hex) of the table's rows, optionally only those matching `where`."""
+    digest = hashlib.sha256()
+    count = 0
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    for row in cursor.execute(f"SELECT * FROM {schema}.{table} "
+                              f"WHERE {_where(where, schema)} ORDER BY {order}", params or {}):
+        digest.update(repr(row).encode())
+        digest.update(b"\n")
+        count += 1
+    return count, digest.hexdigest()
+
+
+def archived_semesters(db):
+    return db.execute("""
+        SELECT semester, file_name, archived_at, course_count, enrollment_count
+          FROM semester_archives
+      ORDER BY semester DESC
+    """).fetchall()
+
+
+def _registered(db, semester):
+    return db.execute("SELECT * FROM semester_archives WHERE semester = ?", (semester,)).fetchone()
+
+
+def _read_only_uri(path):
+    return f"file:{quote(os.path.abspath(path))}?mode=ro"
+
+
+@contextmanager
+def attached(db, semester, directory=ARCHIVE_DIR):
+    """
+    ATTACH the semester's archive read-only as schema "archive" for the
+    duration of the block. Fetch results inside the block: DETACH fails
+    while a statement on the archive is still running.
+    """
+    row = _registered(db, semester)
+    if row is None:
+        raise ArchiveError(f"Error: {semester!r} is not archived.")
+    path = os.path.join(directory, row["file_name"])
+    if not os.path.exists(path):
+        raise ArchiveError(f"Error: archive file {path} is missing.")
+    db.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (_read_only_uri(path),))
+    try:
+        yield ARCHIVE_SCHEMA
+    finally:
+        db.execute(f"DETACH DATABASE {ARCHIVE_SCHEMA}")
+
+
+# -----------------------------
+# ARCHIVE / RESTORE
+# -----------------------------
+def _write_schema(conn, path, semester):
+    """Create the archive file with the live tables' own DDL and indexes."""
+    names = [table for table, _, _ in TABLES]
+    marks = ",".join("?" * len(names))
+    ddl = conn.execute(f"""
+        SELECT sql FROM main.sqlite_master
+         WHERE type IN ('table', 'index') AND tbl_name IN ({marks}) AND sql IS NOT NULL
+      ORDER BY type DESC
+    """, names).fetchall()
+    archive = sqlite3.connect(path)
+    try:
+        for (sql,) in ddl:
+            archive.execute(sql)
+        for sql in _FILE_TABLES:
+            archive.execute(sql)
+        version = conn.execute("PRAGMA main.user_version").fetchone()[0]
+        archive.executemany("INSERT INTO archive_info (key, value) VALUES (?, ?)", [
+            ("semester", semester),
+            ("archived_at", repr(time.time())),
+            ("schema_version", str(version)),
+        ])
+        archive.execute(f"PRAGMA user_version = {int(version)}")
+        archive.commit()
+    finally:
+        archive.close()
+
+
+def archive_semester(conn, semester, directory=ARCHIVE_DIR):
+    """
+    Move `semester` into its archive file. Returns {table: rows moved}.
+    Raises ArchiveError (nothing changed) if it cannot be archived safely.
+    """
+    params = {"semester": semester}
+    if _registered(conn, semester):
+        raise ArchiveError(f"Error: {semester!r} is already archived.")
+    path = os.path.join(directory, file_name_for(semester))
+    if os.path.exists(path):
+        raise ArchiveError(f"Error: {path} exists but is not registered; move it away first.")
+    if not conn.execute("SELECT 1 FROM courses WHERE semester = ? LIMIT 1", (semester,)).fetchone():
+        raise ArchiveError(f"Error: no courses in semester {semester!r}.")
+    pending = conn.execute(f"""
+        SELECT COUNT(*) FROM course_resources
+         WHERE course_id IN ({_COURSE_IDS.format(schema='main')}) AND processing_status = 'pending'
+    """, params).fetchone()[0]
+    if pending:
+        raise ArchiveError(f"Error: {pending} resources of {semester!r} are still being processed.")
+
+    os.makedirs(directory, exist_ok=True)
+    part = path + ".part"
+    if os.path.exists(part):
+        os.remove(part)
+    _write_schema(conn, part, semester)
+
+    # 1. Copy into the new file and check it against the live rows
+    conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (part,))
+    try:
+        with conn:
+            counts = {}
+            for table, order, where in TABLES:
+                conn.execute(f"INSERT INTO {ARCHIVE_SCHEMA}.{table} SELECT * FROM main.{table} "
+                             f"WHERE {_where(where, 'main')}", params)
+                expected = table_checksum(conn, "main", table, order, where, params)
+                copied = table_checksum(conn, ARCHIVE_SCHEMA, table, order)
+                if copied != expected:
+                    raise ArchiveError(f"Error: copy of {table} does not match the live rows.")
+                conn.execute(f"INSERT INTO {ARCHIVE_SCHEMA}.archive_tables (name, row_count, checksum) "
+                             "VALUES (?, ?, ?)", (table, *copied))
+                counts[table] = copied[0]
+            conn.execute(f"""
+                INSERT INTO {ARCHIVE_SCHEMA}.archived_users (id, username, actual_name, role)
+                SELECT id, username, actual_name, role FROM main.users
+                 WHERE id IN (SELECT user_id FROM main.enrollments
+                               WHERE course_id IN ({_COURSE_IDS.format(schema='main')})
+                               UNION
+                              SELECT teacher_id FROM main.courses WHERE semester = :semester)
+            """, params)
+    except BaseException:
+        conn.execute(f"DETACH DATABASE {ARCHIVE_SCHEMA}")
+        os.remove(part)
+        raise
+    conn.execute(f"DETACH DATABASE {ARCHIVE_SCHEMA}")
+    os.replace(part, path)
+
+    # 2. Only now drop the rows from the live database (children first)
+    with conn:
+        conn.execute("""
+            INSERT INTO semester_archives
+                (semester, file_name, archived_at, course_count, enrollment_count)
+            VALUES (?, ?, ?, ?, ?)
+        """, (semester, os.path.basename(path), time.time(), counts["courses"], counts["enrollments"]))
+        conn.execute(f"""
+            INSERT OR IGNORE INTO archived_resource_files (file_path, semester)
+            SELECT DISTINCT file_path, :semester FROM course_resources
+             WHERE course_id IN ({_COURSE_IDS.format(schema='main')})
+        """, params)
+        for table, _, where in reversed(TABLES):
+            conn.execute(f"DELETE FROM main.{table} WHERE {_where(where, 'main')}", params)
+    return counts
+
+
+def verify_semester(conn, semester, directory=ARCHIVE_DIR):
+    """
+    Recompute every archived table's row count and checksum. Returns
+    (per-table results, problems); results are (table, rows, checksum, ok).
+    """
+    results, problems = [], []
+    try:
+        with attached(conn, semester, directory) as schema:
+            recorded = {row[0]: (row[1], row[2]) for row in
+                        conn.execute(f"SELECT name, row_count, checksum FROM {schema}.archive_tables")}
+            for table, order, _ in TABLES:
+                actual = table_checksum(conn, schema, table, order)
+                ok = recorded.get(table) == actual
+                results.append((table, actual[0], actual[1], ok))
+                if not ok:
+                    rows, checksum = recorded.get(table, (0, "none"))
+                    problems.append(f"{table}: {actual[0]} rows, checksum {actual[1][:12]} "
+                                    f"(recorded {rows} rows, {checksum[:12]})")
+            for table, _, _ in TABLES[:2]:
+                clash = conn.execute(f"SELECT COUNT(*) FROM main.{table} "
+                                     f"WHERE id IN (SELECT id FROM {schema}.{table})").fetchone()[0]
+                if clash:
+                    problems.append(f"{table}: {clash} archived ids also exist in the live database")
+            registry = _registered(conn, semester)
+            if (registry["course_count"], registry["enrollment_count"]) != (
+                    recorded.get("courses", (None,))[0], recorded.get("enrollments", (None,))[0]):
+                problems.append("registered course/enrollment counts differ from the archive file")
+    except (ArchiveError, sqlite3.DatabaseError) as e:
+        problems.append(str(e))
+    return results, problems
+
+
+def restore_semester(conn, semester, directory=ARCHIVE_DIR, keep_file=False):
+    """
+    Move an archived semester back into the live database and drop its
+    archive file (unless keep_file). Returns {table: rows restored}.
+    """
+    _, problems = verify_semester(conn, semester, directory)
+    if problems:
+        raise ArchiveError(f"Error: archive of {semester!r} failed verification: " + "; ".join(problems))
+    path = os.path.join(directory, _registered(conn, semester)["file_name"])
+    counts = {}
+    with attached(conn, semester, directory) as schema:
+        version = conn.execute(f"SELECT value FROM {schema}.archive_info "
+                               "WHERE key = 'schema_version'").fetchone()[0]
+        live_version = conn.execute("PRAGMA main.user_version").fetchone()[0]
+        if int(version) != live_version:
+            raise ArchiveError(f"Error: archive has schema version {version}, "
+                               f"the database {live_version}.")
+        recorded = {row[0]: (row[1], row[2]) for row in
+                    conn.execute(f"SELECT name, row_count, checksum FROM {schema}.archive_tables")}
+        with conn:
+            for table, order, where in TABLES:
+                conn.execute(f"INSERT INTO main.{table} SELECT * FROM {schema}.{table}")
+                restored = table_checksum(conn, "main", table, order, where, {"semester": semester})
+                if restored != recorded[table]:
+                    raise ArchiveError(f"Error: restored {table} does not match the archive "
+                                       "(live rows of this semester were added since?).")
+                counts[table] = restored[0]
+            conn.execute("DELETE FROM archived_resource_files WHERE semester = ?", (semester,))
+            conn.execute("DELETE FROM semester_archives WHERE semester = ?", (semester,))
+    if not keep_file:
+        os.remove(path)
+    return counts
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Move finished semesters to archive files.")
+    parser.add_argument("command", choices=("archive", "restore", "verify", "list"))
+    parser.add_argument("semester", nargs="?")
+    parser.add_argument("--db", default="academy.db")
+    parser.add_argument("--dir", default=ARCHIVE_DIR, help="archive directory")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM the database after archiving")
+    parser.add_argument("--keep-file", action="store_true", help="keep the archive file after restoring")
+    args = parser.parse_args(argv)
+    if args.command in ("archive", "restore") and not args.semester:
+        parser.error(f"{args.command} needs a SEMESTER")
+
+    from migrations import migrate  # migrations creates this module's tables
+
+    conn = sqlite3.connect(args.db)
+    conn.row_factory = sqlite3.Row
+    migrate(conn)
+    use_database(args.db)
+    status = 0
+    try:
+        if args.command == "archive":
+            counts = archive_semester(conn, args.semester, args.dir)
+            invalidate_courses()
+            print(f"Archived {args.semester!r} to {os.path.join(args.dir, file_name_for(args.semester))}: "
+                  + ", ".join(f"{count} {table}" for table, count in counts.items()))
+            if args.vacuum:
+                conn.execute("VACUUM")
+        elif args.command == "restore":
+            counts = restore_semester(conn, args.semester, args.dir, args.keep_file)
+            invalidate_courses()
+            print(f"Restored {args.semester!r}: "
+                  + ", ".join(f"{count} {table}" for table, count in counts.items()))
+        elif args.command == "verify":
+            semesters = [args.semester] if args.semester else [
+                row["semester"] for row in archived_semesters(conn)]
+            for semester in semesters:
+                results, problems = verify_semester(conn, semester, args.dir)
+                print(f"{semester}: {'OK' if not problems else 'FAILED'}")
+                for table, rows, checksum, ok in results:
+                    print(f"  {table:24} {rows:9d} rows  sha256 {checksum[:16]}  "
+                          f"{'ok' if ok else 'MISMATCH'}")
+                for problem in problems:
+                    print(f"  ! {problem}")
+                status = status or (1 if problems else 0)
+        else:
+            for row in archived_semesters(conn):
+                print(f"{row['semester']:16} {row['file_name']:20} {row['course_count']:5d} courses "
+                      f"{row['enrollment_count']:7d} enrollments  archived "
+                      f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(row['archived_at']))}")
+    except ArchiveError as e:
+        print(e)
+        status = 1
+    finally:
+        conn.close()
+    if args.command in ("archive", "restore") and status == 0 and CACHE_BACKEND != "sqlite":
+        print("Note: CACHE_BACKEND is not sqlite, so running web workers keep their cached "
+              "course list until CATALOG_CACHE_TTL expires (or restart them).")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -10,3 +10,55 @@ document.addEventListener("DOMContentLoaded", function() {
     attendanceDate.value = `${year}-${month}-${day}`;
   }
 });
+
+// Teacher resources page: poll processing status while any upload is pending
+document.addEventListener("DOMContentLoaded", function() {
+  const table = document.getElementById("resources-table");
+  if (!table) {
+    return;
+  }
+
+  function describe(r) {
+    if (r.status === "pending") {
+      if (r.job_status === "failed") {
+        return "Processing failed: " + (r.job_message || "");
+      }
+      return "Processing" + (r.progress ? " (" + r.progress + "%)" : "") + "...";
+    }
+    if (r.status === "invalid") {
+      return "Rejected: " + (r.message || "");
+    }
+    return "Ready";
+  }
+
+  function poll() {
+    fetch(table.dataset.statusUrl, { credentials: "same-origin" })
+      .then(function(response) { return response.json(); })
+      .then(function(resources) {
+        let waiting = false;
+        resources.forEach(function(r) {
+          const row = table.querySelector('tr[data-resource-id="' + r.id + '"]');
+          if (!row) {
+            return;
+          }
+          const finished = row.dataset.status === "pending" && r.status !== "pending";
+          row.dataset.status = r.status;
+          row.querySelector(".resource-status").textContent = describe(r);
+          row.querySelector(".resource-pages").textContent = r.page_count || "";
+          if (finished && r.has_thumbnail) {
+            window.location.reload();  // show the new thumbnail
+          }
+          if (r.status === "pending" && r.job_status !== "failed") {
+            waiting = true;
+          }
+        });
+        if (waiting) {
+          setTimeout(poll, 2000);
+        }
+      });
+  }
+
+  if (table.querySelector('tr[data-status="pending"]')) {
+    setTimeout(poll, 1000);
+  }
+});